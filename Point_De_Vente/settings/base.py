@@ -43,6 +43,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so it sees the queries of every other middleware too
+    'Siliana.middleware.SQLInstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -129,9 +131,53 @@ MEDIA_ROOT = BASE_DIR / 'media'
 # If True, Django will serve MEDIA files even when DEBUG=False (useful for small deployments).
 SERVE_MEDIA = (os.environ.get('SERVE_MEDIA', '') or '').strip().lower() in ('1', 'true', 'yes')
 
+# Product image disk cache shared by all gunicorn workers (empty string disables it)
+PRODUCT_IMAGE_CACHE_DIR = os.environ.get('PRODUCT_IMAGE_CACHE_DIR', str(BASE_DIR / 'image_cache'))
+PRODUCT_IMAGE_CACHE_MAX_BYTES = int(os.environ.get('PRODUCT_IMAGE_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+
 # External API access
 EXTERNAL_API_KEY = (os.environ.get('EXTERNAL_API_KEY') or '').strip()
 
+# /api/changes/ holds back rows stamped in the last CHANGE_FEED_SETTLE_SECONDS,
+# since they may belong to transactions that have not committed yet. It must
+# be longer than any transaction that writes products, orders or sales (bulk
+# status changes, order placement waiting on row locks); Siliana.changes logs
+# an error whenever a commit lands later than this.
+CHANGE_FEED_SETTLE_SECONDS = int(os.environ.get('CHANGE_FEED_SETTLE_SECONDS', 60))
+
+# Per-request SQL instrumentation (Siliana.middleware): Server-Timing header
+# and a JSON line on the Siliana.sql logger. Requests over these budgets, or
+# running one query shape SQL_REPEAT_THRESHOLD+ times (N+1), log a warning.
+# SQL_TIME_BUDGET_MS is checked against the time spent in the database, not
+# the whole request. On everywhere by default, production included, since
+# that is where N+1s need catching; the wrapper only times and counts each
+# query, so its overhead is small. SQL_INSTRUMENTATION=false turns it off.
+SQL_INSTRUMENTATION = (os.environ.get('SQL_INSTRUMENTATION', 'true') or '').strip().lower() in ('1', 'true', 'yes')
+SQL_QUERY_BUDGET = int(os.environ.get('SQL_QUERY_BUDGET', 30))
+SQL_TIME_BUDGET_MS = int(os.environ.get('SQL_TIME_BUDGET_MS', 500))
+SQL_REPEAT_THRESHOLD = int(os.environ.get('SQL_REPEAT_THRESHOLD', 5))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        # INFO logs every request; the default only logs flagged ones
+        'Siliana.sql': {
+            'handlers': ['console'],
+            'level': os.environ.get('SQL_LOG_LEVEL', 'WARNING'),
+            'propagate': False,
+        },
+        'Siliana.changes': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -143,6 +189,17 @@ LOGIN_REDIRECT_URL = 'home'
 LOGOUT_REDIRECT_URL = 'login'
 
 # Email settings
-# For testing: Emails will be printed to console
-EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
-DEFAULT_FROM_EMAIL = 'مزرعة نوادر التين <noreply@mazraat-nawadir.tn>'
+# Mail is queued in the EmailOutbox table and delivered by
+# `python manage.py send_outbox --loop`. Defaults to printing to the console;
+# set EMAIL_BACKEND=django.core.mail.backends.filebased.EmailBackend with
+# EMAIL_FILE_PATH to keep messages as files, or the SMTP backend in production.
+EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND', 'django.core.mail.backends.console.EmailBackend')
+EMAIL_FILE_PATH = os.environ.get('EMAIL_FILE_PATH', str(BASE_DIR / 'sent_emails'))
+EMAIL_HOST = os.environ.get('EMAIL_HOST', 'localhost')
+EMAIL_PORT = int(os.environ.get('EMAIL_PORT', 25))
+EMAIL_USE_TLS = os.environ.get('EMAIL_USE_TLS', '').lower() in ('1', 'true', 'yes')
+EMAIL_HOST_USER = os.environ.get('EMAIL_HOST_USER', '')
+EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD', '')
+EMAIL_TIMEOUT = int(os.environ.get('EMAIL_TIMEOUT', 30))
+DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL', 'مزرعة نوادر التين <noreply@mazraat-nawadir.tn>')
+EMAIL_OUTBOX_MAX_ATTEMPTS = int(os.environ.get('EMAIL_OUTBOX_MAX_ATTEMPTS', 8))
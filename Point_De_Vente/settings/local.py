@@ -1,3 +1,5 @@
+import os
+
 from .base import *
 
 DEBUG = True
@@ -10,3 +12,10 @@ DATABASES = {
         'NAME': BASE_DIR / 'db.sqlite3',
     }
 }
+
+# Optional local PostgreSQL server, e.g. for the reporting view tests:
+# DATABASE_URL=postgres://localhost/pepiniere python manage.py test Siliana
+if os.environ.get('DATABASE_URL'):
+    import dj_database_url
+
+    DATABASES = {'default': dj_database_url.config()}
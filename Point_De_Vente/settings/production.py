@@ -13,7 +13,12 @@ DATABASES = {
 }
 
 # Static files configuration for production (WhiteNoise)
-MIDDLEWARE.insert(1, 'whitenoise.middleware.WhiteNoiseMiddleware')
+# Right after SecurityMiddleware, as WhiteNoise requires; found by name since
+# base.py puts the SQL instrumentation first
+MIDDLEWARE.insert(
+    MIDDLEWARE.index('django.middleware.security.SecurityMiddleware') + 1,
+    'whitenoise.middleware.WhiteNoiseMiddleware',
+)
 
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 
@@ -1,9 +1,18 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 from django.contrib.admin.widgets import AdminFileWidget
 from django.db import models
+from django.db.models import DecimalField, ExpressionWrapper, F
+from django.http import HttpResponseRedirect
+from django.utils import timezone
 from django.utils.html import format_html
 from django.urls import reverse
-from .models import Produit, Achat, Vente, Order, OrderItem
+from .models import Produit, Achat, Vente, Order, OrderItem, EmailOutbox
+from .pagination import EstimatedCountPaginator
+from .stock import InsufficientStock
+
+# quantite * prix in SQL, so item totals can sort; SQLite drops trailing
+# zeros from the result, hence the :.2f where it is shown
+LINE_TOTAL = ExpressionWrapper(F('quantite') * F('prix'), output_field=DecimalField(max_digits=12, decimal_places=2))
 
 
 class SafeAdminFileWidget(AdminFileWidget):
@@ -54,7 +63,7 @@ class ProduitAdmin(admin.ModelAdmin):
             if not obj.has_image():
                 return format_html('<span style="color: #999; font-style: italic;">لا توجد صورة</span>')
 
-            url = reverse('serve_product_image', args=[obj.id])
+            url = reverse('serve_product_image_variant', args=[obj.id, obj.image_hash, 64, 'webp'])
             return format_html(
                 '<img src="{}" width="50" height="50" style="object-fit: cover; border-radius: 5px;" alt="{}" />',
                 url,
@@ -70,7 +79,7 @@ class ProduitAdmin(admin.ModelAdmin):
             if not obj.has_image():
                 return format_html('<span style="color: #999; font-style: italic;">لا توجد صورة للمعاينة</span>')
 
-            url = reverse('serve_product_image', args=[obj.id])
+            url = reverse('serve_product_image_variant', args=[obj.id, obj.image_hash, 320, 'webp'])
             return format_html(
                 '<div style="margin: 10px 0;">' 
                 '<img src="{}" style="max-width: 300px; max-height: 300px; object-fit: contain; border-radius: 5px; border: 1px solid #ddd;" alt="{} - معاينة" />'
@@ -91,19 +100,24 @@ class ProduitAdmin(admin.ModelAdmin):
 @admin.register(Achat)
 class AchatAdmin(admin.ModelAdmin):
     list_display = ('produit', 'quantite', 'date_achat')
+    list_select_related = ('produit',)
     list_filter = ('date_achat',)
     search_fields = ('produit__nom',)
 
 
 @admin.register(Vente)
 class VenteAdmin(admin.ModelAdmin):
-    list_display = ('produit', 'quantite', 'date_vente', 'get_total')
+    list_display = ('produit', 'quantite', 'prix_unitaire', 'date_vente', 'get_total')
     list_filter = ('date_vente',)
     search_fields = ('produit__nom',)
+    list_select_related = ('produit',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     
     def get_total(self, obj):
-        return f"{obj.total()} د.ت"
+        return f"{obj.montant} د.ت"
     get_total.short_description = 'الإجمالي'
+    get_total.admin_order_field = 'montant'
 
 
 class OrderItemInline(admin.TabularInline):
@@ -111,21 +125,29 @@ class OrderItemInline(admin.TabularInline):
     extra = 0
     fields = ('produit', 'quantite', 'prix', 'get_total')
     readonly_fields = ('get_total',)
+    # A plain select would list every product once per item row
+    autocomplete_fields = ('produit',)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('produit').annotate(line_total=LINE_TOTAL)
     
     def get_total(self, obj):
         if obj.id:
-            return f"{obj.total()} د.ت"
+            return f"{obj.line_total:.2f} د.ت"
         return "-"
     get_total.short_description = 'الإجمالي'
 
 
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
-    list_display = ('id', 'nom', 'telephone', 'wilaya', 'ville', 'status', 'date_commande', 'get_total')
+    list_display = ('id', 'nom', 'telephone', 'wilaya', 'ville', 'status', 'date_commande', 'nombre_articles', 'get_total')
     list_filter = ('status', 'date_commande', 'wilaya')
     search_fields = ('nom', 'telephone', 'ville')
     inlines = [OrderItemInline]
     readonly_fields = ('date_commande',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    actions = ['mark_confirmed', 'mark_completed', 'mark_cancelled']
     
     fieldsets = (
         ('معلومات العميل', {
@@ -137,8 +159,39 @@ class OrderAdmin(admin.ModelAdmin):
     )
     
     def get_total(self, obj):
-        return f"{obj.total()} د.ت"
+        return f"{obj.montant_total} د.ت"
     get_total.short_description = 'المجموع الكلي'
+    get_total.admin_order_field = 'montant_total'
+
+    def changeform_view(self, request, object_id=None, form_url='', extra_context=None):
+        try:
+            return super().changeform_view(request, object_id, form_url, extra_context)
+        except InsufficientStock as exc:
+            # Un-cancelling an order whose stock has since been sold. The
+            # view's transaction has rolled back the order and its items,
+            # so send staff back to the form instead of a server error
+            self.message_user(request, str(exc), messages.ERROR)
+            return HttpResponseRedirect(request.path)
+
+    def _set_status(self, request, queryset, status):
+        try:
+            summary = Order.bulk_set_status(queryset, status)
+        except InsufficientStock as exc:
+            self.message_user(request, str(exc), messages.ERROR)
+            return
+        self.message_user(request, Order.bulk_status_message(summary, status))
+
+    def mark_confirmed(self, request, queryset):
+        self._set_status(request, queryset, 'confirmed')
+    mark_confirmed.short_description = 'تأكيد الطلبات المحددة'
+
+    def mark_completed(self, request, queryset):
+        self._set_status(request, queryset, 'completed')
+    mark_completed.short_description = 'تحديد الطلبات المحددة كمكتملة'
+
+    def mark_cancelled(self, request, queryset):
+        self._set_status(request, queryset, 'cancelled')
+    mark_cancelled.short_description = 'إلغاء الطلبات المحددة وإرجاع المخزون'
 
 
 @admin.register(OrderItem)
@@ -146,7 +199,28 @@ class OrderItemAdmin(admin.ModelAdmin):
     list_display = ('order', 'produit', 'quantite', 'prix', 'get_total')
     list_filter = ('order__date_commande',)
     search_fields = ('order__nom', 'produit__nom')
+    list_select_related = ('order', 'produit')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(line_total=LINE_TOTAL)
     
     def get_total(self, obj):
-        return f"{obj.total()} د.ت"
+        return f"{obj.line_total:.2f} د.ت"
     get_total.short_description = 'الإجمالي'
+    get_total.admin_order_field = 'line_total'
+
+
+@admin.register(EmailOutbox)
+class EmailOutboxAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'status', 'attempts', 'next_attempt_at', 'created_at', 'sent_at')
+    list_filter = ('status',)
+    search_fields = ('subject',)
+    readonly_fields = ('attempts', 'last_error', 'created_at', 'sent_at')
+    actions = ['retry_now']
+
+    def retry_now(self, request, queryset):
+        updated = queryset.exclude(status='sent').update(status='pending', next_attempt_at=timezone.now())
+        self.message_user(request, f'تمت جدولة {updated} رسالة لإعادة الإرسال')
+    retry_now.short_description = 'إعادة المحاولة الآن'
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class SilianaConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'Siliana'
+
+    def ready(self):
+        from . import signals  # noqa: F401
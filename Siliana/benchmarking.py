@@ -0,0 +1,12 @@
+"""Timing helpers shared by the benchmark_* management commands."""
+import time
+
+
+def best_time(func, repeat):
+    """Fastest of `repeat` calls to `func`, in seconds (never zero)."""
+    timings = []
+    for _ in range(max(repeat, 1)):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return max(min(timings), 1e-9)
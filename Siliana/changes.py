@@ -0,0 +1,43 @@
+"""Timestamps for the /api/changes/ feed.
+
+updated_at (and a tombstone's deleted_at) is taken when the statement
+runs, but the row only becomes visible to the feed when its transaction
+commits. The feed holds back the last CHANGE_FEED_SETTLE_SECONDS, so that
+is how long any transaction may stay open after stamping a row: a client
+that has already polled past a stamp never sees rows committed later.
+
+now() is the stamp every writer uses. When the transaction it was taken
+in commits after the settle window, it logs an error on `Siliana.changes`
+naming the overrun, so the window can be raised before clients drift.
+"""
+import logging
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+logger = logging.getLogger('Siliana.changes')
+
+
+def settle_window():
+    return timedelta(seconds=settings.CHANGE_FEED_SETTLE_SECONDS)
+
+
+def now(using=None):
+    """timezone.now(), checked against the settle window when it commits."""
+    stamp = timezone.now()
+    transaction.on_commit(partial(_check_commit_lag, stamp), using=using)
+    return stamp
+
+
+def _check_commit_lag(stamp):
+    lag = timezone.now() - stamp
+    if lag > settle_window():
+        logger.error(
+            'Change feed rows committed %.1fs after they were stamped, over '
+            'CHANGE_FEED_SETTLE_SECONDS=%s; /api/changes/ clients may have skipped them. '
+            'Raise the setting above the longest transaction.',
+            lag.total_seconds(), settings.CHANGE_FEED_SETTLE_SECONDS,
+        )
@@ -0,0 +1,250 @@
+"""Local disk cache of product image bytes, shared by all gunicorn workers.
+
+Entries are keyed by product, content hash and variant, so a replaced image
+never serves stale bytes. Writes go to a temporary file and are renamed into
+place, so workers never see partial files. When the directory grows past
+PRODUCT_IMAGE_CACHE_MAX_BYTES the least recently used entries (by mtime,
+refreshed on every hit) are removed. Each worker adds the size of what it
+writes to the size it last scanned, and only rescans the directory once that
+goes over the bound, so the bound can be overshot by what the other workers
+wrote since their own last scan.
+
+Hit/miss counters live in the cache directory too, so every worker adds to
+the same figures: each event appends one byte to a `.stats-<name>` file
+(O_APPEND writes don't interleave) and the count is the file's size. Once
+that log reaches STATS_ROLL_BYTES it is folded into a `.total` file, so the
+logs stay small however long the cache runs. `manage.py image_cache
+--clear` resets them.
+"""
+import os
+import tempfile
+import time
+
+from django.conf import settings
+
+STATS_KEYS = ('hits', 'misses', 'evictions')
+_TMP_PREFIX = '.tmp-'
+_STATS_PREFIX = '.stats-'
+# Size at which a counter's append log is folded into its total
+STATS_ROLL_BYTES = 64 * 1024
+# A roll lock older than this was left by a crashed worker
+_ROLL_LOCK_SECONDS = 60
+
+# Directory -> bytes this process believes it holds; None until first scanned
+_tracked_bytes = {}
+
+
+class ImageCache:
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def path_for(self, key):
+        return os.path.join(self.directory, key)
+
+    def _stats_path(self, name, suffix=''):
+        return os.path.join(self.directory, _STATS_PREFIX + name + suffix)
+
+    def _count(self, name, delta=1):
+        path = self._stats_path(name)
+        flags = os.O_WRONLY | os.O_APPEND | os.O_CREAT
+        try:
+            try:
+                fd = os.open(path, flags, 0o644)
+            except FileNotFoundError:
+                # First lookup before anything was cached
+                os.makedirs(self.directory, exist_ok=True)
+                fd = os.open(path, flags, 0o644)
+        except OSError:
+            return
+        try:
+            os.write(fd, b'.' * delta)
+            size = os.fstat(fd).st_size
+        except OSError:
+            size = 0
+        finally:
+            os.close(fd)
+        if size >= STATS_ROLL_BYTES:
+            self._roll(name)
+
+    def _roll(self, name):
+        """Fold the previous log into the total and start a new log.
+
+        The log is renamed to `.rolling` rather than read right away: a
+        worker that opened it just before the rename may still append to
+        it. It is added to the total on the next roll, and counted as it
+        is until then. One worker rolls at a time; the others skip.
+        """
+        lock = self._stats_path('lock')
+        try:
+            os.close(os.open(lock, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644))
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(lock) > _ROLL_LOCK_SECONDS:
+                    os.unlink(lock)
+            except OSError:
+                pass
+            return
+        except OSError:
+            return
+        try:
+            rolling = self._stats_path(name, '.rolling')
+            self._write_total(name, self._read_total(name) + _size(rolling))
+            try:
+                os.unlink(rolling)
+            except OSError:
+                pass
+            os.replace(self._stats_path(name), rolling)
+        except OSError:
+            pass
+        finally:
+            try:
+                os.unlink(lock)
+            except OSError:
+                pass
+
+    def _read_total(self, name):
+        try:
+            with open(self._stats_path(name, '.total'), encoding='ascii') as handle:
+                return int(handle.read() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def _write_total(self, name, total):
+        fd, tmp_path = tempfile.mkstemp(prefix=_TMP_PREFIX, dir=self.directory)
+        try:
+            with os.fdopen(fd, 'w', encoding='ascii') as handle:
+                handle.write(str(total))
+            os.replace(tmp_path, self._stats_path(name, '.total'))
+        except OSError:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def _read_count(self, name):
+        return (
+            self._read_total(name)
+            + _size(self._stats_path(name, '.rolling'))
+            + _size(self._stats_path(name))
+        )
+
+    def open(self, key):
+        """Return an open binary file for `key`, or None on a miss."""
+        path = self.path_for(key)
+        try:
+            handle = open(path, 'rb')
+        except OSError:
+            self._count('misses')
+            return None
+        try:
+            os.utime(path)  # mark as recently used
+        except OSError:
+            pass
+        self._count('hits')
+        return handle
+
+    def put(self, key, data):
+        """Store `data` under `key` atomically; evict once over the size bound."""
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=_TMP_PREFIX, dir=self.directory)
+        try:
+            with os.fdopen(fd, 'wb') as handle:
+                handle.write(data)
+            os.replace(tmp_path, self.path_for(key))
+        except OSError:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            return
+        tracked = _tracked_bytes.get(self.directory)
+        if tracked is None:
+            # First write in this process: start from what is on disk
+            self.evict()
+            return
+        _tracked_bytes[self.directory] = tracked + len(data)
+        if tracked + len(data) > self.max_bytes:
+            self.evict()
+
+    def _entries(self):
+        try:
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if entry.name.startswith((_TMP_PREFIX, _STATS_PREFIX)) or not entry.is_file():
+                        continue
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    yield entry.path, stat.st_size, stat.st_mtime
+        except FileNotFoundError:
+            return
+
+    def evict(self):
+        """Remove least recently used entries until under the size bound."""
+        entries = list(self._entries())
+        total = sum(size for _path, size, _mtime in entries)
+        _tracked_bytes[self.directory] = total
+        if total <= self.max_bytes:
+            return
+        # Trim to 90% so a burst of misses doesn't rescan on every write
+        target = self.max_bytes * 0.9
+        evicted = 0
+        for path, size, _mtime in sorted(entries, key=lambda e: e[2]):
+            if total <= target:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+            total -= size
+            evicted += 1
+        _tracked_bytes[self.directory] = total
+        if evicted:
+            self._count('evictions', evicted)
+
+    def clear(self):
+        for path, _size, _mtime in self._entries():
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+        for name in STATS_KEYS:
+            for suffix in ('', '.rolling', '.total'):
+                try:
+                    os.unlink(self._stats_path(name, suffix))
+                except OSError:
+                    pass
+        _tracked_bytes[self.directory] = 0
+
+    def stats(self):
+        entries = list(self._entries())
+        data = {name: self._read_count(name) for name in STATS_KEYS}
+        data.update({
+            'files': len(entries),
+            'bytes': sum(size for _path, size, _mtime in entries),
+            'max_bytes': self.max_bytes,
+            'directory': self.directory,
+        })
+        return data
+
+
+def _size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def get_image_cache():
+    """The configured cache, or None when PRODUCT_IMAGE_CACHE_DIR is empty."""
+    directory = getattr(settings, 'PRODUCT_IMAGE_CACHE_DIR', None)
+    if not directory:
+        return None
+    return ImageCache(str(directory), settings.PRODUCT_IMAGE_CACHE_MAX_BYTES)
+
+
+def cache_key(product_id, image_hash, variant='original'):
+    return f'{product_id}-{image_hash}-{variant}'
@@ -0,0 +1,52 @@
+"""Resized, re-encoded derivatives of product images (built with Pillow)."""
+from io import BytesIO
+
+from PIL import Image, ImageOps
+
+# Widths cover the 50px admin thumbnail, the 56px order tiles (at 2x) and
+# the catalog/detail cards up to retina sizes.
+VARIANT_WIDTHS = (64, 160, 320, 640)
+
+# URL extension -> (Pillow format, content type)
+VARIANT_FORMATS = {
+    'webp': ('WEBP', 'image/webp'),
+    'jpg': ('JPEG', 'image/jpeg'),
+}
+
+VARIANT_QUALITY = 80
+
+
+def variant_content_type(fmt):
+    return VARIANT_FORMATS[fmt][1]
+
+
+def build_variants(data):
+    """Return a list of (width, fmt, bytes) for every derivative of `data`.
+
+    Images are never upscaled: a source narrower than a target width is
+    re-encoded at its own width. Raises PIL errors for unreadable input.
+    """
+    with Image.open(BytesIO(data)) as source:
+        source = ImageOps.exif_transpose(source)
+        source.load()
+
+    has_alpha = source.mode in ('RGBA', 'LA') or (source.mode == 'P' and 'transparency' in source.info)
+    rgba = source.convert('RGBA') if has_alpha else source.convert('RGB')
+    if has_alpha:
+        # JPEG has no alpha channel; flatten onto white
+        rgb = Image.new('RGB', rgba.size, (255, 255, 255))
+        rgb.paste(rgba, mask=rgba.getchannel('A'))
+    else:
+        rgb = rgba
+
+    variants = []
+    for width in VARIANT_WIDTHS:
+        target = min(width, source.width)
+        height = max(1, round(source.height * target / source.width))
+        for fmt, (pil_format, _content_type) in VARIANT_FORMATS.items():
+            base = rgba if fmt == 'webp' else rgb
+            resized = base.resize((target, height), Image.LANCZOS) if target != base.width else base
+            buffer = BytesIO()
+            resized.save(buffer, format=pil_format, quality=VARIANT_QUALITY, optimize=True)
+            variants.append((width, fmt, buffer.getvalue()))
+    return variants
@@ -0,0 +1,123 @@
+import json
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+from Siliana.benchmarking import best_time
+from Siliana.models import Order, Produit, Vente
+from Siliana.seeding import seed
+from Siliana.serializers import ORDERS, PRODUCTS, SALES, dumps, orjson
+
+
+# Model-instance serializers as they were before the values() path; kept
+# here only as the baseline the benchmark compares against. Totals are
+# recomputed from the items as the old code did, not read from the stored
+# columns the models have since gained.
+def _legacy_product(product):
+    return {
+        "id": product.id,
+        "name": product.nom,
+        "description": product.description,
+        "stock_quantity": product.quantite,
+        "purchase_price": str(product.prix_achat),
+        "selling_price": str(product.prix_vente),
+        "image_url": product.image.url if product.image else None,
+        "updated_at": product.updated_at.isoformat(),
+    }
+
+
+def _legacy_order(order):
+    items = [
+        {
+            "product_id": item.produit_id,
+            "product_name": item.produit.nom,
+            "quantity": item.quantite,
+            "price": str(item.prix),
+            "total": item.quantite * item.prix,
+        }
+        for item in order.orderitem_set.all()
+    ]
+    return {
+        "id": order.id,
+        "customer_name": order.nom,
+        "email": order.email,
+        "wilaya": order.wilaya,
+        "ville": order.ville,
+        "telephone": order.telephone,
+        "status": order.status,
+        "date_commande": order.date_commande.isoformat(),
+        "total": str(sum((item["total"] for item in items), Decimal("0"))),
+        "item_count": sum(item["quantity"] for item in items),
+        "updated_at": order.updated_at.isoformat(),
+        "items": [dict(item, total=str(item["total"])) for item in items],
+    }
+
+
+def _legacy_sale(vente):
+    return {
+        "id": vente.id,
+        "product_id": vente.produit_id,
+        "product_name": vente.produit.nom,
+        "quantity": vente.quantite,
+        "unit_price": str(vente.prix_unitaire),
+        "total": str(vente.quantite * vente.prix_unitaire),
+        "date": vente.date_vente.isoformat(),
+        "updated_at": vente.updated_at.isoformat(),
+    }
+
+
+class Command(BaseCommand):
+    help = 'Compare API serialization throughput (model instances vs values()) on seeded data'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=200)
+        parser.add_argument('--orders', type=int, default=2000)
+        parser.add_argument('--sales', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=3,
+                            help='Serializations of each resource per path; the fastest is reported')
+        parser.add_argument('--keep', action='store_true',
+                            help='Keep the seeded rows instead of rolling them back')
+        parser.add_argument('--force', action='store_true',
+                            help='Run even when DEBUG is off')
+
+    def handle(self, *args, **options):
+        if not settings.DEBUG and not options['force']:
+            raise CommandError('DEBUG is off: this looks like production. Use --force to benchmark anyway.')
+
+        with transaction.atomic():
+            counts = seed(products=options['products'], orders=options['orders'], sales=options['sales'])
+            self.stdout.write(f"Seeded {counts}")
+            self.stdout.write(f"Encoder: {'orjson' if orjson is not None else 'json'}")
+            self.stdout.write(f"{'resource':<10} {'before rows/s':>15} {'after rows/s':>15} {'speed-up':>10}")
+
+            cases = [
+                ('products', Produit.objects.all(), _legacy_product, PRODUCTS),
+                ('orders', Order.objects.prefetch_related('orderitem_set__produit'), _legacy_order, ORDERS),
+                ('sales', Vente.objects.select_related('produit'), _legacy_sale, SALES),
+            ]
+            for name, queryset, legacy, resource in cases:
+                names = tuple(resource.fields)
+
+                def before():
+                    rows = [legacy(obj) for obj in queryset.order_by('id')]
+                    return len(json.dumps(rows, cls=DjangoJSONEncoder))
+
+                def after():
+                    rows = list(resource.stream(
+                        resource.values(queryset.model.objects.all(), names).order_by('id').iterator(chunk_size=2000),
+                        names,
+                    ))
+                    return len(dumps(rows))
+
+                total = queryset.count()
+                old = total / best_time(before, options['repeat'])
+                new = total / best_time(after, options['repeat'])
+                self.stdout.write(f"{name:<10} {old:>15,.0f} {new:>15,.0f} {new / old:>9.1f}x")
+
+            if not options['keep']:
+                transaction.set_rollback(True)
+
+        self.stdout.write(self.style.SUCCESS('✓ Benchmark finished'))
@@ -0,0 +1,105 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from Siliana.benchmarking import best_time
+from Siliana.models import Order, Produit, Vente
+from Siliana.seeding import seed
+
+# The hot-path indexes added in 0017_hot_path_indexes, by model
+INDEX_SUITE = {
+    Produit: ('produit_nom_idx', 'produit_in_stock_nom_idx', 'produit_low_stock_idx'),
+    Order: ('order_status_date_idx', 'order_wilaya_date_idx'),
+    Vente: ('vente_produit_date_idx',),
+}
+
+
+def _queries():
+    """(label, callable) pairs mirroring the filters and orderings of views.py and admin.py."""
+    month_ago = timezone.now() - timedelta(days=30)
+    produit_id = Produit.objects.order_by('id').values_list('id', flat=True).first()
+    newest = ('-date_commande', '-id')
+    return [
+        ('orders by status', lambda: list(Order.objects.filter(status='pending').order_by(*newest)[:51])),
+        ('orders by wilaya', lambda: list(Order.objects.filter(wilaya='سليانة').order_by(*newest)[:51])),
+        ('wilaya choices', lambda: list(Order.objects.values_list('wilaya', flat=True).distinct().order_by('wilaya'))),
+        ('orders status+dates', lambda: list(
+            Order.objects.filter(status='confirmed', date_commande__gte=month_ago).order_by(*newest)[:51]
+        )),
+        ('sales of product', lambda: list(Vente.objects.filter(produit_id=produit_id).order_by('-date_vente', '-id')[:51])),
+        ('products by name', lambda: list(Produit.objects.order_by('nom').values_list('id', 'nom'))),
+        ('in-stock catalog', lambda: list(Produit.objects.filter(quantite__gt=0).order_by('nom').values_list('id', 'nom'))),
+        ('low stock', lambda: (Produit.objects.filter(quantite__lte=5).count(), list(Produit.objects.filter(quantite__lte=5)[:5]))),
+    ]
+
+
+class Command(BaseCommand):
+    help = 'Time the hot queries with and without the hot-path indexes on seeded data'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=2000)
+        parser.add_argument('--orders', type=int, default=200000)
+        parser.add_argument('--sales', type=int, default=1000000)
+        parser.add_argument('--days', type=int, default=365,
+                            help='Spread orders and sales over this many days (default: 365)')
+        parser.add_argument('--repeat', type=int, default=5,
+                            help='Runs of each query with and without the indexes; the fastest is reported')
+        parser.add_argument('--keep', action='store_true',
+                            help='Keep the seeded rows instead of rolling them back (the indexes are always restored)')
+        parser.add_argument('--force', action='store_true',
+                            help='Run even when DEBUG is off')
+
+    def handle(self, *args, **options):
+        if not settings.DEBUG and not options['force']:
+            raise CommandError('DEBUG is off: this looks like production. Use --force to benchmark anyway.')
+
+        with transaction.atomic():
+            started = time.perf_counter()
+            counts = seed(
+                products=options['products'], orders=options['orders'],
+                sales=options['sales'], days=options['days'], batch_size=5000,
+            )
+            self.stdout.write(f"Seeded {counts} in {time.perf_counter() - started:.0f}s")
+
+            # Used directly rather than as a context manager: SQLite's editor
+            # refuses to open inside a transaction, but plain index DDL is fine
+            editor = connection.schema_editor(atomic=False)
+            editor.deferred_sql = []
+            indexes = [
+                (model, index)
+                for model, names in INDEX_SUITE.items()
+                for index in model._meta.indexes if index.name in names
+            ]
+            queries = _queries()
+
+            for model, index in indexes:
+                editor.remove_index(model, index)
+            self._analyze()
+            before = {label: best_time(query, options['repeat']) for label, query in queries}
+
+            for model, index in indexes:
+                editor.add_index(model, index)
+            self._analyze()
+            after = {label: best_time(query, options['repeat']) for label, query in queries}
+
+            self.stdout.write(f"{'query':<22} {'before ms':>10} {'after ms':>10} {'speed-up':>10}")
+            for label, _query in queries:
+                self.stdout.write(
+                    f"{label:<22} {before[label] * 1000:>10.2f} {after[label] * 1000:>10.2f} "
+                    f"{before[label] / after[label]:>9.1f}x"
+                )
+
+            if not options['keep']:
+                transaction.set_rollback(True)
+
+        self.stdout.write(self.style.SUCCESS('✓ Benchmark finished'))
+
+    @staticmethod
+    def _analyze():
+        # Fresh statistics so the planner knows about the seeded volume
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
@@ -0,0 +1,279 @@
+import itertools
+import json
+import math
+import os
+import platform
+import secrets
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import django
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from Siliana import urls as siliana_urls
+from Siliana.images import VARIANT_FORMATS, VARIANT_WIDTHS
+from Siliana.models import Achat, Order, Produit, Vente
+
+# Routes that would end the benchmark session
+SKIP_ROUTES = {'logout'}
+EXPORT_KINDS = ('products', 'orders', 'sales')
+# Routes with post data that also render a page on GET; both are measured
+GET_AND_POST_ROUTES = {'public_order'}
+# Rows a POST case works on: the products of a public order, the orders of
+# an export or bulk status change. Capped so the form stays a realistic size.
+POST_ROWS = 50
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    return ordered[max(math.ceil(pct / 100 * len(ordered)) - 1, 0)]
+
+
+def _samples():
+    """URL argument name -> values to request it with, taken from the current data."""
+    produit = (
+        Produit.objects.exclude(image_hash__isnull=True).exclude(image_hash='').order_by('id').first()
+        or Produit.objects.order_by('id').first()
+    )
+    # Not a cancelled one, so changing its status does the full amount of work
+    order_id = Order.objects.exclude(status='cancelled').order_by('-id').values_list('id', flat=True).first()
+    samples = {
+        'kind': list(EXPORT_KINDS),
+        'width': [VARIANT_WIDTHS[0]],
+        'fmt': list(VARIANT_FORMATS),
+    }
+    if produit is not None:
+        samples['product_id'] = [produit.id]
+        if produit.image_hash:
+            samples['image_hash'] = [produit.image_hash]
+    if order_id is not None:
+        samples['order_id'] = [order_id]
+    return samples
+
+
+def _post_data():
+    """Form data for the routes that do their work on POST.
+
+    The number of rows each form covers grows with the data (up to
+    POST_ROWS), so a query per submitted row shows up as a count that
+    changes between two data sizes.
+    """
+    order_ids = [str(order_id) for order_id in Order.objects.order_by('-id').values_list('id', flat=True)[:POST_ROWS]]
+    open_order_ids = [
+        str(order_id)
+        for order_id in Order.objects.exclude(status='cancelled').order_by('-id').values_list('id', flat=True)[:POST_ROWS]
+    ]
+    in_stock = Produit.objects.filter(quantite__gte=1).order_by('id').values_list('id', flat=True)[:POST_ROWS]
+    return {
+        'export_orders': {'order_ids': order_ids},
+        # Cancelling restores stock and rollups: the heaviest transition
+        'update_order_status': {'status': 'cancelled'},
+        'bulk_update_order_status': {'order_ids': open_order_ids, 'status': 'cancelled'},
+        'public_order': {
+            'nom': 'Benchmark',
+            'wilaya': 'تونس',
+            'ville': 'تونس',
+            'telephone': '20123456',
+            # Same default as public_order's static_code verification
+            'manual_verification_code': (os.environ.get('PHONE_VERIFICATION_CODE') or '20707272').strip(),
+            **{f'product_{produit_id}': '1' for produit_id in in_stock},
+        },
+    }
+
+
+def site_cases():
+    """(label, method, path, data) for every route of Siliana.urls.
+
+    Routes whose arguments have no sample (no products yet, no product
+    image) are left out.
+    """
+    samples = _samples()
+    post_data = _post_data()
+    cases = []
+    seen = set()
+    for pattern in siliana_urls.urlpatterns:
+        name = pattern.name
+        if name in SKIP_ROUTES:
+            continue
+        params = list(pattern.pattern.converters)
+        if any(param not in samples for param in params):
+            continue
+        # A second pattern with the same name is told apart by its last argument
+        base = f'{name}:{params[-1]}' if name in seen else name
+        seen.add(name)
+        for values in itertools.product(*(samples[param] for param in params)):
+            kwargs = dict(zip(params, values))
+            path = reverse(name, kwargs=kwargs)
+            # Arguments with several samples tell the cases of one route apart
+            label = ':'.join([base, *(str(value) for param, value in kwargs.items() if len(samples[param]) > 1)])
+            if name in GET_AND_POST_ROUTES:
+                cases.append((label, 'get', path, None))
+                cases.append((f'{label}:post', 'post', path, post_data[name]))
+            elif name in post_data:
+                cases.append((label, 'post', path, post_data[name]))
+            else:
+                cases.append((label, 'get', path, None))
+    return cases
+
+
+@contextmanager
+def rolled_back(method):
+    """Undo what a POST wrote, so every repeat does the same work."""
+    if method != 'post':
+        yield
+        return
+    with transaction.atomic():
+        yield
+        transaction.set_rollback(True)
+
+
+def admin_cases():
+    """(label, method, path, data) for every registered ModelAdmin changelist."""
+    cases = []
+    for model in admin.site._registry:
+        opts = model._meta
+        path = reverse(f'admin:{opts.app_label}_{opts.model_name}_changelist')
+        cases.append((f'admin:{opts.app_label}.{opts.model_name}', 'get', path, None))
+    return cases
+
+
+class Command(BaseCommand):
+    help = ('Request every site route and admin changelist against the current data and '
+            'write p50/p95 latency, query count and peak memory per URL to a JSON file')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=10,
+                            help='Timed requests per URL, after one warm-up (default: 10)')
+        parser.add_argument('--output', default='benchmark_urls.json',
+                            help='Where to write the results (default: benchmark_urls.json)')
+        parser.add_argument('--label', default='',
+                            help='Stored with the results, e.g. the commit being measured')
+        parser.add_argument('--compare', metavar='FILE',
+                            help='Earlier results to print the p95 and query changes against')
+        parser.add_argument('--only', metavar='TEXT',
+                            help='Only URLs whose label contains TEXT')
+        parser.add_argument('--force', action='store_true',
+                            help='Run even when DEBUG is off')
+
+    def handle(self, *args, **options):
+        if not settings.DEBUG and not options['force']:
+            raise CommandError('DEBUG is off: this looks like production. Use --force to benchmark anyway.')
+
+        repeat = max(options['repeat'], 1)
+        # The test client talks to 'testserver'; the API needs a key. Both are
+        # set for this run only, and the user and sessions are rolled back.
+        with transaction.atomic(), override_settings(
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+            EXTERNAL_API_KEY=secrets.token_hex(16),
+        ):
+            user = get_user_model().objects.create_superuser(
+                username=f'benchmark-{secrets.token_hex(4)}', password=None,
+            )
+            client = Client(raise_request_exception=False)
+            client.force_login(user)
+            headers = {'X-API-Key': settings.EXTERNAL_API_KEY}
+
+            cases = site_cases() + admin_cases()
+            if options['only']:
+                cases = [case for case in cases if options['only'] in case[0]]
+            results = [self._measure(client, headers, repeat, *case) for case in cases]
+            scale = {
+                'products': Produit.objects.count(),
+                'orders': Order.objects.count(),
+                'sales': Vente.objects.count(),
+                'purchases': Achat.objects.count(),
+            }
+            transaction.set_rollback(True)
+
+        report = {
+            'label': options['label'],
+            'created_at': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'repeat': repeat,
+            'scale': scale,
+            'results': results,
+        }
+        with open(options['output'], 'w', encoding='utf-8') as handle:
+            json.dump(report, handle, ensure_ascii=False, indent=2)
+
+        previous = self._load(options['compare']) if options['compare'] else {}
+        self._print(results, previous)
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ {len(results)} URLs measured, results written to {options['output']}"
+        ))
+
+    @staticmethod
+    def _request(client, headers, method, path, data):
+        response = getattr(client, method)(path, data=data, headers=headers)
+        if response.streaming:
+            # Streaming views query while the body is produced
+            b''.join(response.streaming_content)
+        else:
+            response.content
+        return response
+
+    def _measure(self, client, headers, repeat, label, method, path, data):
+        with rolled_back(method):
+            self._request(client, headers, method, path, data)  # warm-up: caches, first-time imports
+
+        timings = []
+        queries = []
+        for _ in range(repeat):
+            with rolled_back(method), CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                response = self._request(client, headers, method, path, data)
+                timings.append((time.perf_counter() - start) * 1000)
+            queries.append(len(captured))
+
+        # Separate run: tracemalloc slows everything down too much to time
+        tracemalloc.start()
+        try:
+            with rolled_back(method):
+                self._request(client, headers, method, path, data)
+            _current, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        return {
+            'name': label,
+            'method': method.upper(),
+            'path': path,
+            'status': response.status_code,
+            'p50_ms': round(percentile(timings, 50), 2),
+            'p95_ms': round(percentile(timings, 95), 2),
+            'queries': max(queries),
+            'peak_kb': round(peak / 1024, 1),
+        }
+
+    @staticmethod
+    def _load(path):
+        with open(path, encoding='utf-8') as handle:
+            return {row['name']: row for row in json.load(handle)['results']}
+
+    def _print(self, results, previous):
+        width = max([len(row['name']) for row in results] + [4])
+        self.stdout.write(
+            f"{'name':<{width}} {'status':>6} {'p50 ms':>9} {'p95 ms':>9} {'queries':>8} {'peak KB':>9}"
+            + (f" {'Δ p95':>8} {'Δ queries':>10}" if previous else '')
+        )
+        for row in results:
+            line = (
+                f"{row['name']:<{width}} {row['status']:>6} {row['p50_ms']:>9.2f} {row['p95_ms']:>9.2f} "
+                f"{row['queries']:>8} {row['peak_kb']:>9.1f}"
+            )
+            before = previous.get(row['name'])
+            if before:
+                line += f" {row['p95_ms'] - before['p95_ms']:>+8.2f} {row['queries'] - before['queries']:>+10}"
+            self.stdout.write(line)
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from Siliana.models import ProduitImage, ProduitImageVariant
+
+
+class Command(BaseCommand):
+    help = 'Generate resized WebP/JPEG derivatives for product images'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--missing-only', action='store_true',
+                            help='Skip products that already have derivatives')
+
+    def handle(self, *args, **options):
+        images = ProduitImage.objects.select_related('produit').order_by('produit_id')
+        if options['missing_only']:
+            images = images.exclude(produit__image_variants__isnull=False)
+
+        count = 0
+        for image in images.iterator(chunk_size=20):
+            ProduitImageVariant.regenerate(image.produit, bytes(image.data))
+            generated = ProduitImageVariant.objects.filter(produit_id=image.produit_id).count()
+            if generated:
+                count += 1
+                self.stdout.write(self.style.SUCCESS(f'✓ {image.produit.nom}: {generated} variants'))
+            else:
+                self.stdout.write(self.style.WARNING(f'⚠ {image.produit.nom}: unreadable image, skipped'))
+
+        self.stdout.write(self.style.SUCCESS(f'\n✓ Generated variants for {count} products'))
@@ -0,0 +1,27 @@
+import json
+
+from django.core.management.base import BaseCommand
+from Siliana.image_cache import get_image_cache
+
+
+class Command(BaseCommand):
+    help = 'Show hit/miss statistics for the product image disk cache, or clear it'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clear', action='store_true', help='Delete every cached image and reset counters')
+
+    def handle(self, *args, **options):
+        image_cache = get_image_cache()
+        if image_cache is None:
+            self.stdout.write(self.style.WARNING('Image cache disabled (PRODUCT_IMAGE_CACHE_DIR is empty)'))
+            return
+
+        if options['clear']:
+            image_cache.clear()
+            self.stdout.write(self.style.SUCCESS(f'✓ Cleared {image_cache.directory}'))
+            return
+
+        stats = image_cache.stats()
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = round(stats['hits'] / lookups, 3) if lookups else None
+        self.stdout.write(json.dumps(stats, indent=2))
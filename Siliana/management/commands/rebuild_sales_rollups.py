@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from Siliana.rollups import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Recompute the daily sales/finance rollups from sales, purchases and orders'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='start', help='First day to rebuild (YYYY-MM-DD)')
+        parser.add_argument('--to', dest='end', help='Last day to rebuild (YYYY-MM-DD)')
+
+    def handle(self, *args, **options):
+        bounds = []
+        for name in ('start', 'end'):
+            value = options[name]
+            day = parse_date(value) if value else None
+            if value and day is None:
+                raise CommandError(f'Invalid date: {value}')
+            bounds.append(day)
+        rows = rebuild(*bounds)
+        self.stdout.write(self.style.SUCCESS(f'✓ Rebuilt {rows} rollup rows'))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from Siliana.models import Order
+
+
+class Command(BaseCommand):
+    help = 'Recalculate the stored total and item count of every order from its items'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--order-id', type=int, action='append', dest='order_ids',
+                            help='Only recompute this order (can be repeated)')
+
+    def handle(self, *args, **options):
+        orders = Order.objects.all()
+        if options['order_ids']:
+            orders = orders.filter(id__in=options['order_ids'])
+
+        updated = Order.recompute_totals(orders)
+        self.stdout.write(self.style.SUCCESS(f'✓ Recomputed totals for {updated} orders'))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from Siliana.reporting import MATERIALIZED_VIEWS, refresh_materialized_views
+
+
+class Command(BaseCommand):
+    help = 'Refresh the materialized reporting views (mv_*) used by the external system'
+
+    def add_arguments(self, parser):
+        parser.add_argument('views', nargs='*', help='Views to refresh (default: all)')
+        parser.add_argument('--no-concurrently', dest='concurrently', action='store_false',
+                            help='Lock the views while refreshing (faster, blocks readers)')
+
+    def handle(self, *args, **options):
+        unknown = set(options['views']) - set(MATERIALIZED_VIEWS)
+        if unknown:
+            raise CommandError(f"Unknown materialized views: {', '.join(sorted(unknown))}")
+        if connection.vendor != 'postgresql':
+            self.stdout.write(self.style.WARNING('Materialized views only exist on PostgreSQL; nothing to refresh'))
+            return
+        refreshed = refresh_materialized_views(options['views'], concurrently=options['concurrently'])
+        self.stdout.write(self.style.SUCCESS(f"✓ Refreshed {', '.join(refreshed)}"))
@@ -0,0 +1,48 @@
+import random
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from Siliana.seeding import seed
+
+
+class Command(BaseCommand):
+    help = 'Fill the database with realistic generated products, orders, sales and purchases'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=2000)
+        parser.add_argument('--orders', type=int, default=200000)
+        parser.add_argument('--items-per-order', type=int, default=3)
+        parser.add_argument('--sales', type=int, default=300000)
+        parser.add_argument('--purchases', type=int, default=50000)
+        parser.add_argument('--days', type=int, default=365,
+                            help='Spread the rows over this many days ending today (default: 365)')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Random seed; the same seed and sizes give the same data')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--force', action='store_true',
+                            help='Run even when DEBUG is off')
+
+    def handle(self, *args, **options):
+        if not settings.DEBUG and not options['force']:
+            raise CommandError('DEBUG is off: this looks like production. Use --force to seed anyway.')
+
+        started = time.perf_counter()
+        with transaction.atomic():
+            counts = seed(
+                products=options['products'],
+                orders=options['orders'],
+                items_per_order=options['items_per_order'],
+                sales=options['sales'],
+                purchases=options['purchases'],
+                days=options['days'],
+                batch_size=options['batch_size'],
+                rng=random.Random(options['seed']),
+            )
+
+        summary = ', '.join(f'{count} {name}' for name, count in counts.items())
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Seeded {summary} in {time.perf_counter() - started:.0f}s'
+        ))
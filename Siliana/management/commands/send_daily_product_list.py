@@ -1,7 +1,6 @@
 from django.core.management.base import BaseCommand
-from django.core.mail import send_mail
-from django.conf import settings
 from Siliana.models import Produit
+from Siliana.outbox import drain_outbox, queue_mail
 from datetime import datetime
 
 
@@ -34,18 +33,17 @@ class Command(BaseCommand):
             message += f"\nTotal Products: {produits.count()}\n"
             message += f"Total Quantity: {sum(p.quantite for p in produits)}\n"
             
-            # Send email
-            send_mail(
-                subject=subject,
-                message=message,
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=['kharroubi.naoufel@gmail.com'],
-                fail_silently=False,
-            )
-            
-            self.stdout.write(self.style.SUCCESS(
-                f'Successfully sent product list to kharroubi.naoufel@gmail.com'
-            ))
+            # Queue, then deliver everything due over one connection
+            queue_mail(subject, message, ['kharroubi.naoufel@gmail.com'])
+            sent, failed = drain_outbox()
+            if failed:
+                self.stdout.write(self.style.WARNING(
+                    f'{failed} queued emails failed; they will be retried by send_outbox'
+                ))
+            else:
+                self.stdout.write(self.style.SUCCESS(
+                    'Successfully sent product list to kharroubi.naoufel@gmail.com'
+                ))
             
         except Exception as e:
             self.stdout.write(self.style.ERROR(f'Error sending email: {str(e)}'))
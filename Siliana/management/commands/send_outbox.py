@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from Siliana.outbox import drain_outbox
+
+
+class Command(BaseCommand):
+    help = 'Deliver queued emails from the outbox over one reused mail connection'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50,
+                            help='Messages claimed per batch (default: 50)')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep running, polling the outbox every --interval seconds')
+        parser.add_argument('--interval', type=float, default=10,
+                            help='Seconds between polls in --loop mode (default: 10)')
+
+    def handle(self, *args, **options):
+        while True:
+            sent, failed = drain_outbox(batch_size=options['batch_size'])
+            if sent or failed or not options['loop']:
+                self.stdout.write(self.style.SUCCESS(f'✓ Sent {sent} emails, {failed} failed'))
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,133 @@
+"""Per-request SQL instrumentation.
+
+SQLInstrumentationMiddleware wraps every database connection for the
+length of a request and records how many queries ran, how long they took
+and how often each query *shape* (the SQL with literals and parameters
+replaced by `?`) repeated. Each response gets a Server-Timing header, so
+the numbers show up in the browser's network panel, and one JSON log
+line on the `Siliana.sql` logger.
+
+A request is flagged (logged at WARNING, with the repeated shapes) when
+it goes over SQL_QUERY_BUDGET queries or spends more than
+SQL_TIME_BUDGET_MS in the database, or when one shape runs
+SQL_REPEAT_THRESHOLD times or more, the usual sign of an N+1 loop such as
+calling order.total() per row.
+
+It is on by default, production included. The per-query cost is a
+timer and a dict increment keyed by the SQL text (ORM queries keep their
+parameters out of it); literals are only normalized into shapes once per
+distinct statement, when the request ends. SQL_INSTRUMENTATION=false
+turns it off.
+
+Streaming responses are measured up to the moment their headers are
+returned; queries run while the body streams are not counted.
+"""
+import json
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger('Siliana.sql')
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w\"])-?\d+(?:\.\d+)?\b")
+_PLACEHOLDER = re.compile(r"%s|%\(\w+\)s")
+_VALUE_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_SPACE = re.compile(r"\s+")
+
+
+def query_shape(sql):
+    """`sql` with literals and parameters replaced, so repeats compare equal."""
+    shape = _STRING_LITERAL.sub('?', sql)
+    shape = _PLACEHOLDER.sub('?', shape)
+    shape = _NUMBER.sub('?', shape)
+    shape = _VALUE_LIST.sub('(...)', shape)
+    return _SPACE.sub(' ', shape).strip()
+
+
+class QueryStats:
+    """execute_wrapper that counts and times queries, grouped by shape."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            self.statements[sql] += 1
+
+    @property
+    def shapes(self):
+        """Statement counts merged by shape."""
+        shapes = Counter()
+        for sql, count in self.statements.items():
+            shapes[query_shape(sql)] += count
+        return shapes
+
+    def repeated(self, threshold):
+        """[(shape, count)] for shapes that ran at least `threshold` times, most first."""
+        return [(shape, count) for shape, count in self.shapes.most_common() if count >= threshold]
+
+
+class SQLInstrumentationMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not getattr(settings, 'SQL_INSTRUMENTATION', True):
+            return self.get_response(request)
+
+        stats = QueryStats()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all(initialized_only=False):
+                stack.enter_context(connection.execute_wrapper(stats))
+            response = self.get_response(request)
+        total_ms = (time.perf_counter() - start) * 1000
+        db_ms = stats.duration * 1000
+
+        response['Server-Timing'] = (
+            f'db;dur={db_ms:.1f};desc="{stats.count} queries", total;dur={total_ms:.1f}'
+        )
+        self._log(request, response, stats, db_ms, total_ms)
+        return response
+
+    def _log(self, request, response, stats, db_ms, total_ms):
+        reasons = []
+        if stats.count > getattr(settings, 'SQL_QUERY_BUDGET', 30):
+            reasons.append('queries')
+        if db_ms > getattr(settings, 'SQL_TIME_BUDGET_MS', 500):
+            reasons.append('db_time')
+        repeated = stats.repeated(getattr(settings, 'SQL_REPEAT_THRESHOLD', 5))
+        if repeated:
+            reasons.append('repeated_query')
+
+        level = logging.WARNING if reasons else logging.INFO
+        if not logger.isEnabledFor(level):
+            return
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'queries': stats.count,
+            'db_ms': round(db_ms, 1),
+            'total_ms': round(total_ms, 1),
+        }
+        if reasons:
+            record['flagged'] = reasons
+            # The most repeated shapes point at the loop that needs fixing
+            record['repeated'] = [
+                {'count': count, 'sql': shape} for shape, count in stats.repeated(2)[:3]
+            ]
+        logger.log(level, json.dumps(record, ensure_ascii=False))
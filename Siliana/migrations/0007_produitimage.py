@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def move_image_bytes(apps, schema_editor):
+    Produit = apps.get_model('Siliana', 'Produit')
+    ProduitImage = apps.get_model('Siliana', 'ProduitImage')
+    for produit in Produit.objects.only('id', 'image_data', 'image_type').iterator(chunk_size=50):
+        if produit.image_data:
+            ProduitImage.objects.create(produit_id=produit.id, data=produit.image_data)
+            if not produit.image_type:
+                Produit.objects.filter(id=produit.id).update(image_type='image/jpeg')
+        elif produit.image_type:
+            # has_image() now relies on image_type, so clear stale metadata
+            Produit.objects.filter(id=produit.id).update(image_type=None)
+
+
+def restore_image_bytes(apps, schema_editor):
+    Produit = apps.get_model('Siliana', 'Produit')
+    ProduitImage = apps.get_model('Siliana', 'ProduitImage')
+    for image in ProduitImage.objects.iterator(chunk_size=50):
+        Produit.objects.filter(id=image.produit_id).update(image_data=image.data)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Siliana', '0006_add_image_binary_fields'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProduitImage',
+            fields=[
+                ('produit', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='image_blob', serialize=False, to='Siliana.produit')),
+                ('data', models.BinaryField(verbose_name='بيانات الصورة')),
+            ],
+        ),
+        migrations.RunPython(move_image_bytes, restore_image_bytes),
+        migrations.RemoveField(
+            model_name='produit',
+            name='image_data',
+        ),
+        migrations.AlterField(
+            model_name='produit',
+            name='image',
+            field=models.ImageField(blank=True, null=True, upload_to='products/', verbose_name='صورة المنتج (تحميل)'),
+        ),
+    ]
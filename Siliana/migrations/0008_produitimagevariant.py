@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Siliana', '0007_produitimage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProduitImageVariant',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('width', models.PositiveIntegerField(verbose_name='العرض')),
+                ('format', models.CharField(max_length=10, verbose_name='الصيغة')),
+                ('data', models.BinaryField(verbose_name='بيانات الصورة')),
+                ('produit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='image_variants', to='Siliana.produit')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('produit', 'width', 'format'), name='unique_produit_image_variant')],
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:56
+
+import hashlib
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def backfill_image_hashes(apps, schema_editor):
+    Produit = apps.get_model('Siliana', 'Produit')
+    ProduitImage = apps.get_model('Siliana', 'ProduitImage')
+    now = timezone.now()
+    for image in ProduitImage.objects.iterator(chunk_size=50):
+        Produit.objects.filter(id=image.produit_id).update(
+            image_hash=hashlib.sha256(bytes(image.data)).hexdigest(),
+            image_updated_at=now,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Siliana', '0008_produitimagevariant'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='produit',
+            name='image_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True, verbose_name='بصمة الصورة'),
+        ),
+        migrations.AddField(
+            model_name='produit',
+            name='image_updated_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='تاريخ تحديث الصورة'),
+        ),
+        migrations.RunPython(backfill_image_hashes, migrations.RunPython.noop),
+    ]
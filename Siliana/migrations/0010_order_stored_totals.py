@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:59
+
+from django.db import migrations, models
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_order_totals(apps, schema_editor):
+    Order = apps.get_model('Siliana', 'Order')
+    OrderItem = apps.get_model('Siliana', 'OrderItem')
+    items = OrderItem.objects.filter(order=OuterRef('pk')).values('order')
+    Order.objects.update(
+        montant_total=Coalesce(
+            Subquery(items.annotate(s=Sum(F('quantite') * F('prix'))).values('s')),
+            Value(0),
+            output_field=DecimalField(max_digits=12, decimal_places=2),
+        ),
+        nombre_articles=Coalesce(Subquery(items.annotate(s=Sum('quantite')).values('s')), Value(0)),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Siliana', '0009_produit_image_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='montant_total',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12, verbose_name='المجموع الكلي'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='nombre_articles',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='عدد القطع'),
+        ),
+        migrations.RunPython(backfill_order_totals, migrations.RunPython.noop),
+    ]
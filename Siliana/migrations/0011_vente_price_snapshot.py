@@ -0,0 +1,47 @@
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery
+
+
+def backfill_sale_prices(apps, schema_editor):
+    Vente = apps.get_model('Siliana', 'Vente')
+    Produit = apps.get_model('Siliana', 'Produit')
+    # Best available price for historical sales is the current product price
+    Vente.objects.update(
+        prix_unitaire=Subquery(Produit.objects.filter(pk=OuterRef('produit_id')).values('prix_vente')[:1])
+    )
+    Vente.objects.update(montant=F('quantite') * F('prix_unitaire'))
+
+
+class Migration(migrations.Migration):
+    # PostgreSQL refuses to ALTER a table with pending FK trigger events, which
+    # the backfill UPDATEs leave behind inside a single transaction. Run each
+    # operation on its own; the backfill is one transaction and safe to repeat.
+    atomic = False
+
+    dependencies = [
+        ('Siliana', '0010_order_stored_totals'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vente',
+            name='prix_unitaire',
+            field=models.DecimalField(decimal_places=2, editable=False, max_digits=10, null=True, verbose_name='سعر الوحدة'),
+        ),
+        migrations.AddField(
+            model_name='vente',
+            name='montant',
+            field=models.DecimalField(decimal_places=2, editable=False, max_digits=12, null=True, verbose_name='الإجمالي'),
+        ),
+        migrations.RunPython(backfill_sale_prices, migrations.RunPython.noop, atomic=True),
+        migrations.AlterField(
+            model_name='vente',
+            name='prix_unitaire',
+            field=models.DecimalField(decimal_places=2, editable=False, max_digits=10, verbose_name='سعر الوحدة'),
+        ),
+        migrations.AlterField(
+            model_name='vente',
+            name='montant',
+            field=models.DecimalField(decimal_places=2, editable=False, max_digits=12, verbose_name='الإجمالي'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:07
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Siliana', '0011_vente_price_snapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmailOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('subject', models.CharField(max_length=255, verbose_name='الموضوع')),
+                ('body', models.TextField(verbose_name='النص')),
+                ('from_email', models.CharField(max_length=255, verbose_name='المرسل')),
+                ('recipients', models.JSONField(default=list, verbose_name='المستلمون')),
+                ('status', models.CharField(choices=[('pending', 'في الانتظار'), ('sent', 'تم الإرسال'), ('failed', 'فشل')], default='pending', max_length=20, verbose_name='الحالة')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='عدد المحاولات')),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='المحاولة القادمة')),
+                ('last_error', models.TextField(blank=True, default='', verbose_name='آخر خطأ')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='تاريخ الإنشاء')),
+                ('sent_at', models.DateTimeField(blank=True, null=True, verbose_name='تاريخ الإرسال')),
+            ],
+            options={
+                'verbose_name': 'رسالة صادرة',
+                'verbose_name_plural': 'الرسائل الصادرة',
+                'indexes': [models.Index(fields=['status', 'next_attempt_at'], name='email_outbox_due_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Siliana', '0012_email_outbox'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['date_commande', 'id'], name='order_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='vente',
+            index=models.Index(fields=['date_vente', 'id'], name='vente_date_id_idx'),
+        ),
+    ]
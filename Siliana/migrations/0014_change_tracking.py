@@ -0,0 +1,62 @@
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_order_timestamps(apps, schema_editor):
+    Order = apps.get_model('Siliana', 'Order')
+    # Best known modification time for existing orders is their creation
+    Order.objects.update(updated_at=F('date_commande'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Siliana', '0013_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='produit',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, verbose_name='آخر تعديل'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, verbose_name='آخر تعديل'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='vente',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, verbose_name='آخر تعديل'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(backfill_order_timestamps, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name='Tombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(choices=[('product', 'منتج'), ('order', 'طلب'), ('sale', 'بيع')], max_length=20, verbose_name='النوع')),
+                ('object_id', models.BigIntegerField(verbose_name='المعرف')),
+                ('deleted_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='تاريخ الحذف')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['deleted_at', 'id'], name='tombstone_deleted_idx')],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='produit',
+            index=models.Index(fields=['updated_at', 'id'], name='produit_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['updated_at', 'id'], name='order_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='vente',
+            index=models.Index(fields=['updated_at', 'id'], name='vente_updated_idx'),
+        ),
+    ]
@@ -0,0 +1,140 @@
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, DecimalField, F, OuterRef, Subquery, Sum
+from django.db.models.functions import TruncDate
+
+ROLLUP_FIELDS = (
+    'sales_count', 'quantity', 'revenue', 'cost',
+    'purchase_quantity', 'purchase_cost',
+    'order_quantity', 'order_revenue',
+)
+
+
+def backfill_costs(apps, schema_editor):
+    Produit = apps.get_model('Siliana', 'Produit')
+    Vente = apps.get_model('Siliana', 'Vente')
+    Achat = apps.get_model('Siliana', 'Achat')
+    # Best available cost for historical rows is the current purchase price
+    prix_achat = Subquery(Produit.objects.filter(pk=OuterRef('produit_id')).values('prix_achat')[:1])
+    Vente.objects.update(cout_unitaire=prix_achat)
+    Achat.objects.update(prix_unitaire=prix_achat)
+    Achat.objects.update(montant=F('quantite') * F('prix_unitaire'))
+
+
+def build_rollups(apps, schema_editor):
+    # A frozen copy of Siliana.rollups.rebuild() as it was when this
+    # migration was written, so later changes to it do not change history.
+    DailySalesRollup = apps.get_model('Siliana', 'DailySalesRollup')
+    Vente = apps.get_model('Siliana', 'Vente')
+    Achat = apps.get_model('Siliana', 'Achat')
+    OrderItem = apps.get_model('Siliana', 'OrderItem')
+    money = DecimalField(max_digits=14, decimal_places=2)
+    totals = {}
+
+    def add(day, produit_id, **values):
+        row = totals.setdefault((day, produit_id), dict.fromkeys(ROLLUP_FIELDS, 0))
+        for name, value in values.items():
+            row[name] += value or 0
+
+    sales = Vente.objects.order_by().values('date_vente', 'produit_id').annotate(
+        n=Count('id'), q=Sum('quantite'), r=Sum('montant'),
+        c=Sum(F('quantite') * F('cout_unitaire'), output_field=money),
+    )
+    for row in sales:
+        add(row['date_vente'], row['produit_id'], sales_count=row['n'], quantity=row['q'], revenue=row['r'], cost=row['c'])
+
+    purchases = Achat.objects.order_by().values('date_achat', 'produit_id').annotate(q=Sum('quantite'), c=Sum('montant'))
+    for row in purchases:
+        add(row['date_achat'], row['produit_id'], purchase_quantity=row['q'], purchase_cost=row['c'])
+
+    demand = (
+        OrderItem.objects.order_by().exclude(order__status='cancelled')
+        .annotate(day=TruncDate('order__date_commande'))
+        .values('day', 'produit_id')
+        .annotate(q=Sum('quantite'), r=Sum(F('quantite') * F('prix'), output_field=money))
+    )
+    for row in demand:
+        add(row['day'], row['produit_id'], order_quantity=row['q'], order_revenue=row['r'])
+
+    DailySalesRollup.objects.bulk_create(
+        [
+            DailySalesRollup(
+                day=day, produit_id=produit_id,
+                **{
+                    name: Decimal(str(value)).quantize(Decimal('0.01')) if isinstance(value, (Decimal, float)) else value
+                    for name, value in values.items()
+                },
+            )
+            for (day, produit_id), values in totals.items()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+    # On PostgreSQL the backfill UPDATEs leave deferred trigger events that
+    # block the NOT NULL AlterFields in the same transaction, so each
+    # operation commits on its own; the data steps stay atomic.
+    atomic = False
+
+    dependencies = [
+        ('Siliana', '0014_change_tracking'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vente',
+            name='cout_unitaire',
+            field=models.DecimalField(decimal_places=2, editable=False, max_digits=10, null=True, verbose_name='تكلفة الوحدة'),
+        ),
+        migrations.AddField(
+            model_name='achat',
+            name='prix_unitaire',
+            field=models.DecimalField(decimal_places=2, editable=False, max_digits=10, null=True, verbose_name='سعر الوحدة'),
+        ),
+        migrations.AddField(
+            model_name='achat',
+            name='montant',
+            field=models.DecimalField(decimal_places=2, editable=False, max_digits=12, null=True, verbose_name='الإجمالي'),
+        ),
+        migrations.RunPython(backfill_costs, migrations.RunPython.noop, atomic=True),
+        migrations.AlterField(
+            model_name='vente',
+            name='cout_unitaire',
+            field=models.DecimalField(decimal_places=2, editable=False, max_digits=10, verbose_name='تكلفة الوحدة'),
+        ),
+        migrations.AlterField(
+            model_name='achat',
+            name='prix_unitaire',
+            field=models.DecimalField(decimal_places=2, editable=False, max_digits=10, verbose_name='سعر الوحدة'),
+        ),
+        migrations.AlterField(
+            model_name='achat',
+            name='montant',
+            field=models.DecimalField(decimal_places=2, editable=False, max_digits=12, verbose_name='الإجمالي'),
+        ),
+        migrations.CreateModel(
+            name='DailySalesRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='اليوم')),
+                ('sales_count', models.IntegerField(default=0, verbose_name='عدد المبيعات')),
+                ('quantity', models.IntegerField(default=0, verbose_name='الكمية المباعة')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='المداخيل')),
+                ('cost', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='التكلفة')),
+                ('profit', models.GeneratedField(db_persist=True, expression=F('revenue') - F('cost'), output_field=models.DecimalField(decimal_places=2, max_digits=14), verbose_name='الربح')),
+                ('purchase_quantity', models.IntegerField(default=0, verbose_name='الكمية المشتراة')),
+                ('purchase_cost', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='قيمة المشتريات')),
+                ('order_quantity', models.IntegerField(default=0, verbose_name='الكمية المطلوبة')),
+                ('order_revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='قيمة الطلبات')),
+                ('produit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_rollups', to='Siliana.produit')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['day'], name='daily_rollup_day_idx')],
+                'constraints': [models.UniqueConstraint(fields=('day', 'produit'), name='unique_daily_rollup')],
+            },
+        ),
+        migrations.RunPython(build_rollups, migrations.RunPython.noop, atomic=True),
+    ]
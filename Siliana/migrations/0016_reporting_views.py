@@ -0,0 +1,213 @@
+"""Reporting views for the external system (PostgreSQL only).
+
+These used to be hand-run scripts. Views never sort (ORDER BY belongs in
+the reader's query) and only join on primary keys or indexed columns;
+totals come from the daily rollups. The mv_* materialized variants are
+refreshed by the refresh_reporting_views command.
+
+A later migration that changes a view should copy its SQL here rather
+than import it, so this migration keeps creating what it created.
+"""
+from django.db import migrations, models
+
+VIEWS = {
+    'v_sales': '''
+        SELECT v.id, v.produit_id, v.quantite, v.date_vente, v.montant AS total_amount, v.updated_at
+        FROM "Siliana_vente" v
+    ''',
+    # Superset of the original v_stock and the alert-threshold variant
+    'v_stock': '''
+        SELECT
+            p.id,
+            p.nom AS product_name,
+            p.nom AS name,
+            p.quantite AS current_stock,
+            p.prix_achat AS purchase_price,
+            p.prix_vente AS selling_price,
+            p.description,
+            CASE WHEN p.quantite > 0 THEN 'available' ELSE 'out_of_stock' END AS status,
+            (p.prix_vente - p.prix_achat) AS profit_margin,
+            p.updated_at,
+            p.id AS product_id,
+            p.quantite,
+            CASE WHEN p.quantite <= 5 THEN 5 ELSE 10 END AS seuil_alerte,
+            (p.quantite = 0 OR p.quantite <= CASE WHEN p.quantite <= 5 THEN 5 ELSE 10 END) AS is_warning
+        FROM "Siliana_produit" p
+    ''',
+    'vw_product_catalog': '''
+        SELECT
+            p.id AS product_id,
+            p.nom AS product_name,
+            p.nom AS name,
+            COALESCE(p.description, '') AS description,
+            COALESCE(p.quantite, 0) AS stock_quantity,
+            CAST(COALESCE(p.prix_vente, 0) AS NUMERIC(15,2)) AS selling_price,
+            CAST(COALESCE(p.prix_achat, 0) AS NUMERIC(15,2)) AS purchase_price,
+            p.image AS image_path,
+            CASE WHEN COALESCE(p.quantite, 0) > 0 THEN 'available' ELSE 'out_of_stock' END AS status
+        FROM "Siliana_produit" p
+    ''',
+    # One sale and one purchase row per day
+    'v_finance': '''
+        SELECT 'sale' AS transaction_type, r.day AS transaction_date, SUM(r.revenue) AS amount, SUM(r.profit) AS profit
+        FROM "Siliana_dailysalesrollup" r
+        GROUP BY r.day
+        HAVING SUM(r.sales_count) > 0
+        UNION ALL
+        SELECT 'purchase', r.day, SUM(r.purchase_cost), 0
+        FROM "Siliana_dailysalesrollup" r
+        GROUP BY r.day
+        HAVING SUM(r.purchase_quantity) > 0
+    ''',
+    'v_orders': '''
+        SELECT
+            o.id,
+            o.nom AS customer_name,
+            o.telephone AS phone,
+            o.wilaya AS state,
+            o.ville AS city,
+            o.email,
+            o.status,
+            o.date_commande AS order_date,
+            o.notes,
+            o.updated_at
+        FROM "Siliana_order" o
+    ''',
+    'v_order_items': '''
+        SELECT
+            oi.id,
+            oi.order_id,
+            oi.produit_id,
+            p.nom AS product_name,
+            oi.quantite AS quantity,
+            oi.prix AS unit_price,
+            (oi.quantite * oi.prix) AS total_amount
+        FROM "Siliana_orderitem" oi
+        JOIN "Siliana_produit" p ON p.id = oi.produit_id
+    ''',
+    'v_dashboard_today': '''
+        SELECT
+            (SELECT COUNT(*) FROM "Siliana_produit") AS total_products,
+            COALESCE(SUM(r.sales_count), 0) AS sales_today,
+            COALESCE(SUM(r.revenue), 0) AS revenue_today,
+            (SELECT COUNT(*) FROM "Siliana_produit" WHERE quantite <= 5) AS low_stock_count
+        FROM "Siliana_dailysalesrollup" r
+        WHERE r.day = CURRENT_DATE
+    ''',
+    # The summaries are aggregates without GROUP BY: always exactly one row
+    'vw_sales_summary': '''
+        SELECT
+            CAST(COALESCE(SUM(r.quantity), 0) AS INTEGER) AS total_items_sold,
+            CAST(COALESCE(SUM(r.revenue), 0) AS NUMERIC(15,2)) AS total_sales_amount,
+            CAST(COALESCE(SUM(r.sales_count), 0) AS INTEGER) AS total_transactions,
+            CAST(COALESCE(SUM(r.revenue) / NULLIF(SUM(r.sales_count), 0), 0) AS NUMERIC(15,2)) AS average_transaction_value
+        FROM "Siliana_dailysalesrollup" r
+    ''',
+    'vw_stock_summary': '''
+        SELECT
+            CAST(COUNT(*) AS INTEGER) AS total_products,
+            CAST(COALESCE(SUM(p.quantite), 0) AS INTEGER) AS total_quantity_in_stock,
+            CAST(COUNT(*) FILTER (WHERE p.quantite = 0) AS INTEGER) AS out_of_stock_products,
+            CAST(COUNT(*) FILTER (WHERE p.quantite <= 5 AND p.quantite > 0) AS INTEGER) AS low_stock_products,
+            CAST(COALESCE(AVG(p.prix_vente), 0) AS NUMERIC(15,2)) AS average_selling_price
+        FROM "Siliana_produit" p
+    ''',
+    'vw_finance_summary': '''
+        SELECT
+            CAST(COALESCE(SUM(r.revenue), 0) AS NUMERIC(15,2)) AS revenue,
+            CAST(COALESCE(SUM(r.purchase_cost), 0) AS NUMERIC(15,2)) AS expenses,
+            CAST(COALESCE(SUM(r.profit), 0) AS NUMERIC(15,2)) AS gross_profit,
+            CAST(CASE
+                WHEN COALESCE(SUM(r.purchase_cost), 0) > 0
+                THEN SUM(r.revenue) / SUM(r.purchase_cost) * 100
+                ELSE 0
+            END AS NUMERIC(5,2)) AS profit_margin_percentage
+        FROM "Siliana_dailysalesrollup" r
+    ''',
+    'ventes': '''
+        SELECT CAST(v.montant AS NUMERIC(15,2)) AS montant, v.date_vente
+        FROM "Siliana_vente" v
+    ''',
+    'stock': '''
+        SELECT p.quantite, CASE WHEN p.quantite <= 5 THEN 5 ELSE 10 END AS seuil_alerte
+        FROM "Siliana_produit" p
+    ''',
+    'catalogue_produits': '''
+        SELECT
+            p.id AS product_id,
+            p.nom AS product_name,
+            p.nom AS name,
+            p.quantite,
+            CASE WHEN p.quantite <= 5 THEN 5 ELSE 10 END AS seuil_alerte
+        FROM "Siliana_produit" p
+    ''',
+    'transactions_financieres': '''
+        SELECT 'vente' AS type, CAST(v.montant AS NUMERIC(15,2)) AS montant, v.date_vente AS date_transaction
+        FROM "Siliana_vente" v
+        UNION ALL
+        SELECT 'achat', CAST(a.montant AS NUMERIC(15,2)), a.date_achat
+        FROM "Siliana_achat" a
+    ''',
+}
+
+# name -> (source view, unique index columns needed for a concurrent refresh)
+MATERIALIZED_VIEWS = {
+    'mv_finance': ('v_finance', ('transaction_type', 'transaction_date')),
+    'mv_sales_summary': ('vw_sales_summary', None),
+    'mv_stock_summary': ('vw_stock_summary', None),
+    'mv_finance_summary': ('vw_finance_summary', None),
+}
+
+EXTERNAL_ROLE = 'external_client'
+
+
+def create_views(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    # Materialized views are recreated below, so they go first in case the
+    # old scripts built them on top of the views.
+    for name in MATERIALIZED_VIEWS:
+        schema_editor.execute(f'DROP MATERIALIZED VIEW IF EXISTS {name}')
+    for name, sql in VIEWS.items():
+        # Drop first: CREATE OR REPLACE cannot rename or remove columns. No
+        # CASCADE: anything else built on a view makes this fail loudly
+        # instead of disappearing with it.
+        schema_editor.execute(f'DROP VIEW IF EXISTS {name}')
+        schema_editor.execute(f'CREATE VIEW {name} AS {sql}')
+    for name, (source, unique) in MATERIALIZED_VIEWS.items():
+        schema_editor.execute(f'CREATE MATERIALIZED VIEW {name} AS {VIEWS[source]}')
+        if unique:
+            schema_editor.execute(f'CREATE UNIQUE INDEX {name}_key ON {name} ({", ".join(unique)})')
+    readable = ', '.join([*VIEWS, *MATERIALIZED_VIEWS])
+    schema_editor.execute(f'''
+        DO $$
+        BEGIN
+            IF EXISTS (SELECT 1 FROM pg_roles WHERE rolname = '{EXTERNAL_ROLE}') THEN
+                GRANT SELECT ON {readable} TO {EXTERNAL_ROLE};
+            END IF;
+        END $$
+    ''')
+
+
+def drop_views(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name in MATERIALIZED_VIEWS:
+        schema_editor.execute(f'DROP MATERIALIZED VIEW IF EXISTS {name}')
+    for name in VIEWS:
+        schema_editor.execute(f'DROP VIEW IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Siliana', '0015_daily_sales_rollup'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='achat',
+            index=models.Index(fields=['date_achat', 'id'], name='achat_date_id_idx'),
+        ),
+        migrations.RunPython(create_views, drop_views),
+    ]
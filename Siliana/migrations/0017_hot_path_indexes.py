@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Siliana', '0016_reporting_views'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['status', 'date_commande', 'id'], name='order_status_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['wilaya', 'date_commande', 'id'], name='order_wilaya_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='produit',
+            index=models.Index(fields=['nom'], name='produit_nom_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='produit',
+            index=models.Index(condition=models.Q(('quantite__gt', 0)), fields=['nom'], name='produit_in_stock_nom_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='produit',
+            index=models.Index(condition=models.Q(('quantite__lte', 5)), fields=['quantite'], name='produit_low_stock_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='vente',
+            index=models.Index(fields=['produit', 'date_vente', 'id'], name='vente_produit_date_idx'),
+        ),
+    ]
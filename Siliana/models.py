@@ -1,4 +1,12 @@
-from django.db import models
+import hashlib
+
+from django.db import models, transaction
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import changes
+
 
 class Produit(models.Model):
     nom = models.CharField("اسم المنتج", max_length=100)
@@ -6,25 +14,42 @@ class Produit(models.Model):
     prix_achat = models.DecimalField("سعر الشراء (دينار)", max_digits=10, decimal_places=2)
     prix_vente = models.DecimalField("سعر البيع (دينار)", max_digits=10, decimal_places=2)
     
-    # Store image in PostgreSQL as binary data
-    image_data = models.BinaryField("بيانات الصورة", blank=True, null=True, editable=False)
+    # Image metadata; the bytes live in ProduitImage so listings never load them
     image_name = models.CharField("اسم الصورة", max_length=255, blank=True, null=True)
     image_type = models.CharField("نوع الصورة", max_length=50, blank=True, null=True)  # image/jpeg, image/png, etc.
+    image_hash = models.CharField("بصمة الصورة", max_length=64, blank=True, null=True, editable=False)  # sha256, part of image URLs
+    image_updated_at = models.DateTimeField("تاريخ تحديث الصورة", blank=True, null=True, editable=False)
     
     # Keep old ImageField for backward compatibility (will be empty on Railway)
     image = models.ImageField("صورة المنتج (تحميل)", upload_to='products/', blank=True, null=True)
     
     description = models.TextField("وصف المنتج", blank=True, null=True)
+
+    # Bumped by save() and by every queryset update (see stock.py); drives /api/changes/
+    updated_at = models.DateTimeField("آخر تعديل", auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['updated_at', 'id'], name='produit_updated_idx'),
+            # Catalog pages, selects and exports list products by name
+            models.Index(fields=['nom'], name='produit_nom_idx'),
+            # Public order page and in_stock API filter: in-stock products by name
+            models.Index(fields=['nom'], condition=models.Q(quantite__gt=0), name='produit_in_stock_nom_idx'),
+            # Low-stock alerts (dashboard, views) only ever look at a handful of rows
+            models.Index(fields=['quantite'], condition=models.Q(quantite__lte=5), name='produit_low_stock_idx'),
+        ]
     
     def __str__(self):
         return self.nom
     
     def save(self, *args, **kwargs):
-        # If image is uploaded via ImageField, copy it to BinaryField for PostgreSQL storage
-        if self.image and hasattr(self.image, 'file'):
+        # If image is uploaded via ImageField, copy it to ProduitImage for PostgreSQL storage.
+        # Only fresh uploads are uncommitted; files already in storage are not re-read.
+        image_data = None
+        if self.image and not self.image._committed:
             try:
                 self.image.file.seek(0)
-                self.image_data = self.image.file.read()
+                image_data = self.image.file.read()
                 self.image_name = self.image.name
                 # Detect content type
                 if self.image.name.lower().endswith(('.jpg', '.jpeg')):
@@ -37,45 +62,152 @@ class Produit(models.Model):
                     self.image_type = 'image/gif'
                 else:
                     self.image_type = 'image/jpeg'  # default
+                image_hash = hashlib.sha256(image_data).hexdigest()
+                if image_hash == self.image_hash:
+                    image_data = None  # same bytes re-uploaded
+                else:
+                    self.image_hash = image_hash
+                    self.image_updated_at = timezone.now()
             except Exception:
-                pass
-        super().save(*args, **kwargs)
+                image_data = None
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if image_data:
+                ProduitImage.objects.update_or_create(produit=self, defaults={'data': image_data})
+                ProduitImageVariant.regenerate(self, image_data)
     
     def has_image(self):
         """Check if product has an image stored in database"""
+        return bool(self.image_hash)
+
+
+class ProduitImage(models.Model):
+    """Original image bytes for a product, kept off the Produit row."""
+    produit = models.OneToOneField(
+        Produit, on_delete=models.CASCADE, primary_key=True, related_name='image_blob'
+    )
+    data = models.BinaryField("بيانات الصورة")
+
+    def __str__(self):
+        return self.produit.image_name or f"image {self.produit_id}"
+
+
+class ProduitImageVariant(models.Model):
+    """Resized, re-encoded copy of a product image (see Siliana/images.py)."""
+    produit = models.ForeignKey(Produit, on_delete=models.CASCADE, related_name='image_variants')
+    width = models.PositiveIntegerField("العرض")
+    format = models.CharField("الصيغة", max_length=10)  # key of images.VARIANT_FORMATS
+    data = models.BinaryField("بيانات الصورة")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['produit', 'width', 'format'], name='unique_produit_image_variant'),
+        ]
+
+    def __str__(self):
+        return f"{self.produit_id} - {self.width}.{self.format}"
+
+    @classmethod
+    def regenerate(cls, produit, data):
+        """Replace every derivative of `produit` with ones built from `data`."""
+        from .images import build_variants
+
+        cls.objects.filter(produit=produit).delete()
         try:
-            return bool(self.image_data)
-        except AttributeError:
-            # If image_data field doesn't exist yet (migration not run)
-            return False
+            variants = build_variants(data)
+        except Exception:
+            # Not a readable image; the original is still served as-is
+            return
+        cls.objects.bulk_create([
+            cls(produit=produit, width=width, format=fmt, data=content)
+            for width, fmt, content in variants
+        ])
 
 
 class Achat(models.Model):
     produit = models.ForeignKey(Produit, on_delete=models.CASCADE)
     quantite = models.PositiveIntegerField("الكمية المشتراة")
     date_achat = models.DateField("تاريخ الشراء", auto_now_add=True)
+    # Snapshot of the purchase price, so costs never change with later price edits
+    prix_unitaire = models.DecimalField("سعر الوحدة", max_digits=10, decimal_places=2, editable=False)
+    montant = models.DecimalField("الإجمالي", max_digits=12, decimal_places=2, editable=False)
+
+    class Meta:
+        indexes = [
+            # Backs date-range reads of purchases (transactions_financieres)
+            models.Index(fields=['date_achat', 'id'], name='achat_date_id_idx'),
+        ]
 
     def save(self, *args, **kwargs):
-        self.produit.quantite += self.quantite
-        self.produit.save()
-        super().save(*args, **kwargs)
+        from .rollups import record_purchase
+        from .stock import increment_stock
+
+        if self.prix_unitaire is None:
+            self.prix_unitaire = self.produit.prix_achat
+        self.montant = self.quantite * self.prix_unitaire
+
+        with transaction.atomic():
+            # Only add stock when recording a new purchase
+            if self.pk:
+                old = Achat.objects.filter(pk=self.pk).values('date_achat', 'produit_id', 'quantite', 'montant').first()
+                super().save(*args, **kwargs)
+                if old:
+                    record_purchase(old['date_achat'], old['produit_id'], old['quantite'], old['montant'], sign=-1)
+            else:
+                increment_stock(self.produit_id, self.quantite)
+                super().save(*args, **kwargs)
+            record_purchase(self.date_achat, self.produit_id, self.quantite, self.montant)
 
 
 class Vente(models.Model):
     produit = models.ForeignKey(Produit, on_delete=models.CASCADE)
     quantite = models.PositiveIntegerField("الكمية المباعة")
     date_vente = models.DateField("تاريخ البيع", auto_now_add=True)
+    # Snapshot of the price at sale time, so revenue never changes with later price edits
+    prix_unitaire = models.DecimalField("سعر الوحدة", max_digits=10, decimal_places=2, editable=False)
+    montant = models.DecimalField("الإجمالي", max_digits=12, decimal_places=2, editable=False)
+    # Purchase price at sale time, for profit reporting
+    cout_unitaire = models.DecimalField("تكلفة الوحدة", max_digits=10, decimal_places=2, editable=False)
+    updated_at = models.DateTimeField("آخر تعديل", auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Backs the (date_vente, id) keyset used by reports and the API
+            models.Index(fields=['date_vente', 'id'], name='vente_date_id_idx'),
+            models.Index(fields=['updated_at', 'id'], name='vente_updated_idx'),
+            # Sales of one product, newest first (API product_id filter)
+            models.Index(fields=['produit', 'date_vente', 'id'], name='vente_produit_date_idx'),
+        ]
 
     def total(self):
-        return self.quantite * self.produit.prix_vente
+        return self.montant
 
     def save(self, *args, **kwargs):
-        if self.quantite <= self.produit.quantite:
-            self.produit.quantite -= self.quantite
-            self.produit.save()
-            super().save(*args, **kwargs)
-        else:
-            raise ValueError("❌ الكمية غير متوفرة في المخزون!")
+        from .rollups import record_sale
+        from .stock import decrement_stock
+
+        if self.prix_unitaire is None:
+            self.prix_unitaire = self.produit.prix_vente
+        if self.cout_unitaire is None:
+            self.cout_unitaire = self.produit.prix_achat
+        self.montant = self.quantite * self.prix_unitaire
+
+        with transaction.atomic():
+            # Only take stock when recording a new sale
+            if self.pk:
+                old = Vente.objects.filter(pk=self.pk).values(
+                    'date_vente', 'produit_id', 'quantite', 'montant', 'cout_unitaire'
+                ).first()
+                super().save(*args, **kwargs)
+                if old:
+                    record_sale(
+                        old['date_vente'], old['produit_id'], old['quantite'],
+                        old['montant'], old['cout_unitaire'], sign=-1,
+                    )
+            else:
+                decrement_stock(self.produit_id, self.quantite, "❌ الكمية غير متوفرة في المخزون!")
+                super().save(*args, **kwargs)
+            record_sale(self.date_vente, self.produit_id, self.quantite, self.montant, self.cout_unitaire)
 
 
 class Order(models.Model):
@@ -95,22 +227,164 @@ class Order(models.Model):
     date_commande = models.DateTimeField("تاريخ الطلب", auto_now_add=True)
     notes = models.TextField("ملاحظات", blank=True, null=True)
 
+    # Maintained by OrderItem with F() updates; see recompute_totals()
+    montant_total = models.DecimalField("المجموع الكلي", max_digits=12, decimal_places=2, default=0, editable=False)
+    nombre_articles = models.PositiveIntegerField("عدد القطع", default=0, editable=False)
+    STORED_TOTAL_FIELDS = ('montant_total', 'nombre_articles')
+    updated_at = models.DateTimeField("آخر تعديل", auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Backs the (date_commande, id) keyset used by lists and the API
+            models.Index(fields=['date_commande', 'id'], name='order_date_id_idx'),
+            models.Index(fields=['updated_at', 'id'], name='order_updated_idx'),
+            # Same keyset within one status / wilaya (orders list, API, admin filters)
+            models.Index(fields=['status', 'date_commande', 'id'], name='order_status_date_idx'),
+            models.Index(fields=['wilaya', 'date_commande', 'id'], name='order_wilaya_date_idx'),
+        ]
+
     def __str__(self):
         return f"طلب {self.nom} - {self.date_commande.strftime('%Y-%m-%d')}"
 
     def total(self):
-        return sum(item.total() for item in self.orderitem_set.all())
+        return self.montant_total
+
+    @classmethod
+    def add_to_totals(cls, order_id, quantite, montant):
+        """Shift an order's stored totals by an item delta, in SQL."""
+        cls.objects.filter(pk=order_id).update(
+            montant_total=F('montant_total') + montant,
+            nombre_articles=F('nombre_articles') + quantite,
+            updated_at=changes.now(),
+        )
+
+    @classmethod
+    def recompute_totals(cls, orders=None):
+        """Recalculate stored totals from order items in one UPDATE.
+
+        Only orders whose totals were actually wrong are rewritten, so a
+        repair run does not flood the change feed.
+        """
+        items = OrderItem.objects.filter(order=OuterRef('pk')).values('order')
+        orders = cls.objects.all() if orders is None else orders
+        montant_total = Coalesce(
+            Subquery(items.annotate(s=Sum(F('quantite') * F('prix'))).values('s')),
+            Value(0),
+            output_field=DecimalField(max_digits=12, decimal_places=2),
+        )
+        nombre_articles = Coalesce(Subquery(items.annotate(s=Sum('quantite')).values('s')), Value(0))
+        stale = orders.annotate(
+            expected_total=montant_total, expected_count=nombre_articles,
+        ).exclude(montant_total=F('expected_total'), nombre_articles=F('expected_count'))
+        return cls.objects.filter(pk__in=stale.values('pk')).update(
+            montant_total=montant_total,
+            nombre_articles=nombre_articles,
+            updated_at=changes.now(),
+        )
+
+    @classmethod
+    def bulk_set_status(cls, orders, status):
+        """Move every order of the `orders` queryset to `status` at once.
+
+        Does in one transaction what save() does per order: stock of newly
+        cancelled orders goes back in one grouped UPDATE and their lines
+        leave the rollups; un-cancelled orders take their stock out again
+        (all or nothing, raising InsufficientStock) and count towards the
+        rollups again. Returns a summary: orders updated, already in
+        `status`, and units of stock restored or taken.
+        """
+        from .rollups import record_order_days
+        from .stock import increment_stock_many
+
+        with transaction.atomic():
+            # Subqueries rather than id lists: an admin "select all" can
+            # cover more orders than a query may take parameters
+            selected = cls.objects.filter(pk__in=orders.order_by().values('pk'))
+            changing = selected.exclude(status=status)
+            leaving = changing if status == 'cancelled' else changing.filter(status='cancelled')
+            updated = len(changing.select_for_update().values_list('pk', flat=True))
+
+            quantities = {}
+            lines_by_day = {}
+            items = OrderItem.objects.filter(order__in=leaving.values('pk')).values_list(
+                'order__date_commande', 'produit_id', 'quantite', 'prix',
+            )
+            for date_commande, produit_id, quantite, prix in items:
+                lines_by_day.setdefault(timezone.localdate(date_commande), []).append((produit_id, quantite, prix))
+                quantities[produit_id] = quantities.get(produit_id, 0) + quantite
+
+            if status == 'cancelled':
+                increment_stock_many(quantities)
+            else:
+                cls._take_stock(quantities)
+            record_order_days(lines_by_day, sign=-1 if status == 'cancelled' else 1)
+            unchanged = selected.filter(status=status).count()
+            changing.update(status=status, updated_at=changes.now())
+
+        return {
+            'updated': updated,
+            'unchanged': unchanged,
+            'stock_restored': sum(quantities.values()) if status == 'cancelled' else 0,
+            'stock_taken': 0 if status == 'cancelled' else sum(quantities.values()),
+        }
+
+    @staticmethod
+    def _take_stock(quantities):
+        """Take un-cancelled orders' units out of stock again in one UPDATE,
+        or raise InsufficientStock naming the short product."""
+        from .stock import InsufficientStock, decrement_stock_many
+
+        try:
+            decrement_stock_many(quantities)
+        except InsufficientStock as exc:
+            # The name is only needed for the error, so only read it here
+            nom = Produit.objects.filter(pk=exc.produit_id).values_list('nom', flat=True).first()
+            raise InsufficientStock(f"❌ الكمية المطلوبة من {nom} غير متوفرة!", exc.produit_id) from exc
+
+    @classmethod
+    def bulk_status_message(cls, summary, status):
+        """Staff-facing summary of a bulk_set_status() result."""
+        message = f"تم تحديث {summary['updated']} طلب إلى: {dict(cls.STATUS_CHOICES)[status]}"
+        if summary['stock_restored']:
+            message += f"، وإرجاع {summary['stock_restored']} قطعة إلى المخزون"
+        if summary['stock_taken']:
+            message += f"، وخصم {summary['stock_taken']} قطعة من المخزون"
+        if summary['unchanged']:
+            message += f" ({summary['unchanged']} طلب كان بهذه الحالة مسبقاً)"
+        return message
 
     def save(self, *args, **kwargs):
-        # Check if status changed to cancelled
-        if self.pk:  # Existing order
-            old_order = Order.objects.get(pk=self.pk)
-            if old_order.status != 'cancelled' and self.status == 'cancelled':
-                # Restore stock for all items
-                for item in self.orderitem_set.all():
-                    item.produit.quantite += item.quantite
-                    item.produit.save()
-        super().save(*args, **kwargs)
+        from .rollups import order_day, record_order_lines
+        from .stock import increment_stock_many
+
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            # Never write back a stale in-memory copy of the stored totals
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name not in self.STORED_TOTAL_FIELDS
+            ]
+
+        with transaction.atomic():
+            old_status = None
+            if self.pk:
+                old_status = Order.objects.filter(pk=self.pk).values_list('status', flat=True).first()
+            cancelling = self.status == 'cancelled' and old_status not in (None, 'cancelled')
+            restoring = old_status == 'cancelled' and self.status != 'cancelled'
+            if cancelling or restoring:
+                lines = list(self.orderitem_set.values_list('produit_id', 'quantite', 'prix'))
+                quantities = {}
+                for produit_id, quantite, _prix in lines:
+                    quantities[produit_id] = quantities.get(produit_id, 0) + quantite
+            if cancelling:
+                # Restore stock for all items in one grouped update
+                increment_stock_many(quantities)
+                record_order_lines(timezone.localdate(self.date_commande), lines, sign=-1)
+            if restoring:
+                # The order counts as sold again, so its stock goes back out
+                self._take_stock(quantities)
+            super().save(*args, **kwargs)
+            if restoring:
+                record_order_lines(order_day(self), lines)
 
 
 class OrderItem(models.Model):
@@ -125,14 +399,120 @@ class OrderItem(models.Model):
     def total(self):
         return self.quantite * self.prix
 
+    def _apply_to_order(self, order_id, quantite, montant):
+        Order.add_to_totals(order_id, quantite, montant)
+        # Keep an already loaded order in step with the database
+        if OrderItem.order.is_cached(self) and self.order.pk == order_id:
+            self.order.montant_total += montant
+            self.order.nombre_articles += quantite
+
     def save(self, *args, **kwargs):
-        # Only decrement stock when creating a new order item
-        if not self.pk:  # New instance
-            if self.quantite <= self.produit.quantite:
-                self.produit.quantite -= self.quantite
-                self.produit.save()
+        from .rollups import order_day, record_order_lines
+        from .stock import InsufficientStock, decrement_stock
+
+        with transaction.atomic():
+            # Only decrement stock when creating a new order item
+            if self.pk:
+                old = OrderItem.objects.filter(pk=self.pk).values('order_id', 'produit_id', 'quantite', 'prix').first()
                 super().save(*args, **kwargs)
+                if old:
+                    self._apply_to_order(old['order_id'], -old['quantite'], -old['quantite'] * old['prix'])
+                    old_order = self.order if old['order_id'] == self.order_id else Order.objects.filter(pk=old['order_id']).first()
+                    record_order_lines(order_day(old_order), [(old['produit_id'], old['quantite'], old['prix'])], sign=-1)
             else:
-                raise ValueError(f"❌ الكمية المطلوبة من {self.produit.nom} غير متوفرة!")
-        else:
-            super().save(*args, **kwargs)
+                try:
+                    decrement_stock(self.produit_id, self.quantite)
+                except InsufficientStock as exc:
+                    # The name is only needed for the error, so only read it here
+                    nom = Produit.objects.filter(pk=self.produit_id).values_list('nom', flat=True).first()
+                    raise InsufficientStock(f"❌ الكمية المطلوبة من {nom} غير متوفرة!", self.produit_id) from exc
+                super().save(*args, **kwargs)
+            self._apply_to_order(self.order_id, self.quantite, self.total())
+            record_order_lines(order_day(self.order), [(self.produit_id, self.quantite, self.prix)])
+
+
+class DailySalesRollup(models.Model):
+    """Per day and product totals, kept up to date by rollups.py."""
+
+    day = models.DateField("اليوم")
+    produit = models.ForeignKey(Produit, on_delete=models.CASCADE, related_name='daily_rollups')
+    sales_count = models.IntegerField("عدد المبيعات", default=0)
+    quantity = models.IntegerField("الكمية المباعة", default=0)
+    revenue = models.DecimalField("المداخيل", max_digits=14, decimal_places=2, default=0)
+    cost = models.DecimalField("التكلفة", max_digits=14, decimal_places=2, default=0)
+    profit = models.GeneratedField(
+        expression=F('revenue') - F('cost'),
+        output_field=models.DecimalField(max_digits=14, decimal_places=2),
+        db_persist=True,
+        verbose_name="الربح",
+    )
+    purchase_quantity = models.IntegerField("الكمية المشتراة", default=0)
+    purchase_cost = models.DecimalField("قيمة المشتريات", max_digits=14, decimal_places=2, default=0)
+    order_quantity = models.IntegerField("الكمية المطلوبة", default=0)
+    order_revenue = models.DecimalField("قيمة الطلبات", max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'produit'], name='unique_daily_rollup'),
+        ]
+        indexes = [
+            models.Index(fields=['day'], name='daily_rollup_day_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} - {self.produit_id}"
+
+
+class Tombstone(models.Model):
+    """Record of a deleted Produit, Order or Vente, served by /api/changes/
+    so external systems can drop rows they synced earlier."""
+
+    MODEL_CHOICES = [
+        ('product', 'منتج'),
+        ('order', 'طلب'),
+        ('sale', 'بيع'),
+    ]
+
+    model = models.CharField("النوع", max_length=20, choices=MODEL_CHOICES)
+    object_id = models.BigIntegerField("المعرف")
+    deleted_at = models.DateTimeField("تاريخ الحذف", default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['deleted_at', 'id'], name='tombstone_deleted_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.model} #{self.object_id}"
+
+
+class EmailOutbox(models.Model):
+    """Outgoing email, written in the same transaction as the change that
+    triggers it and delivered later by the send_outbox command."""
+
+    STATUS_CHOICES = [
+        ('pending', 'في الانتظار'),
+        ('sent', 'تم الإرسال'),
+        ('failed', 'فشل'),
+    ]
+
+    subject = models.CharField("الموضوع", max_length=255)
+    body = models.TextField("النص")
+    from_email = models.CharField("المرسل", max_length=255)
+    recipients = models.JSONField("المستلمون", default=list)
+    status = models.CharField("الحالة", max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField("عدد المحاولات", default=0)
+    next_attempt_at = models.DateTimeField("المحاولة القادمة", default=timezone.now)
+    last_error = models.TextField("آخر خطأ", blank=True, default='')
+    created_at = models.DateTimeField("تاريخ الإنشاء", auto_now_add=True)
+    sent_at = models.DateTimeField("تاريخ الإرسال", blank=True, null=True)
+
+    class Meta:
+        verbose_name = "رسالة صادرة"
+        verbose_name_plural = "الرسائل الصادرة"
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='email_outbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} → {', '.join(self.recipients)}"
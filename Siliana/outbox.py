@@ -0,0 +1,113 @@
+"""Transactional email outbox.
+
+Views call queue_mail() inside their own transaction, so an email exists
+exactly when the order (or other change) that triggered it was committed,
+and the request never waits on the mail server. The send_outbox command
+calls drain_outbox() to deliver due messages in batches over a single
+backend connection, retrying failures with exponential backoff.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import connection as db_connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import EmailOutbox
+
+RETRY_BASE_SECONDS = 60
+RETRY_MAX_SECONDS = 6 * 60 * 60
+# How long a claimed batch stays invisible to other workers while sending
+CLAIM_SECONDS = 5 * 60
+
+
+def queue_mail(subject, body, recipients, from_email=None):
+    """Store an email for later delivery and return the outbox row."""
+    return EmailOutbox.objects.create(
+        subject=subject,
+        body=body,
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        recipients=list(recipients),
+    )
+
+
+def retry_delay(attempts):
+    """Backoff before attempt number `attempts + 1`."""
+    return timedelta(seconds=min(RETRY_BASE_SECONDS * 2 ** max(attempts - 1, 0), RETRY_MAX_SECONDS))
+
+
+def _claim(batch_size, now):
+    """Lock a batch of due messages and push their next attempt forward."""
+    with transaction.atomic():
+        due = EmailOutbox.objects.filter(status='pending', next_attempt_at__lte=now).order_by('next_attempt_at', 'id')
+        if db_connection.features.has_select_for_update_skip_locked:
+            due = due.select_for_update(skip_locked=True)
+        batch = list(due[:batch_size])
+        if batch:
+            EmailOutbox.objects.filter(pk__in=[m.pk for m in batch]).update(
+                attempts=F('attempts') + 1,
+                next_attempt_at=now + timedelta(seconds=CLAIM_SECONDS),
+            )
+            for message in batch:
+                message.attempts += 1
+    return batch
+
+
+def drain_outbox(batch_size=50, max_attempts=None, connection=None):
+    """Send due messages until none are left; return (sent, failed) counts.
+
+    Messages that fail are retried later; after `max_attempts`
+    (EMAIL_OUTBOX_MAX_ATTEMPTS) they are marked failed and left for review.
+    """
+    if max_attempts is None:
+        max_attempts = getattr(settings, 'EMAIL_OUTBOX_MAX_ATTEMPTS', 8)
+    sent = failed = 0
+    mail_connection = connection or get_connection(fail_silently=False)
+    opened = False
+    try:
+        while True:
+            batch = _claim(batch_size, timezone.now())
+            if not batch:
+                break
+            if not opened:
+                try:
+                    mail_connection.open()
+                except Exception as exc:
+                    # Server unreachable: the whole batch waits for a retry
+                    for message in batch:
+                        _record_failure(message, exc, max_attempts)
+                    failed += len(batch)
+                    break
+                opened = True
+            for message in batch:
+                try:
+                    EmailMessage(
+                        subject=message.subject,
+                        body=message.body,
+                        from_email=message.from_email,
+                        to=message.recipients,
+                        connection=mail_connection,
+                    ).send()
+                except Exception as exc:
+                    _record_failure(message, exc, max_attempts)
+                    failed += 1
+                else:
+                    EmailOutbox.objects.filter(pk=message.pk).update(
+                        status='sent', sent_at=timezone.now(), last_error='',
+                    )
+                    sent += 1
+            if len(batch) < batch_size:
+                break
+    finally:
+        if opened:
+            mail_connection.close()
+    return sent, failed
+
+
+def _record_failure(message, exc, max_attempts):
+    EmailOutbox.objects.filter(pk=message.pk).update(
+        status='failed' if message.attempts >= max_attempts else 'pending',
+        next_attempt_at=timezone.now() + retry_delay(message.attempts),
+        last_error=f"{type(exc).__name__}: {exc}"[:2000],
+    )
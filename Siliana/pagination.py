@@ -0,0 +1,192 @@
+"""Keyset (seek) pagination, and a paginator with estimated counts.
+
+Pages are addressed by the ordering key of the last/first row shown rather
+than by an offset, so fetching page 1000 costs the same as page 1 as long
+as the ordering is backed by an index. The key is handed to clients as an
+opaque URL-safe token.
+
+EstimatedCountPaginator is for the admin changelists of large tables,
+where the exact COUNT(*) behind "page N of M" costs a scan of every
+matching row on each page view.
+"""
+import base64
+import datetime
+import json
+from dataclasses import dataclass, field
+from typing import Any, List, Optional
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.paginator import Paginator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import Q, QuerySet
+from django.utils.functional import cached_property
+
+# Counts estimated below this are recounted exactly, which is cheap there
+EXACT_COUNT_BELOW = 10000
+
+
+@dataclass
+class KeysetPage:
+    items: List[Any] = field(default_factory=list)
+    next_cursor: Optional[str] = None
+    previous_cursor: Optional[str] = None
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+
+class _CursorEncoder(DjangoJSONEncoder):
+    def default(self, o):
+        # DjangoJSONEncoder truncates to milliseconds; seeks need exact values
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def encode_cursor(values):
+    raw = json.dumps(list(values), cls=_CursorEncoder, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, length):
+    """Decode a cursor token; raises ValueError when it is malformed."""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+    except Exception as exc:
+        raise ValueError("invalid cursor") from exc
+    if not isinstance(values, list) or len(values) != length:
+        raise ValueError("invalid cursor")
+    return values
+
+
+def _typed(queryset, fields, values):
+    """Cursor values converted to their ordering fields' types.
+
+    A token can be edited by the client; a value of the wrong type would
+    otherwise only fail when the query runs. Raises ValueError.
+    """
+    opts = queryset.model._meta
+    typed = []
+    for name, value in zip(fields, values):
+        if value is None:
+            raise ValueError("invalid cursor")
+        try:
+            model_field = opts.get_field(name)
+        except FieldDoesNotExist:
+            typed.append(value)
+            continue
+        try:
+            typed.append(model_field.to_python(value))
+        except (ValidationError, TypeError) as exc:
+            raise ValueError("invalid cursor") from exc
+    return typed
+
+
+def _seek(fields, values, descending):
+    """Rows strictly after `values` in (fields) order, as a Q object."""
+    op = 'lt' if descending else 'gt'
+    condition = Q()
+    for i, name in enumerate(fields):
+        step = Q(**{f'{name}__{op}': values[i]})
+        for prev_name, prev_value in zip(fields[:i], values[:i]):
+            step &= Q(**{prev_name: prev_value})
+        condition |= step
+    return condition
+
+
+def _key(item, fields):
+    if isinstance(item, dict):
+        return [item[name] for name in fields]
+    return [getattr(item, name) for name in fields]
+
+
+def keyset_paginate(queryset, ordering, size, after=None, before=None):
+    """Return one KeysetPage of `queryset`.
+
+    `ordering` is a list of field names that all sort in the same direction
+    and end with a unique field (e.g. ['-date_vente', '-id']). `after` and
+    `before` are cursor tokens from a previous page; ValueError is raised
+    for malformed tokens, including ones whose values do not fit the
+    ordering fields.
+    """
+    fields = [name.lstrip('-') for name in ordering]
+    descending = ordering[0].startswith('-')
+
+    if before:
+        values = _typed(queryset, fields, decode_cursor(before, len(fields)))
+        reverse = [name[1:] if name.startswith('-') else f'-{name}' for name in ordering]
+        rows = list(queryset.filter(_seek(fields, values, not descending)).order_by(*reverse)[:size + 1])
+        has_previous = len(rows) > size
+        rows = rows[:size][::-1]
+        has_next = True
+    else:
+        queryset = queryset.order_by(*ordering)
+        if after:
+            values = _typed(queryset, fields, decode_cursor(after, len(fields)))
+            queryset = queryset.filter(_seek(fields, values, descending))
+        rows = list(queryset[:size + 1])
+        has_next = len(rows) > size
+        rows = rows[:size]
+        has_previous = bool(after)
+
+    return KeysetPage(
+        items=rows,
+        next_cursor=encode_cursor(_key(rows[-1], fields)) if rows and has_next else None,
+        previous_cursor=encode_cursor(_key(rows[0], fields)) if rows and has_previous else None,
+    )
+
+
+def estimated_count(queryset):
+    """The planner's row estimate for `queryset`, or None when there is none.
+
+    PostgreSQL only: an unfiltered table reads pg_class.reltuples (kept
+    fresh by autovacuum), a filtered one the top row estimate of its plan.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        if not queryset.query.where:
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+                [connection.ops.quote_name(queryset.model._meta.db_table)],
+            )
+            row = cursor.fetchone()
+            # -1 until the table is first analyzed
+            return row[0] if row and row[0] >= 0 else None
+        sql, params = queryset.order_by().query.sql_with_params()
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator that trusts the planner's estimate for large result sets.
+
+    Small results (and every backend but PostgreSQL) are counted exactly.
+    An estimate can be off by a few percent, so the last page may come up
+    short or a page past the real end may be offered.
+    """
+
+    @cached_property
+    def count(self):
+        if isinstance(self.object_list, QuerySet):
+            # Capped at the threshold, the count is exact for small results
+            # (the only query they need) and reads a bounded number of rows
+            # before a large one falls back to the estimate
+            capped = self.object_list.order_by()[:EXACT_COUNT_BELOW].count()
+            if capped < EXACT_COUNT_BELOW:
+                return capped
+            estimate = estimated_count(self.object_list)
+            if estimate is not None and estimate >= EXACT_COUNT_BELOW:
+                return estimate
+        return super().count
@@ -0,0 +1,38 @@
+"""Reporting views read by the external system (PostgreSQL only).
+
+The views themselves are created by migrations (see 0016_reporting_views).
+This module lists them for the refresh command and the EXPLAIN tests.
+"""
+from django.db import connections
+
+REPORTING_VIEWS = (
+    'v_sales', 'v_stock', 'vw_product_catalog', 'v_finance', 'v_orders', 'v_order_items',
+    'v_dashboard_today', 'vw_sales_summary', 'vw_stock_summary', 'vw_finance_summary',
+    'ventes', 'stock', 'catalogue_produits', 'transactions_financieres',
+)
+
+# Materialized view -> whether it has the unique index a concurrent refresh needs
+MATERIALIZED_VIEWS = {
+    'mv_finance': True,
+    'mv_sales_summary': False,
+    'mv_stock_summary': False,
+    'mv_finance_summary': False,
+}
+
+
+def refresh_materialized_views(names=None, concurrently=True, using='default'):
+    """Refresh the given (default: all) materialized views; returns their names.
+
+    Concurrent refreshes keep the old rows readable while the new ones are
+    computed; single-row summaries are cheap enough to refresh directly.
+    Does nothing on databases other than PostgreSQL.
+    """
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return []
+    names = list(names or MATERIALIZED_VIEWS)
+    with connection.cursor() as cursor:
+        for name in names:
+            mode = ' CONCURRENTLY' if concurrently and MATERIALIZED_VIEWS[name] else ''
+            cursor.execute(f'REFRESH MATERIALIZED VIEW{mode} {connection.ops.quote_name(name)}')
+    return names
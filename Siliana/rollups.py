@@ -0,0 +1,206 @@
+"""Per-day, per-product totals of sales, purchases and order demand.
+
+DailySalesRollup rows are adjusted in place whenever a Vente, Achat or
+OrderItem is written or deleted, so reporting queries (and the external
+SQL views) read one row per day and product instead of scanning every
+sale. rebuild() recomputes them from the source tables; it is what the
+rebuild_sales_rollups command and the initial migration run.
+
+Orders count towards demand on the day they were placed, and stop
+counting while they are cancelled.
+"""
+from decimal import Decimal
+from functools import reduce
+from operator import or_
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, DecimalField, F, Q, Sum, Value, When
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+CENT = Decimal('0.01')
+ROLLUP_FIELDS = (
+    'sales_count', 'quantity', 'revenue', 'cost',
+    'purchase_quantity', 'purchase_cost',
+    'order_quantity', 'order_revenue',
+)
+
+
+def _rollup_model():
+    from .models import DailySalesRollup
+    return DailySalesRollup
+
+
+def apply(day, produit_id, **deltas):
+    """Add `deltas` (rollup field -> amount) to the (day, produit) row."""
+    DailySalesRollup = _rollup_model()
+    deltas = {name: value for name, value in deltas.items() if value}
+    if not deltas:
+        return
+    increments = {name: F(name) + value for name, value in deltas.items()}
+    rows = DailySalesRollup.objects.filter(day=day, produit_id=produit_id)
+    if rows.update(**increments):
+        return
+    try:
+        with transaction.atomic():
+            DailySalesRollup.objects.create(day=day, produit_id=produit_id, **deltas)
+    except IntegrityError:
+        # Another transaction created the row first; add to it instead
+        rows.update(**increments)
+
+
+def apply_many(deltas):
+    """Add several rows' deltas at once: {(day, produit_id): {field: amount}}.
+
+    Missing rows are created in one INSERT that skips rows another
+    transaction already created, then every row is adjusted in one UPDATE,
+    so the query count does not depend on how many rows are touched.
+    """
+    DailySalesRollup = _rollup_model()
+    deltas = {
+        key: {name: value for name, value in values.items() if value}
+        for key, values in deltas.items()
+    }
+    deltas = {key: values for key, values in deltas.items() if values}
+    if len(deltas) <= 1:
+        # One row usually exists already: a single UPDATE
+        for (day, produit_id), values in deltas.items():
+            apply(day, produit_id, **values)
+        return
+    DailySalesRollup.objects.bulk_create(
+        [DailySalesRollup(day=day, produit_id=produit_id) for day, produit_id in deltas],
+        ignore_conflicts=True,
+    )
+    fields = {name for values in deltas.values() for name in values}
+    increments = {}
+    for name in fields:
+        output_field = DailySalesRollup._meta.get_field(name)
+        increments[name] = F(name) + Case(
+            *[
+                When(day=day, produit_id=produit_id, then=Value(values[name]))
+                for (day, produit_id), values in deltas.items() if name in values
+            ],
+            default=Value(0),
+            output_field=output_field,
+        )
+    DailySalesRollup.objects.filter(
+        reduce(or_, (Q(day=day, produit_id=produit_id) for day, produit_id in deltas))
+    ).update(**increments)
+
+
+def record_sale(day, produit_id, quantite, montant, cout_unitaire, sign=1):
+    apply(
+        day, produit_id,
+        sales_count=sign,
+        quantity=sign * quantite,
+        revenue=sign * montant,
+        cost=sign * quantite * cout_unitaire,
+    )
+
+
+def record_purchase(day, produit_id, quantite, montant, sign=1):
+    apply(day, produit_id, purchase_quantity=sign * quantite, purchase_cost=sign * montant)
+
+
+def order_day(order):
+    """Rollup day of an order, or None while it is cancelled."""
+    if order is None or order.status == 'cancelled':
+        return None
+    return timezone.localdate(order.date_commande)
+
+
+def record_order_lines(day, lines, sign=1):
+    """Add (produit_id, quantite, prix) lines to the demand columns of `day`."""
+    record_order_days({day: lines}, sign=sign)
+
+
+def record_order_days(lines_by_day, sign=1):
+    """record_order_lines() for several days, in a fixed number of queries."""
+    grouped = {}
+    for day, lines in lines_by_day.items():
+        if day is None:
+            continue
+        for produit_id, quantite, prix in lines:
+            quantity, revenue = grouped.get((day, produit_id), (0, Decimal('0')))
+            grouped[(day, produit_id)] = (quantity + quantite, revenue + quantite * prix)
+    apply_many({
+        key: {'order_quantity': sign * quantity, 'order_revenue': sign * revenue}
+        for key, (quantity, revenue) in grouped.items()
+    })
+
+
+def rebuild(start=None, end=None, app_registry=None):
+    """Recompute rollups for days in [start, end] (all days by default).
+
+    Returns the number of rollup rows written. `app_registry` lets data
+    migrations pass their historical models.
+    """
+    if app_registry is None:
+        from django.apps import apps as app_registry
+    DailySalesRollup = app_registry.get_model('Siliana', 'DailySalesRollup')
+    Vente = app_registry.get_model('Siliana', 'Vente')
+    Achat = app_registry.get_model('Siliana', 'Achat')
+    OrderItem = app_registry.get_model('Siliana', 'OrderItem')
+    money = DecimalField(max_digits=14, decimal_places=2)
+
+    def in_range(queryset, field):
+        if start:
+            queryset = queryset.filter(**{f'{field}__gte': start})
+        if end:
+            queryset = queryset.filter(**{f'{field}__lte': end})
+        return queryset
+
+    totals = {}
+
+    def add(day, produit_id, **values):
+        row = totals.setdefault((day, produit_id), dict.fromkeys(ROLLUP_FIELDS, 0))
+        for name, value in values.items():
+            row[name] += value or 0
+
+    sales = (
+        in_range(Vente.objects.order_by(), 'date_vente')
+        .values('date_vente', 'produit_id')
+        .annotate(
+            n=Count('id'), q=Sum('quantite'), r=Sum('montant'),
+            c=Sum(F('quantite') * F('cout_unitaire'), output_field=money),
+        )
+    )
+    for row in sales:
+        add(row['date_vente'], row['produit_id'], sales_count=row['n'], quantity=row['q'], revenue=row['r'], cost=row['c'])
+
+    purchases = (
+        in_range(Achat.objects.order_by(), 'date_achat')
+        .values('date_achat', 'produit_id')
+        .annotate(q=Sum('quantite'), c=Sum('montant'))
+    )
+    for row in purchases:
+        add(row['date_achat'], row['produit_id'], purchase_quantity=row['q'], purchase_cost=row['c'])
+
+    demand = (
+        in_range(
+            OrderItem.objects.order_by().exclude(order__status='cancelled')
+            .annotate(day=TruncDate('order__date_commande')),
+            'day',
+        )
+        .values('day', 'produit_id')
+        .annotate(q=Sum('quantite'), r=Sum(F('quantite') * F('prix'), output_field=money))
+    )
+    for row in demand:
+        add(row['day'], row['produit_id'], order_quantity=row['q'], order_revenue=row['r'])
+
+    with transaction.atomic():
+        in_range(DailySalesRollup.objects.all(), 'day').delete()
+        DailySalesRollup.objects.bulk_create(
+            [
+                DailySalesRollup(
+                    day=day, produit_id=produit_id,
+                    **{
+                        name: Decimal(str(value)).quantize(CENT) if isinstance(value, (Decimal, float)) else value
+                        for name, value in values.items()
+                    },
+                )
+                for (day, produit_id), values in totals.items()
+            ],
+            batch_size=1000,
+        )
+    return len(totals)
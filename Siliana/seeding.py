@@ -0,0 +1,181 @@
+"""Bulk test data for benchmarks and local development.
+
+Rows are written with bulk_create, so model save() logic (stock checks,
+stored totals, rollups) is skipped. Totals and sale prices are computed
+here and the rollups rebuilt at the end to keep the data consistent.
+
+Orders, sales and purchases are generated and inserted one batch at a
+time, so seeding millions of rows does not hold them all in memory.
+Names, wilayas and order statuses follow the shop's real data: Arabic fig
+varieties and customer names, all 24 wilayas, mostly completed orders.
+"""
+import random
+from datetime import timedelta
+from decimal import Decimal
+
+from django.utils import timezone
+
+from .models import Achat, Order, OrderItem, Produit, Vente
+from .rollups import rebuild
+
+# Wilaya -> a few of its towns, for the order's city field
+WILAYAS = {
+    "تونس": ("تونس", "باردو", "حلق الوادي", "قرطاج"),
+    "أريانة": ("أريانة", "رواد", "سكرة", "المنيهلة"),
+    "بن عروس": ("بن عروس", "حمام الأنف", "رادس", "المروج"),
+    "منوبة": ("منوبة", "الدندان", "طبربة", "وادي الليل"),
+    "نابل": ("نابل", "الحمامات", "قليبية", "منزل تميم"),
+    "زغوان": ("زغوان", "الفحص", "الناظور", "بئر مشارقة"),
+    "بنزرت": ("بنزرت", "منزل بورقيبة", "ماطر", "رأس الجبل"),
+    "باجة": ("باجة", "مجاز الباب", "تستور", "نفزة"),
+    "جندوبة": ("جندوبة", "طبرقة", "عين دراهم", "بوسالم"),
+    "الكاف": ("الكاف", "الدهماني", "تاجروين", "السرس"),
+    "سليانة": ("سليانة", "مكثر", "قعفور", "الكريب"),
+    "سوسة": ("سوسة", "حمام سوسة", "مساكن", "القلعة الكبرى"),
+    "المنستير": ("المنستير", "المكنين", "قصر هلال", "جمال"),
+    "المهدية": ("المهدية", "الجم", "قصور الساف", "الشابة"),
+    "صفاقس": ("صفاقس", "ساقية الزيت", "جبنيانة", "المحرس"),
+    "القيروان": ("القيروان", "حفوز", "الوسلاتية", "بوحجلة"),
+    "القصرين": ("القصرين", "سبيطلة", "فريانة", "تالة"),
+    "سيدي بوزيد": ("سيدي بوزيد", "الرقاب", "المكناسي", "جلمة"),
+    "قابس": ("قابس", "الحامة", "مارث", "مطماطة"),
+    "مدنين": ("مدنين", "جربة حومة السوق", "جرجيس", "بن قردان"),
+    "تطاوين": ("تطاوين", "غمراسن", "بئر الأحمر", "الصمار"),
+    "قفصة": ("قفصة", "المتلوي", "الرديف", "أم العرائس"),
+    "توزر": ("توزر", "نفطة", "دقاش", "تمغزة"),
+    "قبلي": ("قبلي", "دوز", "سوق الأحد", "الفوار"),
+}
+VARIETIES = (
+    "زيدي", "بيثر", "براون تكي", "اسباني اسود", "بوغانم", "كحلي", "بيضي", "سوادي",
+    "حمري", "بزاوي", "خرطومي", "ملاسي", "رمادي", "وحشي", "بسباسي", "جبالي",
+)
+FORMS = ("شتلة", "شتلة سنتين", "شجرة مثمرة", "عقلة", "أصيص 3 لتر", "أصيص 10 لتر")
+FIRST_NAMES = (
+    "محمد", "أحمد", "علي", "يوسف", "حمزة", "سامي", "كريم", "منير", "نزار", "هشام",
+    "فاطمة", "مريم", "آمنة", "سلمى", "ليلى", "نادية", "خديجة", "سناء", "رحمة", "إيمان",
+)
+LAST_NAMES = (
+    "بن علي", "الطرابلسي", "الجلاصي", "السويسي", "الهمامي", "العياري", "الماجري",
+    "الزواري", "القاسمي", "الدريدي", "الفرشيشي", "بن سالم", "الشابي", "الكعبي",
+)
+# Weighted like a running shop: most orders end up completed
+STATUS_WEIGHTS = (("pending", 20), ("confirmed", 25), ("completed", 45), ("cancelled", 10))
+
+
+def product_name(i):
+    """Distinct Arabic product names: every variety/form pair, then numbered."""
+    variety = VARIETIES[i % len(VARIETIES)]
+    form = FORMS[i // len(VARIETIES) % len(FORMS)]
+    round_ = i // (len(VARIETIES) * len(FORMS))
+    name = f"تين {variety} - {form}"
+    return f"{name} ({round_ + 1})" if round_ else name
+
+
+def _batches(total, batch_size):
+    for start in range(0, total, batch_size):
+        yield range(start, min(start + batch_size, total))
+
+
+def _spread_dates(model, created, positions, total, days, field, value_for):
+    """Backdate rows so the oldest come first and the newest are today.
+
+    auto_now_add overwrites dates on insert, so they are set afterwards,
+    one UPDATE per day covered by the batch (ids increase with position).
+    """
+    if days <= 1:
+        return
+    by_day = {}
+    for obj, position in zip(created, positions):
+        by_day.setdefault(days - 1 - position * days // total, []).append(obj.pk)
+    for age, pks in by_day.items():
+        model.objects.filter(pk__gte=min(pks), pk__lte=max(pks)).update(**{field: value_for(age)})
+
+
+def seed(products=100, orders=1000, items_per_order=3, sales=5000, purchases=0, days=1, batch_size=1000, rng=None):
+    """Create products, orders with items, sales and purchases; returns the counts.
+
+    With `days` > 1, orders, sales and purchases are spread evenly over
+    that many days ending today.
+    """
+    rng = rng or random.Random(0)
+    now = timezone.now()
+    today = timezone.localdate()
+    statuses, weights = zip(*STATUS_WEIGHTS)
+
+    produits = Produit.objects.bulk_create(
+        [
+            Produit(
+                nom=product_name(i),
+                quantite=rng.randint(0, 500),
+                prix_achat=Decimal(rng.randint(100, 2000)) / 100,
+                prix_vente=Decimal(rng.randint(2000, 5000)) / 100,
+            )
+            for i in range(products)
+        ],
+        batch_size=batch_size,
+    )
+
+    for positions in _batches(orders, batch_size):
+        lines = [
+            [(rng.choice(produits), rng.randint(1, 5)) for _ in range(items_per_order)]
+            for _ in positions
+        ]
+        wilayas = [rng.choice(list(WILAYAS)) for _ in positions]
+        created = Order.objects.bulk_create([
+            Order(
+                nom=f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+                email=f"client{i}@example.com" if rng.random() < 0.3 else None,
+                wilaya=wilaya,
+                ville=rng.choice(WILAYAS[wilaya]),
+                telephone=f"{rng.choice('2594')}{rng.randint(0, 9999999):07d}",
+                status=rng.choices(statuses, weights)[0],
+                montant_total=sum((produit.prix_vente * quantite for produit, quantite in order_lines), Decimal("0")),
+                nombre_articles=sum(quantite for _produit, quantite in order_lines),
+            )
+            for i, wilaya, order_lines in zip(positions, wilayas, lines)
+        ])
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, produit=produit, quantite=quantite, prix=produit.prix_vente)
+            for order, order_lines in zip(created, lines)
+            for produit, quantite in order_lines
+        ])
+        _spread_dates(Order, created, positions, orders, days, 'date_commande', lambda age: now - timedelta(days=age))
+
+    for positions in _batches(sales, batch_size):
+        ventes = []
+        for _ in positions:
+            produit = rng.choice(produits)
+            quantite = rng.randint(1, 5)
+            ventes.append(Vente(
+                produit=produit,
+                quantite=quantite,
+                prix_unitaire=produit.prix_vente,
+                cout_unitaire=produit.prix_achat,
+                montant=produit.prix_vente * quantite,
+            ))
+        created = Vente.objects.bulk_create(ventes)
+        _spread_dates(Vente, created, positions, sales, days, 'date_vente', lambda age: today - timedelta(days=age))
+
+    for positions in _batches(purchases, batch_size):
+        achats = []
+        for _ in positions:
+            produit = rng.choice(produits)
+            quantite = rng.randint(5, 50)
+            achats.append(Achat(
+                produit=produit,
+                quantite=quantite,
+                prix_unitaire=produit.prix_achat,
+                montant=produit.prix_achat * quantite,
+            ))
+        created = Achat.objects.bulk_create(achats)
+        _spread_dates(Achat, created, positions, purchases, days, 'date_achat', lambda age: today - timedelta(days=age))
+
+    rebuild()
+
+    return {
+        "products": products,
+        "orders": orders,
+        "order_items": orders * items_per_order,
+        "sales": sales,
+        "purchases": purchases,
+    }
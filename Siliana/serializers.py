@@ -0,0 +1,184 @@
+"""JSON API serializers that work on .values() rows instead of model instances.
+
+Each resource declares its output fields once, as a mapping of output name
+to the values() lookup it reads and an optional converter. A `fields=`
+parameter picks a subset, and only the matching columns are selected.
+Orders fetch their items for a whole page or chunk in one query.
+
+orjson is used for encoding when it is installed; the output is the same
+with the standard library encoder, only slower.
+"""
+import json
+from itertools import islice
+
+from django.core.files.storage import default_storage
+from django.http import HttpResponse
+
+from .models import OrderItem
+
+try:
+    import orjson
+except ImportError:  # optional speed-up
+    orjson = None
+
+
+def dumps(data):
+    """Encode `data` as UTF-8 JSON bytes."""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+def json_response(data, status=200):
+    return HttpResponse(dumps(data), status=status, content_type='application/json')
+
+
+def _text(value):
+    return None if value is None else str(value)
+
+
+def _iso(value):
+    return None if value is None else value.isoformat()
+
+
+def _image_url(name, request):
+    if not name:
+        return None
+    url = default_storage.url(name)
+    return request.build_absolute_uri(url) if request is not None else url
+
+
+class Field:
+    """One output field: the values() lookup it reads and how to convert it."""
+
+    __slots__ = ('source', 'convert', 'uses_request')
+
+    def __init__(self, source, convert=None, uses_request=False):
+        self.source = source
+        self.convert = convert
+        self.uses_request = uses_request
+
+
+class Resource:
+    def __init__(self, fields):
+        self.fields = fields
+
+    def parse_fields(self, raw):
+        """Requested output names in declaration order.
+
+        `raw` is the comma-separated `fields` parameter; empty means all
+        fields. Raises ValueError naming any unknown field.
+        """
+        if not raw:
+            return tuple(self.fields)
+        requested = {name.strip() for name in raw.split(',') if name.strip()}
+        unknown = requested - set(self.fields)
+        if unknown:
+            raise ValueError(f"unknown fields: {', '.join(sorted(unknown))}")
+        return tuple(name for name in self.fields if name in requested)
+
+    def values(self, queryset, names, extra=()):
+        """`queryset.values()` with the columns `names` need, plus `extra`
+        (ordering keys and anything else the caller reads from the rows)."""
+        sources = [self.fields[name].source for name in names if self.fields[name].source]
+        return queryset.values(*dict.fromkeys([*sources, *extra]))
+
+    def serialize(self, rows, names, request=None):
+        """Turn a list of values() rows into output dicts."""
+        plan = []
+        for name in names:
+            field = self.fields[name]
+            if field.source is None:
+                continue
+            plan.append((name, field.source, field.convert, field.uses_request))
+        results = []
+        for row in rows:
+            item = {}
+            for name, source, convert, uses_request in plan:
+                value = row[source]
+                if convert is not None:
+                    value = convert(value, request) if uses_request else convert(value)
+                item[name] = value
+            results.append(item)
+        return results
+
+    def stream(self, rows, names, request=None, batch_size=2000):
+        """Serialize an iterator of rows lazily, `batch_size` rows at a time."""
+        rows = iter(rows)
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                return
+            yield from self.serialize(batch, names, request)
+
+
+class OrderResource(Resource):
+    """Orders embed their items, loaded for a whole batch of orders at once."""
+
+    def values(self, queryset, names, extra=()):
+        return super().values(queryset, names, ('id', *extra))
+
+    def serialize(self, rows, names, request=None):
+        results = super().serialize(rows, names, request)
+        if 'items' not in names:
+            return results
+        items = {row['id']: [] for row in rows}
+        lines = (
+            OrderItem.objects.filter(order_id__in=items).order_by('id')
+            .values_list('order_id', 'produit_id', 'produit__nom', 'quantite', 'prix')
+        )
+        for order_id, produit_id, nom, quantite, prix in lines:
+            items[order_id].append({
+                "product_id": produit_id,
+                "product_name": nom,
+                "quantity": quantite,
+                "price": str(prix),
+                "total": str(quantite * prix),
+            })
+        for row, result in zip(rows, results):
+            result['items'] = items[row['id']]
+        return results
+
+
+PRODUCTS = Resource({
+    "id": Field('id'),
+    "name": Field('nom'),
+    "description": Field('description'),
+    "stock_quantity": Field('quantite'),
+    "purchase_price": Field('prix_achat', _text),
+    "selling_price": Field('prix_vente', _text),
+    "image_url": Field('image', _image_url, uses_request=True),
+    "updated_at": Field('updated_at', _iso),
+})
+
+ORDERS = OrderResource({
+    "id": Field('id'),
+    "customer_name": Field('nom'),
+    "email": Field('email'),
+    "wilaya": Field('wilaya'),
+    "ville": Field('ville'),
+    "telephone": Field('telephone'),
+    "status": Field('status'),
+    "date_commande": Field('date_commande', _iso),
+    "total": Field('montant_total', _text),
+    "item_count": Field('nombre_articles'),
+    "updated_at": Field('updated_at', _iso),
+    "items": Field(None),
+})
+
+SALES = Resource({
+    "id": Field('id'),
+    "product_id": Field('produit_id'),
+    "product_name": Field('produit__nom'),
+    "quantity": Field('quantite'),
+    "unit_price": Field('prix_unitaire', _text),
+    "total": Field('montant', _text),
+    "date": Field('date_vente', _iso),
+    "updated_at": Field('updated_at', _iso),
+})
+
+TOMBSTONES = Resource({
+    "type": Field('model'),
+    "id": Field('object_id'),
+    "deleted_at": Field('deleted_at', _iso),
+})
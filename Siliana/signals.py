@@ -0,0 +1,100 @@
+from django.db.models import DecimalField, F, OuterRef, QuerySet, Subquery, Sum
+from django.db.models.signals import post_delete, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import changes, rollups
+from .models import Achat, Order, OrderItem, Produit, Tombstone, Vente
+
+
+def _deleted_with(origin, model):
+    """Whether the delete was started on `model` (an instance or a queryset)."""
+    return isinstance(origin, model) or (isinstance(origin, QuerySet) and origin.model is model)
+
+
+@receiver(pre_delete, sender=Produit, dispatch_uid='product_order_totals')
+def remove_product_from_order_totals(sender, instance, **kwargs):
+    items = OrderItem.objects.filter(order=OuterRef('pk'), produit=instance).values('order')
+    Order.objects.filter(pk__in=OrderItem.objects.filter(produit=instance).values('order_id')).update(
+        montant_total=F('montant_total') - Subquery(
+            items.annotate(s=Sum(F('quantite') * F('prix'))).values('s'),
+            output_field=DecimalField(max_digits=12, decimal_places=2),
+        ),
+        nombre_articles=F('nombre_articles') - Subquery(items.annotate(s=Sum('quantite')).values('s')),
+        updated_at=changes.now(),
+    )
+
+
+@receiver(post_delete, sender=OrderItem)
+def remove_item_from_order_totals(sender, instance, origin=None, **kwargs):
+    # Also runs for queryset and cascade deletes, which bypass Model.delete().
+    # Nothing to adjust when the order itself is being deleted; a product's
+    # items are taken off in one UPDATE before the cascade.
+    if _deleted_with(origin, Order) or _deleted_with(origin, Produit):
+        return
+    Order.add_to_totals(instance.order_id, -instance.quantite, -instance.total())
+
+
+# Rollup rows of a deleted product are removed by the cascade itself.
+@receiver(post_delete, sender=Vente, dispatch_uid='rollup_sale')
+def remove_sale_from_rollups(sender, instance, origin=None, **kwargs):
+    if _deleted_with(origin, Produit):
+        return
+    rollups.record_sale(
+        instance.date_vente, instance.produit_id, instance.quantite,
+        instance.montant, instance.cout_unitaire, sign=-1,
+    )
+
+
+@receiver(post_delete, sender=Achat, dispatch_uid='rollup_purchase')
+def remove_purchase_from_rollups(sender, instance, origin=None, **kwargs):
+    if _deleted_with(origin, Produit):
+        return
+    rollups.record_purchase(instance.date_achat, instance.produit_id, instance.quantite, instance.montant, sign=-1)
+
+
+@receiver(post_delete, sender=OrderItem, dispatch_uid='rollup_order_item')
+def remove_item_from_rollups(sender, instance, origin=None, **kwargs):
+    if _deleted_with(origin, Produit):
+        return
+    # The order row is deleted after its items, so it can still be read here
+    order = origin if isinstance(origin, Order) else Order.objects.filter(pk=instance.order_id).first()
+    rollups.record_order_lines(
+        rollups.order_day(order), [(instance.produit_id, instance.quantite, instance.prix)], sign=-1,
+    )
+
+
+TOMBSTONE_MODELS = {Produit: 'product', Order: 'order', Vente: 'sale'}
+
+
+@receiver(post_delete, sender=Produit, dispatch_uid='tombstone_product')
+@receiver(post_delete, sender=Order, dispatch_uid='tombstone_order')
+@receiver(post_delete, sender=Vente, dispatch_uid='tombstone_sale')
+def record_tombstone(sender, instance, origin=None, **kwargs):
+    # Connecting a receiver also stops Django from fast-deleting these rows
+    # in bulk, so queryset and cascade deletes are recorded too.
+    if sender is Vente and _deleted_with(origin, Produit):
+        return
+    Tombstone.objects.create(model=TOMBSTONE_MODELS[sender], object_id=instance.pk)
+
+
+@receiver(pre_delete, sender=Produit, dispatch_uid='tombstone_product_sales')
+def record_sale_tombstones(sender, instance, **kwargs):
+    # A product's sales go with it: record them in batches rather than
+    # one INSERT per cascaded row. bulk_create skips pre_save, so the
+    # stamp is checked here.
+    changes.now()
+    Tombstone.objects.bulk_create(
+        (Tombstone(model='sale', object_id=pk) for pk in instance.vente_set.values_list('pk', flat=True)),
+        batch_size=1000,
+    )
+
+
+
+@receiver(pre_save, sender=Produit, dispatch_uid='change_feed_product')
+@receiver(pre_save, sender=Order, dispatch_uid='change_feed_order')
+@receiver(pre_save, sender=Vente, dispatch_uid='change_feed_sale')
+@receiver(pre_save, sender=Tombstone, dispatch_uid='change_feed_tombstone')
+def check_change_feed_stamp(sender, instance, **kwargs):
+    # auto_now and the deleted_at default stamp these rows; register the
+    # same commit-lag check that changes.now() does for queryset updates.
+    changes.now()
@@ -0,0 +1,88 @@
+"""Stock mutations for Produit.quantite.
+
+Every change is a single conditional UPDATE on the quantity column, so
+concurrent POS terminals and public orders can never oversell and the
+product row (including its image) is never rewritten from Python.
+Queryset updates skip auto_now, so each one sets updated_at itself
+(through changes.now(), like every change feed stamp).
+"""
+from functools import reduce
+from operator import or_
+
+from django.db.models import Case, Exists, F, IntegerField, Q, Value, When
+from . import changes
+from .models import Produit
+
+
+class InsufficientStock(ValueError):
+    """Raised when a product does not have enough stock for a decrement."""
+
+    def __init__(self, message, produit_id=None):
+        super().__init__(message)
+        self.produit_id = produit_id
+
+
+def decrement_stock(produit_id, quantite, message=None):
+    """Atomically remove `quantite` units, or raise InsufficientStock.
+
+    The stock check is part of the UPDATE's WHERE clause, so no prior read
+    is needed and two concurrent callers cannot both take the last units.
+    """
+    updated = Produit.objects.filter(pk=produit_id, quantite__gte=quantite).update(
+        quantite=F('quantite') - quantite, updated_at=changes.now()
+    )
+    if not updated:
+        raise InsufficientStock(message or "❌ الكمية غير متوفرة في المخزون!", produit_id)
+
+
+def increment_stock(produit_id, quantite):
+    """Atomically add `quantite` units to a product."""
+    Produit.objects.filter(pk=produit_id).update(quantite=F('quantite') + quantite, updated_at=changes.now())
+
+
+def increment_stock_many(quantities):
+    """Add stock to several products in one UPDATE.
+
+    `quantities` maps produit_id -> units to add.
+    """
+    quantities = {pk: qty for pk, qty in quantities.items() if qty}
+    if not quantities:
+        return
+    delta = Case(
+        *[When(pk=pk, then=Value(qty)) for pk, qty in quantities.items()],
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+    Produit.objects.filter(pk__in=quantities).update(quantite=F('quantite') + delta, updated_at=changes.now())
+
+
+def decrement_stock_many(quantities):
+    """Remove stock from several products in one conditional UPDATE.
+
+    `quantities` maps produit_id -> units to remove. Either every product
+    has enough stock and all are decremented, or InsufficientStock is raised
+    naming one short product. Callers should still wrap this in
+    transaction.atomic() with the writes that depend on it.
+    """
+    quantities = {pk: qty for pk, qty in quantities.items() if qty}
+    if not quantities:
+        return
+    delta = Case(
+        *[When(pk=pk, then=Value(qty)) for pk, qty in quantities.items()],
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+    enough = reduce(or_, (Q(pk=pk, quantite__gte=qty) for pk, qty in quantities.items()))
+    short = Produit.objects.filter(
+        reduce(or_, (Q(pk=pk, quantite__lt=qty) for pk, qty in quantities.items()))
+    )
+    # Update nothing at all unless every product has enough
+    updated = (
+        Produit.objects.filter(enough)
+        .exclude(Exists(short))
+        .update(quantite=F('quantite') - delta, updated_at=changes.now())
+    )
+    if updated != len(quantities):
+        stock = dict(Produit.objects.filter(pk__in=quantities).values_list('pk', 'quantite'))
+        short_id = next((pk for pk, qty in quantities.items() if stock.get(pk, 0) < qty), None)
+        raise InsufficientStock("❌ الكمية غير متوفرة في المخزون!", short_id)
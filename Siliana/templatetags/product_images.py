@@ -0,0 +1,19 @@
+from django import template
+from django.urls import reverse
+
+from ..images import VARIANT_WIDTHS
+
+register = template.Library()
+
+
+@register.simple_tag
+def product_image_url(produit, width=320, fmt='jpg'):
+    """Immutable URL of one pre-generated derivative of a product image."""
+    return reverse('serve_product_image_variant', args=[produit.id, produit.image_hash, width, fmt])
+
+
+@register.simple_tag
+def product_srcset(produit, fmt='webp', max_width=None):
+    """`srcset` value listing every derivative width in the given format."""
+    widths = [w for w in VARIANT_WIDTHS if max_width is None or w <= max_width]
+    return ", ".join(f"{product_image_url(produit, w, fmt)} {w}w" for w in widths)
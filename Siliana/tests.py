@@ -1,9 +1,45 @@
+import csv
+import gzip
+import json
 import os
+import random
+import re
+import shutil
+import tempfile
+import threading
 from decimal import Decimal
+from datetime import date, timedelta
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
 
-from django.test import TestCase, override_settings
+from django.contrib.admin.models import LogEntry
+from django.contrib.auth.models import User
+from django.contrib.messages import ERROR, get_messages
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail.backends import locmem
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection
+from django.db.models import Sum
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from openpyxl import load_workbook
+from PIL import Image
 
-from .models import Order, Produit
+from .image_cache import ImageCache, get_image_cache
+from .images import VARIANT_FORMATS, VARIANT_WIDTHS
+from .management.commands.benchmark_urls import admin_cases, rolled_back, site_cases
+from .middleware import SQLInstrumentationMiddleware, query_shape
+from .models import Achat, DailySalesRollup, EmailOutbox, Order, OrderItem, Produit, ProduitImage, ProduitImageVariant, Tombstone, Vente
+from .outbox import drain_outbox, queue_mail
+from .pagination import EstimatedCountPaginator, encode_cursor
+from .reporting import REPORTING_VIEWS
+from .rollups import ROLLUP_FIELDS, rebuild, record_order_days
+from .seeding import WILAYAS, seed
+from .stock import InsufficientStock, decrement_stock, decrement_stock_many
 
 
 @override_settings(ALLOWED_HOSTS=["testserver", "localhost", "127.0.0.1"])
@@ -38,6 +74,13 @@ class PublicOrderTests(TestCase):
         resp = self.client.get("/product/")
         self.assertEqual(resp.status_code, 200)
 
+    def test_public_pages_fall_back_to_uploaded_file_without_hash(self):
+        # e.g. a file kept on Cloudinary whose bytes were never stored here
+        Produit.objects.filter(pk=self.produit.pk).update(image="products/legacy.jpg")
+        for url in ("/product/", f"/product/{self.produit.id}/", "/order/"):
+            with self.subTest(url):
+                self.assertContains(self.client.get(url), "/media/products/legacy.jpg")
+
     def test_cart_page_renders(self):
         resp = self.client.get("/cart/")
         self.assertEqual(resp.status_code, 200)
@@ -99,6 +142,67 @@ class PublicOrderTests(TestCase):
         self.produit.refresh_from_db()
         self.assertEqual(self.produit.quantite, 8)
 
+    def _post_order(self, quantities):
+        self._set_env(PHONE_VERIFICATION_MODE="static_code", PHONE_VERIFICATION_CODE="20707272")
+        data = {
+            "nom": "Client",
+            "wilaya": "تونس",
+            "ville": "Tunis",
+            "telephone": "+21620123456",
+            "manual_verification_code": "20707272",
+        }
+        data.update({f"product_{produit.id}": str(qty) for produit, qty in quantities})
+        return self.client.post("/order/", data=data)
+
+    def test_post_updates_daily_rollups(self):
+        self._post_order([(self.produit, 2)])
+        row = DailySalesRollup.objects.get(produit=self.produit)
+        self.assertEqual(row.order_quantity, 2)
+        self.assertEqual(row.order_revenue, 2 * self.produit.prix_vente)
+
+    def test_post_several_products_creates_one_order_with_totals(self):
+        other = Produit.objects.create(
+            nom="Autre", quantite=4, prix_achat=Decimal("1.00"), prix_vente=Decimal("3.00"),
+        )
+        resp = self._post_order([(self.produit, 2), (other, 3)])
+        self.assertEqual(resp.status_code, 302)
+
+        order = Order.objects.get()
+        self.assertEqual(order.orderitem_set.count(), 2)
+        self.assertEqual(order.montant_total, Decimal("24.00"))
+        self.assertEqual(order.nombre_articles, 5)
+        self.produit.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual((self.produit.quantite, other.quantite), (8, 1))
+
+    def test_post_insufficient_stock_creates_nothing(self):
+        other = Produit.objects.create(
+            nom="Autre", quantite=1, prix_achat=Decimal("1.00"), prix_vente=Decimal("3.00"),
+        )
+        resp = self._post_order([(self.produit, 2), (other, 3)])
+        self.assertEqual(resp.status_code, 200)
+        self.assertContains(resp, "الكمية المطلوبة من Autre غير متوفرة")
+
+        self.assertEqual(Order.objects.count(), 0)
+        self.assertEqual(OrderItem.objects.count(), 0)
+        self.produit.refresh_from_db()
+        self.assertEqual(self.produit.quantite, 10)
+
+    def test_post_queries_do_not_grow_with_catalog(self):
+        def count_queries():
+            with CaptureQueriesContext(connection) as ctx:
+                resp = self._post_order([(self.produit, 1)])
+            self.assertEqual(resp.status_code, 302)
+            return len(ctx.captured_queries)
+
+        count_queries()  # the day's first order also creates its rollup rows
+        small = count_queries()
+        Produit.objects.bulk_create(
+            Produit(nom=f"P{i}", quantite=5, prix_achat=Decimal("1.00"), prix_vente=Decimal("2.00"))
+            for i in range(200)
+        )
+        self.assertEqual(count_queries(), small)
+
     def test_post_firebase_mode_missing_token_does_not_create_order(self):
         self._set_env(PHONE_VERIFICATION_MODE="firebase")
 
@@ -115,3 +219,1643 @@ class PublicOrderTests(TestCase):
 
         self.assertEqual(resp.status_code, 200)
         self.assertEqual(Order.objects.count(), 0)
+
+
+class StockMutationTests(TestCase):
+    def setUp(self):
+        self.produit = Produit.objects.create(
+            nom="Figuier",
+            quantite=5,
+            prix_achat=Decimal("5.00"),
+            prix_vente=Decimal("7.50"),
+        )
+
+    def test_decrement_rejects_insufficient_stock(self):
+        with self.assertRaises(InsufficientStock):
+            decrement_stock(self.produit.id, 6)
+        self.produit.refresh_from_db()
+        self.assertEqual(self.produit.quantite, 5)
+
+    def test_order_item_reads_product_name_only_when_short(self):
+        order = Order.objects.create(nom="Client", wilaya="تونس", ville="Tunis", telephone="20123456")
+        with CaptureQueriesContext(connection) as ctx:
+            OrderItem(order=order, produit_id=self.produit.id, quantite=2, prix=Decimal("7.50")).save()
+        self.assertFalse([q for q in ctx.captured_queries if q['sql'].startswith('SELECT') and '"Siliana_produit"' in q['sql']])
+
+        with self.assertRaises(InsufficientStock) as raised:
+            OrderItem(order=order, produit_id=self.produit.id, quantite=4, prix=Decimal("7.50")).save()
+        self.assertEqual(str(raised.exception), "❌ الكمية المطلوبة من Figuier غير متوفرة!")
+        self.assertEqual(raised.exception.produit_id, self.produit.id)
+
+    def test_decrement_updates_only_quantity_column(self):
+        with self.assertNumQueries(1) as ctx:
+            decrement_stock(self.produit.id, 2)
+        sql = ctx.captured_queries[0]['sql']
+        set_clause = sql[sql.index(' SET ') + len(' SET '):sql.index(' WHERE ')]
+        # Quantity plus the change feed stamp; the rest of the row is untouched
+        self.assertEqual(re.findall(r'(?:^|, )"(\w+)" = ', set_clause), ['quantite', 'updated_at'])
+        self.produit.refresh_from_db()
+        self.assertEqual(self.produit.quantite, 3)
+
+    def test_vente_and_achat_adjust_stock(self):
+        Vente.objects.create(produit=self.produit, quantite=4)
+        Achat.objects.create(produit=self.produit, quantite=10)
+        self.produit.refresh_from_db()
+        self.assertEqual(self.produit.quantite, 11)
+
+    def test_failed_vente_is_not_recorded(self):
+        with self.assertRaises(ValueError):
+            Vente.objects.create(produit=self.produit, quantite=6)
+        self.assertEqual(Vente.objects.count(), 0)
+
+    def test_cancelling_order_restores_stock_once(self):
+        order = Order.objects.create(nom="Client", wilaya="تونس", ville="Tunis", telephone="20123456")
+        OrderItem.objects.create(order=order, produit=self.produit, quantite=2, prix=self.produit.prix_vente)
+        OrderItem.objects.create(order=order, produit=self.produit, quantite=1, prix=self.produit.prix_vente)
+        order.status = 'cancelled'
+        order.save()
+        order.save()
+        self.produit.refresh_from_db()
+        self.assertEqual(self.produit.quantite, 5)
+
+    def test_decrement_many_is_all_or_nothing(self):
+        other = Produit.objects.create(
+            nom="Olivier", quantite=1, prix_achat=Decimal("1.00"), prix_vente=Decimal("2.00"),
+        )
+        with self.assertRaises(InsufficientStock) as ctx:
+            decrement_stock_many({self.produit.id: 2, other.id: 3})
+        self.assertEqual(ctx.exception.produit_id, other.id)
+        self.produit.refresh_from_db()
+        self.assertEqual(self.produit.quantite, 5)
+
+        with self.assertNumQueries(1):
+            decrement_stock_many({self.produit.id: 2, other.id: 1})
+        self.produit.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual((self.produit.quantite, other.quantite), (3, 0))
+
+
+class StockConcurrencyTests(TransactionTestCase):
+    workers = 8
+    attempts_per_worker = 5
+
+    def test_concurrent_decrements_never_oversell(self):
+        produit = Produit.objects.create(
+            nom="Figuier",
+            quantite=10,
+            prix_achat=Decimal("5.00"),
+            prix_vente=Decimal("7.50"),
+        )
+        sold = []
+        rejected = []
+        lock = threading.Lock()
+        start = threading.Barrier(self.workers)
+
+        def worker():
+            start.wait()
+            try:
+                for _ in range(self.attempts_per_worker):
+                    while True:
+                        try:
+                            decrement_stock(produit.id, 1)
+                        except InsufficientStock:
+                            outcome = rejected
+                        except OperationalError:
+                            # SQLite's shared in-memory test database reports
+                            # write contention instead of waiting; retry.
+                            continue
+                        else:
+                            outcome = sold
+                        break
+                    with lock:
+                        outcome.append(1)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        produit.refresh_from_db()
+        self.assertEqual(len(sold), 10)
+        self.assertEqual(len(rejected), self.workers * self.attempts_per_worker - 10)
+        self.assertEqual(produit.quantite, 0)
+
+
+def use_temp_media(testcase):
+    """Point MEDIA_ROOT and the image disk cache at a throwaway directory."""
+    media_root = tempfile.mkdtemp()
+    testcase.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+    settings_override = override_settings(
+        MEDIA_ROOT=media_root,
+        PRODUCT_IMAGE_CACHE_DIR=os.path.join(media_root, "image_cache"),
+    )
+    settings_override.enable()
+    testcase.addCleanup(settings_override.disable)
+    return media_root
+
+
+class ProductImageStorageTests(TestCase):
+    def setUp(self):
+        use_temp_media(self)
+
+        self.produit = Produit.objects.create(
+            nom="Figuier",
+            quantite=5,
+            prix_achat=Decimal("5.00"),
+            prix_vente=Decimal("7.50"),
+        )
+        self.produit.image = SimpleUploadedFile("fig.png", b"\x89PNG fake bytes", content_type="image/png")
+        self.produit.save()
+
+    def test_upload_stores_bytes_in_image_table(self):
+        self.assertTrue(self.produit.has_image())
+        self.assertEqual(self.produit.image_type, "image/png")
+        self.assertEqual(bytes(ProduitImage.objects.get(produit=self.produit).data), b"\x89PNG fake bytes")
+
+    def test_serve_product_image_returns_bytes(self):
+        resp = self.client.get(f"/product-image/{self.produit.id}/")
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp["Content-Type"], "image/png")
+        self.assertEqual(resp.content, b"\x89PNG fake bytes")
+
+    def test_catalog_queries_do_not_touch_image_bytes(self):
+        with self.assertNumQueries(1) as ctx:
+            self.client.get("/product/")
+        self.assertNotIn("siliana_produitimage", ctx.captured_queries[0]["sql"].lower())
+
+
+def make_png(width=1200, height=900):
+    buffer = BytesIO()
+    Image.new("RGBA", (width, height), (120, 60, 30, 255)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class ProductImageVariantTests(TestCase):
+    def setUp(self):
+        use_temp_media(self)
+
+        self.original = make_png()
+        self.produit = Produit.objects.create(
+            nom="Figuier",
+            quantite=5,
+            prix_achat=Decimal("5.00"),
+            prix_vente=Decimal("7.50"),
+        )
+        self.produit.image = SimpleUploadedFile("fig.png", self.original, content_type="image/png")
+        self.produit.save()
+
+    def test_save_generates_every_variant(self):
+        variants = ProduitImageVariant.objects.filter(produit=self.produit)
+        self.assertEqual(variants.count(), len(VARIANT_WIDTHS) * len(VARIANT_FORMATS))
+        for variant in variants:
+            with Image.open(BytesIO(bytes(variant.data))) as img:
+                self.assertEqual(img.width, variant.width)
+                self.assertEqual(img.format, VARIANT_FORMATS[variant.format][0])
+
+    def test_variant_endpoint_serves_small_image(self):
+        resp = self.client.get(f"/product-image/{self.produit.id}/{self.produit.image_hash}/64.webp")
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp["Content-Type"], "image/webp")
+        self.assertLess(len(resp.content), len(self.original) // 10)
+
+    def test_unknown_variant_is_404(self):
+        resp = self.client.get(f"/product-image/{self.produit.id}/{self.produit.image_hash}/100.webp")
+        self.assertEqual(resp.status_code, 404)
+
+    def test_missing_variants_fall_back_to_original(self):
+        ProduitImageVariant.objects.all().delete()
+        resp = self.client.get(f"/product-image/{self.produit.id}/{self.produit.image_hash}/320.jpg")
+        self.assertRedirects(
+            resp, f"/product-image/{self.produit.id}/{self.produit.image_hash}/", fetch_redirect_response=False
+        )
+
+    def test_catalog_renders_srcset(self):
+        resp = self.client.get("/product/")
+        self.assertContains(resp, f"/product-image/{self.produit.id}/{self.produit.image_hash}/640.webp 640w")
+
+
+class ProductImageCachingTests(TestCase):
+    def setUp(self):
+        use_temp_media(self)
+
+        self.produit = Produit.objects.create(
+            nom="Figuier",
+            quantite=5,
+            prix_achat=Decimal("5.00"),
+            prix_vente=Decimal("7.50"),
+        )
+        self.produit.image = SimpleUploadedFile("fig.png", make_png(200, 150), content_type="image/png")
+        self.produit.save()
+        self.url = f"/product-image/{self.produit.id}/{self.produit.image_hash}/"
+
+    def test_hashed_url_is_immutable_with_validators(self):
+        resp = self.client.get(self.url)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp["ETag"], f'"{self.produit.image_hash}"')
+        self.assertIn("Last-Modified", resp)
+        self.assertIn("immutable", resp["Cache-Control"])
+
+    def test_if_none_match_answers_304_without_loading_bytes(self):
+        with self.assertNumQueries(1) as ctx:
+            resp = self.client.get(self.url, HTTP_IF_NONE_MATCH=f'"{self.produit.image_hash}"')
+        self.assertEqual(resp.status_code, 304)
+        self.assertNotIn("produitimage", ctx.captured_queries[0]["sql"].lower())
+
+    def test_if_modified_since_answers_304(self):
+        last_modified = self.client.get(self.url)["Last-Modified"]
+        resp = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(resp.status_code, 304)
+
+    def test_head_does_not_read_bytes(self):
+        with self.assertNumQueries(1):
+            resp = self.client.head(f"{self.url}160.webp")
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp["Content-Type"], "image/webp")
+
+    def test_stale_hash_redirects_to_current_image(self):
+        old_url = self.url
+        self.produit.image = SimpleUploadedFile("fig2.png", make_png(300, 150), content_type="image/png")
+        self.produit.save()
+        resp = self.client.get(old_url)
+        self.assertRedirects(
+            resp, f"/product-image/{self.produit.id}/{self.produit.image_hash}/", fetch_redirect_response=False
+        )
+
+
+class ProductImageDiskCacheTests(TestCase):
+    def setUp(self):
+        use_temp_media(self)
+        get_image_cache().clear()
+        self.produit = Produit.objects.create(
+            nom="Figuier",
+            quantite=5,
+            prix_achat=Decimal("5.00"),
+            prix_vente=Decimal("7.50"),
+        )
+        self.produit.image = SimpleUploadedFile("fig.png", make_png(200, 150), content_type="image/png")
+        self.produit.save()
+        self.url = f"/product-image/{self.produit.id}/{self.produit.image_hash}/320.webp"
+
+    def test_second_request_is_served_from_disk(self):
+        first = self.client.get(self.url)
+        self.assertEqual(first["X-Image-Cache"], "MISS")
+
+        with self.assertNumQueries(1):
+            second = self.client.get(self.url)
+        self.assertEqual(second["X-Image-Cache"], "HIT")
+        self.assertEqual(b"".join(second.streaming_content), first.content)
+
+        stats = get_image_cache().stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["files"]), (1, 1, 1))
+
+    def test_eviction_keeps_cache_under_size_bound(self):
+        image_cache = get_image_cache()
+        image_cache.max_bytes = 2500
+        for i in range(5):
+            image_cache.put(f"key-{i}", b"x" * 1000)
+            os.utime(image_cache.path_for(f"key-{i}"), (i, i))
+        stats = image_cache.stats()
+        self.assertLessEqual(stats["bytes"], 2500)
+        self.assertTrue(os.path.exists(image_cache.path_for("key-4")))
+        self.assertFalse(os.path.exists(image_cache.path_for("key-0")))
+
+    def test_put_under_the_bound_does_not_scan_the_directory(self):
+        image_cache = get_image_cache()
+        image_cache.max_bytes = 2500
+        image_cache.put("key-0", b"x" * 1000)
+        with mock.patch.object(ImageCache, "_entries", wraps=image_cache._entries) as entries:
+            image_cache.put("key-1", b"x" * 1000)
+            self.assertEqual(entries.call_count, 0)
+            image_cache.put("key-2", b"x" * 1000)
+            self.assertEqual(entries.call_count, 1)
+        self.assertLessEqual(image_cache.stats()["bytes"], 2500)
+
+    def test_counter_logs_are_folded_into_a_total(self):
+        image_cache = get_image_cache()
+        with mock.patch("Siliana.image_cache.STATS_ROLL_BYTES", 10):
+            for _ in range(95):
+                image_cache.open("missing")
+        self.assertEqual(image_cache.stats()["misses"], 95)
+        live = os.path.join(image_cache.directory, ".stats-misses")
+        self.assertLess(os.path.getsize(live), 10)
+        self.assertTrue(os.path.exists(live + ".total"))
+
+    def test_counters_are_shared_through_the_directory(self):
+        # Separate instances stand in for separate workers
+        get_image_cache().open("missing")
+        get_image_cache().open("missing")
+        cache.clear()
+        self.assertEqual(get_image_cache().stats()["misses"], 2)
+
+
+class OrderStoredTotalsTests(TestCase):
+    def setUp(self):
+        self.produit = Produit.objects.create(
+            nom="Figuier",
+            quantite=50,
+            prix_achat=Decimal("5.00"),
+            prix_vente=Decimal("7.50"),
+        )
+        self.order = Order.objects.create(nom="Client", wilaya="تونس", ville="Tunis", telephone="20123456")
+
+    def add_item(self, quantite, prix="7.50"):
+        return OrderItem.objects.create(order=self.order, produit=self.produit, quantite=quantite, prix=Decimal(prix))
+
+    def assertTotals(self, montant, nombre):
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.montant_total, Decimal(montant))
+        self.assertEqual(self.order.nombre_articles, nombre)
+
+    def test_totals_follow_item_create_change_and_delete(self):
+        item = self.add_item(2)
+        self.add_item(1, "10.00")
+        self.assertEqual(self.order.total(), Decimal("25.00"))
+        self.assertTotals("25.00", 3)
+
+        item.quantite = 4
+        item.save()
+        self.assertTotals("40.00", 5)
+
+        item.delete()
+        self.assertTotals("10.00", 1)
+
+        OrderItem.objects.filter(order=self.order).delete()
+        self.assertTotals("0", 0)
+
+    def test_saving_stale_order_keeps_totals(self):
+        stale = Order.objects.get(pk=self.order.pk)
+        self.add_item(2)
+        stale.status = 'confirmed'
+        stale.save()
+        self.assertTotals("15.00", 2)
+
+    def test_recompute_command_backfills_totals(self):
+        self.add_item(2)
+        Order.objects.update(montant_total=0, nombre_articles=0)
+        call_command("recompute_order_totals", stdout=StringIO())
+        self.assertTotals("15.00", 2)
+
+    @override_settings(EXTERNAL_API_KEY="secret")
+    def test_api_total_filters(self):
+        self.add_item(2)
+
+        def ids(**params):
+            resp = self.client.get("/api/orders/", params, HTTP_X_API_KEY="secret")
+            return resp.status_code, [row["id"] for row in resp.json().get("results", [])]
+
+        self.assertEqual(ids(min_total="15.00"), (200, [self.order.id]))
+        self.assertEqual(ids(max_total="14.99"), (200, []))
+        for value in ("abc", "NaN", "Infinity", "-Infinity", "sNaN"):
+            with self.subTest(value=value):
+                self.assertEqual(ids(min_total=value), (400, []))
+                self.assertEqual(ids(max_total=value), (400, []))
+
+
+class VentePriceSnapshotTests(TestCase):
+    def setUp(self):
+        self.produit = Produit.objects.create(
+            nom="Figuier",
+            quantite=50,
+            prix_achat=Decimal("5.00"),
+            prix_vente=Decimal("7.50"),
+        )
+
+    def test_price_edit_does_not_change_past_revenue(self):
+        vente = Vente.objects.create(produit=self.produit, quantite=2)
+        self.produit.prix_vente = Decimal("9.00")
+        self.produit.save()
+        Vente.objects.create(produit=self.produit, quantite=1)
+
+        vente.refresh_from_db()
+        self.assertEqual(vente.prix_unitaire, Decimal("7.50"))
+        self.assertEqual(vente.total(), Decimal("15.00"))
+        self.assertEqual(Vente.objects.aggregate(total=Sum("montant"))["total"], Decimal("24.00"))
+
+    def test_home_revenue_uses_single_aggregate(self):
+        Vente.objects.create(produit=self.produit, quantite=2)
+        Vente.objects.create(produit=self.produit, quantite=3)
+        self.client.force_login(User.objects.create_user("staff", password="x"))
+        resp = self.client.get("/")
+        self.assertEqual(resp.context["sales_today"], 2)
+        self.assertEqual(resp.context["revenue_today"], Decimal("37.50"))
+
+
+class SalesReportTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_user("staff", password="x"))
+        self.figuier = Produit.objects.create(
+            nom="Figuier", quantite=0, prix_achat=Decimal("5.00"), prix_vente=Decimal("7.50")
+        )
+        self.olivier = Produit.objects.create(
+            nom="Olivier", quantite=0, prix_achat=Decimal("8.00"), prix_vente=Decimal("10.00")
+        )
+        ventes = []
+        for i in range(120):
+            produit = self.figuier if i % 2 else self.olivier
+            ventes.append(Vente(
+                produit=produit,
+                quantite=1,
+                prix_unitaire=produit.prix_vente,
+                cout_unitaire=produit.prix_achat,
+                montant=produit.prix_vente,
+            ))
+        Vente.objects.bulk_create(ventes)
+        for i, pk in enumerate(Vente.objects.order_by("id").values_list("id", flat=True)):
+            Vente.objects.filter(pk=pk).update(date_vente=date(2025, 1, 1) + timedelta(days=i // 10))
+
+    def test_grand_total_covers_whole_range_while_page_is_bounded(self):
+        resp = self.client.get("/sales/report/")
+        self.assertEqual(resp.context["count"], 120)
+        self.assertEqual(resp.context["total"], Decimal("1050.00"))
+        self.assertEqual(len(resp.context["ventes"]), 50)
+
+    def test_keyset_pages_cover_every_sale_once(self):
+        pages = []
+        params = {}
+        while True:
+            resp = self.client.get("/sales/report/", params)
+            pages.append([v.id for v in resp.context["ventes"]])
+            page = resp.context["page"]
+            if not page.has_next:
+                break
+            params = {"after": page.next_cursor}
+        seen = [pk for ids in pages for pk in ids]
+        self.assertEqual([len(ids) for ids in pages], [50, 50, 20])
+        self.assertEqual(len(set(seen)), 120)
+
+        back = self.client.get("/sales/report/", {"before": page.previous_cursor})
+        self.assertEqual([v.id for v in back.context["ventes"]], pages[-2])
+
+    def test_wrongly_typed_cursor_falls_back_to_first_page(self):
+        first = [v.id for v in self.client.get("/sales/report/").context["ventes"]]
+        # ["x", 1]: well-formed, but "x" is no date
+        for params in ({"after": "WyJ4IiwxXQ"}, {"before": "WyJ4IiwxXQ"}):
+            resp = self.client.get("/sales/report/", params)
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual([v.id for v in resp.context["ventes"]], first)
+        resp = self.client.get("/sales/report/", {"group": "day", "after": encode_cursor(["x"])})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(resp.context["days"]), 12)
+
+    def test_query_count_does_not_depend_on_rows(self):
+        with self.assertNumQueries(4):  # session, user, aggregate, page
+            self.client.get("/sales/report/")
+
+    def test_group_by_day_and_product(self):
+        resp = self.client.get("/sales/report/", {"group": "day", "date_debut": "2025-01-01", "date_fin": "2025-01-03"})
+        self.assertEqual(resp.context["count"], 30)
+        self.assertEqual([row["count"] for row in resp.context["days"]], [10, 10, 10])
+
+        resp = self.client.get("/sales/report/", {"group": "product"})
+        totals = {row["produit__nom"]: row["total"] for row in resp.context["product_totals"]}
+        self.assertEqual(totals, {"Olivier": Decimal("600.00"), "Figuier": Decimal("450.00")})
+
+
+def seed_orders(count, produit, items_per_order=2):
+    """Bulk-create `count` orders with items, bypassing stock checks."""
+    orders = Order.objects.bulk_create([
+        Order(
+            nom=f"Client {i}",
+            wilaya=("تونس", "سليانة", "صفاقس")[i % 3],
+            ville="Ville",
+            telephone="20123456",
+            montant_total=produit.prix_vente * items_per_order,
+            nombre_articles=items_per_order,
+        )
+        for i in range(count)
+    ])
+    OrderItem.objects.bulk_create([
+        OrderItem(order=order, produit=produit, quantite=1, prix=produit.prix_vente)
+        for order in orders
+        for _ in range(items_per_order)
+    ])
+    return orders
+
+
+class OrdersListTests(TestCase):
+    # session, user, orders page, prefetched items (+ products joined), wilayas
+    QUERY_BUDGET = 5
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_user("staff", password="x"))
+        self.produit = Produit.objects.create(
+            nom="Figuier", quantite=0, prix_achat=Decimal("5.00"), prix_vente=Decimal("7.50")
+        )
+
+    def assertQueryBudget(self, order_count):
+        seed_orders(order_count, self.produit)
+        with self.assertNumQueries(self.QUERY_BUDGET):
+            resp = self.client.get("/orders/")
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(resp.context["orders"]), min(order_count, 50))
+        return resp
+
+    def test_query_budget_10_orders(self):
+        resp = self.assertQueryBudget(10)
+        self.assertFalse(resp.context["page"].has_next)
+
+    def test_query_budget_1000_orders(self):
+        self.assertQueryBudget(1000)
+
+    def test_query_budget_10000_orders(self):
+        resp = self.assertQueryBudget(10000)
+        with self.assertNumQueries(self.QUERY_BUDGET):
+            self.client.get("/orders/", {"after": resp.context["page"].next_cursor, "status": "pending"})
+
+    def test_pages_walk_newest_first(self):
+        seed_orders(120, self.produit)
+        ids = []
+        params = {}
+        while True:
+            resp = self.client.get("/orders/", params)
+            ids.extend(order.id for order in resp.context["orders"])
+            if not resp.context["page"].has_next:
+                break
+            params = {"after": resp.context["page"].next_cursor}
+        self.assertEqual(ids, sorted(ids, reverse=True))
+        self.assertEqual(len(ids), 120)
+
+    def test_wrongly_typed_cursor_falls_back_to_first_page(self):
+        seed_orders(60, self.produit)
+        first = [order.id for order in self.client.get("/orders/").context["orders"]]
+        for params in ({"after": encode_cursor(["x", 1])}, {"before": encode_cursor([1, "y"])}):
+            resp = self.client.get("/orders/", params)
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual([order.id for order in resp.context["orders"]], first)
+
+
+class ExportOrdersTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_user("staff", password="x"))
+        self.produit = Produit.objects.create(
+            nom="Figuier", quantite=0, prix_achat=Decimal("5.00"), prix_vente=Decimal("7.50")
+        )
+        self.orders = seed_orders(30, self.produit)
+        self.ids = [order.id for order in self.orders]
+
+    def test_xlsx_export(self):
+        resp = self.client.post("/orders/export/", {"order_ids": self.ids})
+        self.assertEqual(resp.status_code, 200)
+        wb = load_workbook(BytesIO(b"".join(resp.streaming_content)))
+        rows = list(wb.active.iter_rows(values_only=True))
+        self.assertEqual(rows[0][0], "#")
+        self.assertEqual(len(rows), 31)
+        self.assertEqual(rows[1][6], "Figuier × 1\nFiguier × 1")
+        self.assertEqual(rows[1][7], "15.00 د.ت")
+
+    def test_csv_export_streams(self):
+        resp = self.client.post("/orders/export/", {"order_ids": self.ids, "format": "csv"})
+        self.assertTrue(resp.streaming)
+        rows = list(csv.reader(b"".join(resp.streaming_content).decode().splitlines()))
+        self.assertEqual(len(rows), 31)
+        self.assertEqual(rows[1][6], "Figuier × 1 | Figuier × 1")
+
+    def test_export_query_count_is_constant(self):
+        # session, user, orders, prefetched items
+        with self.assertNumQueries(4):
+            resp = self.client.post("/orders/export/", {"order_ids": self.ids, "format": "csv"})
+            b"".join(resp.streaming_content)
+
+
+class _CountingBackend(locmem.EmailBackend):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.opened = 0
+
+    def open(self):
+        self.opened += 1
+
+
+class _FailingBackend:
+    """Mail backend whose send always raises, for retry tests."""
+
+    def __init__(self, *args, **kwargs):
+        self.opened = 0
+
+    def open(self):
+        self.opened += 1
+
+    def close(self):
+        pass
+
+    def send_messages(self, messages):
+        raise OSError("smtp down")
+
+
+class EmailOutboxTests(TestCase):
+    def test_order_queues_mail_instead_of_sending(self):
+        produit = Produit.objects.create(
+            nom="Figuier", quantite=5, prix_achat=Decimal("5.00"), prix_vente=Decimal("7.50"),
+        )
+        os.environ["PHONE_VERIFICATION_MODE"] = "static_code"
+        os.environ["PHONE_VERIFICATION_CODE"] = "20707272"
+        self.addCleanup(os.environ.pop, "PHONE_VERIFICATION_MODE", None)
+        self.addCleanup(os.environ.pop, "PHONE_VERIFICATION_CODE", None)
+
+        resp = self.client.post("/order/", {
+            "nom": "Client", "email": "client@example.com", "wilaya": "تونس", "ville": "Tunis",
+            "telephone": "20123456", "manual_verification_code": "20707272",
+            f"product_{produit.id}": "1",
+        })
+        self.assertEqual(resp.status_code, 302)
+        self.assertEqual(len(mail.outbox), 0)
+        queued = EmailOutbox.objects.get()
+        self.assertEqual(queued.recipients, ["client@example.com"])
+        self.assertEqual(queued.status, "pending")
+
+    def test_drain_sends_over_one_connection(self):
+        for i in range(5):
+            queue_mail(f"Sujet {i}", "Corps", [f"c{i}@example.com"])
+
+        backend = _CountingBackend()
+        sent, failed = drain_outbox(batch_size=2, connection=backend)
+        self.assertEqual((sent, failed), (5, 0))
+        self.assertEqual(backend.opened, 1)
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertEqual(EmailOutbox.objects.filter(status="sent").count(), 5)
+        self.assertEqual(drain_outbox(), (0, 0))
+
+    def test_failures_back_off_then_give_up(self):
+        message = queue_mail("Sujet", "Corps", ["c@example.com"])
+        backend = _FailingBackend()
+
+        self.assertEqual(drain_outbox(max_attempts=2, connection=backend), (0, 1))
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.attempts), ("pending", 1))
+        self.assertIn("smtp down", message.last_error)
+        self.assertGreater(message.next_attempt_at, timezone.now())
+        # Not due yet
+        self.assertEqual(drain_outbox(max_attempts=2, connection=backend), (0, 0))
+
+        EmailOutbox.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(drain_outbox(max_attempts=2, connection=backend), (0, 1))
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.attempts), ("failed", 2))
+
+    def test_send_outbox_command(self):
+        queue_mail("Sujet", "Corps", ["c@example.com"])
+        out = StringIO()
+        call_command("send_outbox", stdout=out)
+        self.assertIn("Sent 1", out.getvalue())
+        self.assertEqual(len(mail.outbox), 1)
+
+
+@override_settings(EXTERNAL_API_KEY="secret")
+class ApiCursorPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.produit = Produit.objects.create(
+            nom="Figuier", quantite=0, prix_achat=Decimal("5.00"), prix_vente=Decimal("7.50")
+        )
+        self.orders = seed_orders(25, self.produit, items_per_order=1)
+
+    def get(self, url, **params):
+        return self.client.get(url, params, HTTP_X_API_KEY="secret")
+
+    def test_next_links_walk_every_order_once(self):
+        seen = []
+        resp = self.get("/api/orders/", limit=10)
+        while True:
+            body = resp.json()
+            seen.extend(row["id"] for row in body["results"])
+            if not body["next"]:
+                break
+            self.assertTrue(body["next"].startswith("http://testserver/api/orders/?"))
+            resp = self.client.get(body["next"], HTTP_X_API_KEY="secret")
+        self.assertEqual(len(seen), 25)
+        self.assertEqual(set(seen), {order.id for order in self.orders})
+        self.assertEqual(body["count"], 25)
+
+        previous = self.client.get(body["previous"], HTTP_X_API_KEY="secret").json()
+        self.assertEqual([row["id"] for row in previous["results"]], seen[10:20])
+
+    def test_deep_page_costs_the_same_as_first(self):
+        first = self.get("/api/orders/", limit=5, count="false")
+        self.assertIsNone(first.json()["count"])
+        after = first.json()["next"].split("after=")[1]
+        # orders page, then items joined with product names
+        with self.assertNumQueries(2):
+            self.get("/api/orders/", limit=5, count="false", after=after)
+
+    def test_count_is_cached_per_filter(self):
+        self.get("/api/orders/", limit=5)
+        with self.assertNumQueries(2):
+            body = self.get("/api/orders/", limit=5).json()
+        self.assertEqual(body["count"], 25)
+        self.assertEqual(self.get("/api/orders/", limit=5, status="cancelled").json()["count"], 0)
+
+    def test_offset_still_supported(self):
+        body = self.get("/api/products/", limit=1, offset=0).json()
+        self.assertEqual(body["offset"], 0)
+        self.assertEqual(body["results"][0]["id"], self.produit.id)
+        self.assertIsNone(body["next"])
+
+        body = self.get("/api/orders/", limit=10, offset=20).json()
+        self.assertEqual(len(body["results"]), 5)
+        self.assertIn("offset=10", body["previous"])
+
+    def test_invalid_cursor_is_rejected(self):
+        resp = self.get("/api/sales/", after="not-a-cursor")
+        self.assertEqual(resp.status_code, 400)
+
+    def test_wrongly_typed_cursor_is_rejected(self):
+        # ["x", 1] decodes fine but "x" is no date
+        for path in ("/api/sales/", "/api/orders/"):
+            for param in ("after", "before"):
+                with self.subTest(path=path, param=param):
+                    resp = self.get(path, **{param: "WyJ4IiwxXQ"})
+                    self.assertEqual(resp.status_code, 400)
+        self.assertEqual(self.get("/api/products/", after=encode_cursor(["one"])).status_code, 400)
+
+
+@override_settings(EXTERNAL_API_KEY="secret", CHANGE_FEED_SETTLE_SECONDS=0)
+class ChangeFeedTests(TestCase):
+    def setUp(self):
+        self.produit = Produit.objects.create(
+            nom="Figuier", quantite=10, prix_achat=Decimal("5.00"), prix_vente=Decimal("7.50")
+        )
+        self.order = Order.objects.create(nom="Client", wilaya="تونس", ville="Tunis", telephone="20123456")
+        OrderItem.objects.create(order=self.order, produit=self.produit, quantite=1, prix=Decimal("7.50"))
+
+    def poll(self, **params):
+        resp = self.client.get("/api/changes/", params, HTTP_X_API_KEY="secret")
+        self.assertEqual(resp.status_code, 200)
+        return resp.json()
+
+    def test_only_changes_after_watermark_are_returned(self):
+        first = self.poll()
+        self.assertEqual([p["id"] for p in first["products"]], [self.produit.id])
+        self.assertEqual([o["id"] for o in first["orders"]], [self.order.id])
+        self.assertFalse(first["has_more"])
+
+        idle = self.poll(since=first["watermark"])
+        self.assertEqual((idle["products"], idle["orders"], idle["sales"], idle["deleted"]), ([], [], [], []))
+
+        vente = Vente.objects.create(produit=self.produit, quantite=2)
+        self.order.status = "cancelled"
+        self.order.save()
+        changed = self.poll(since=idle["watermark"])
+        self.assertEqual([s["id"] for s in changed["sales"]], [vente.id])
+        self.assertEqual([o["status"] for o in changed["orders"]], ["cancelled"])
+        self.assertEqual([p["stock_quantity"] for p in changed["products"]], [8])
+
+        order_id = self.order.id
+        self.order.delete()
+        deleted = self.poll(since=changed["watermark"])
+        self.assertEqual(deleted["deleted"][0]["type"], "order")
+        self.assertEqual(deleted["deleted"][0]["id"], order_id)
+
+    def test_product_delete_queries_do_not_grow_with_cascaded_rows(self):
+        def delete_with(rows):
+            produit = Produit.objects.create(
+                nom=f"P{rows}", quantite=100, prix_achat=Decimal("1.00"), prix_vente=Decimal("2.00")
+            )
+            for _ in range(rows):
+                Vente.objects.create(produit=produit, quantite=1)
+                OrderItem.objects.create(order=self.order, produit=produit, quantite=1, prix=Decimal("2.00"))
+            sale_ids = set(produit.vente_set.values_list("pk", flat=True))
+            with CaptureQueriesContext(connection) as captured:
+                produit.delete()
+            self.assertEqual(
+                set(Tombstone.objects.filter(model="sale").values_list("object_id", flat=True)) & sale_ids,
+                sale_ids,
+            )
+            return len(captured)
+
+        self.assertEqual(delete_with(2), delete_with(10))
+        self.order.refresh_from_db()
+        self.assertEqual((self.order.nombre_articles, self.order.montant_total), (1, Decimal("7.50")))
+
+    def test_stock_updates_bump_updated_at(self):
+        before = Produit.objects.get().updated_at
+        decrement_stock(self.produit.id, 1)
+        self.assertGreater(Produit.objects.get().updated_at, before)
+
+    def test_pages_through_changes_without_duplicates(self):
+        Produit.objects.bulk_create(
+            Produit(nom=f"P{i}", quantite=1, prix_achat=Decimal("1.00"), prix_vente=Decimal("2.00"))
+            for i in range(4)
+        )
+        body = self.poll(limit=2)
+        seen = [p["id"] for p in body["products"]]
+        while body["has_more"]:
+            body = self.client.get(body["next"], HTTP_X_API_KEY="secret").json()
+            seen.extend(p["id"] for p in body["products"])
+        self.assertEqual(sorted(seen), sorted(Produit.objects.values_list("id", flat=True)))
+
+    def test_idle_poll_does_not_scan_tables(self):
+        watermark = self.poll()["watermark"]
+        # one indexed range query per stream
+        with self.assertNumQueries(4):
+            self.poll(since=watermark)
+
+    @override_settings(CHANGE_FEED_SETTLE_SECONDS=5)
+    def test_rows_inside_the_settle_window_are_held_back(self):
+        self.assertEqual(self.poll()["products"], [])
+        Produit.objects.update(updated_at=timezone.now() - timedelta(seconds=10))
+        self.assertEqual([p["id"] for p in self.poll()["products"]], [self.produit.id])
+
+    @override_settings(CHANGE_FEED_SETTLE_SECONDS=5)
+    def test_commit_after_the_settle_window_is_logged(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            decrement_stock(self.produit.id, 1)
+        later = timezone.now() + timedelta(seconds=6)
+        with mock.patch("Siliana.changes.timezone.now", return_value=later):
+            with self.assertLogs("Siliana.changes", "ERROR") as logs:
+                for callback in callbacks:
+                    callback()
+        self.assertIn("CHANGE_FEED_SETTLE_SECONDS=5", logs.records[0].getMessage())
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            decrement_stock(self.produit.id, 1)
+        with self.assertNoLogs("Siliana.changes", "ERROR"):
+            for callback in callbacks:
+                callback()
+
+    def test_updated_since_and_bad_watermark(self):
+        body = self.poll(updated_since="2100-01-01T00:00:00")
+        self.assertEqual(body["products"], [])
+        resp = self.client.get("/api/changes/", {"since": "garbage"}, HTTP_X_API_KEY="secret")
+        self.assertEqual(resp.status_code, 400)
+
+    def test_watermark_with_wrongly_typed_pairs_is_rejected(self):
+        good = self.poll()["watermark"]
+        self.assertEqual(self.client.get("/api/changes/", {"since": good}, HTTP_X_API_KEY="secret").status_code, 200)
+        for values in (
+            ["x", 1] * 4,
+            ["2025-01-01T00:00:00+00:00", "one"] * 4,
+            [1, 1] * 4,
+            [["2025-01-01T00:00:00+00:00"], {"id": 1}] * 4,
+        ):
+            with self.subTest(values=values):
+                resp = self.client.get("/api/changes/", {"since": encode_cursor(values)}, HTTP_X_API_KEY="secret")
+                self.assertEqual(resp.status_code, 400)
+                self.assertEqual(resp.json()["error"], "invalid since watermark")
+
+
+@override_settings(EXTERNAL_API_KEY="secret")
+class NdjsonExportTests(TestCase):
+    def setUp(self):
+        self.produit = Produit.objects.create(
+            nom="Figuier", quantite=0, prix_achat=Decimal("5.00"), prix_vente=Decimal("7.50")
+        )
+        self.orders = seed_orders(30, self.produit)
+
+    def export(self, kind, **extra):
+        resp = self.client.get(f"/api/export/{kind}.ndjson", extra.pop("params", {}), **extra)
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.streaming)
+        return resp
+
+    def test_orders_stream_one_json_object_per_line(self):
+        resp = self.export("orders", HTTP_X_API_KEY="secret")
+        self.assertEqual(resp["Content-Type"], "application/x-ndjson; charset=utf-8")
+        lines = b"".join(resp.streaming_content).decode().splitlines()
+        rows = [json.loads(line) for line in lines]
+        self.assertEqual([row["id"] for row in rows], [order.id for order in self.orders])
+        self.assertEqual(len(rows[0]["items"]), 2)
+        self.assertEqual(rows[0]["wilaya"], "تونس")
+
+    def test_gzip_when_accepted(self):
+        resp = self.export("orders", HTTP_X_API_KEY="secret", HTTP_ACCEPT_ENCODING="gzip, deflate")
+        self.assertEqual(resp["Content-Encoding"], "gzip")
+        lines = gzip.decompress(b"".join(resp.streaming_content)).splitlines()
+        self.assertEqual(len(lines), 30)
+
+    def test_filters_and_chunked_reads(self):
+        Order.objects.filter(pk__in=[o.pk for o in self.orders[:5]]).update(status="cancelled")
+        with mock.patch("Siliana.views.NDJSON_CHUNK_SIZE", 2):
+            resp = self.export("orders", HTTP_X_API_KEY="secret", params={"status": "cancelled"})
+            # one orders cursor, then one items query per chunk of 2 orders
+            with self.assertNumQueries(4):
+                lines = b"".join(resp.streaming_content).splitlines()
+        self.assertEqual(len(lines), 5)
+
+    def test_requires_api_key_and_known_kind(self):
+        self.assertEqual(self.client.get("/api/export/sales.ndjson").status_code, 401)
+        resp = self.client.get("/api/export/users.ndjson", HTTP_X_API_KEY="secret")
+        self.assertEqual(resp.status_code, 404)
+
+
+@override_settings(EXTERNAL_API_KEY="secret")
+class ApiSparseFieldsTests(TestCase):
+    def setUp(self):
+        self.produit = Produit.objects.create(
+            nom="Figuier", quantite=3, prix_achat=Decimal("5.00"), prix_vente=Decimal("7.50")
+        )
+        self.orders = seed_orders(3, self.produit)
+        Vente.objects.create(produit=self.produit, quantite=1)
+
+    def get(self, url, **params):
+        return self.client.get(url, params, HTTP_X_API_KEY="secret")
+
+    def test_fields_limit_output_and_columns(self):
+        with CaptureQueriesContext(connection) as ctx:
+            body = self.get("/api/sales/", fields="id,total", count="false").json()
+        self.assertEqual(body["results"][0], {"id": Vente.objects.get().id, "total": "7.50"})
+        self.assertEqual(body["total_revenue"], "7.50")
+        self.assertNotIn("Siliana_produit", ctx.captured_queries[0]["sql"])
+
+    def test_orders_without_items_skip_item_query(self):
+        with self.assertNumQueries(1):
+            body = self.get("/api/orders/", fields="id,status", count="false").json()
+        self.assertEqual(set(body["results"][0]), {"id", "status"})
+
+    def test_full_order_matches_stored_values(self):
+        order = self.orders[0]
+        body = self.get(f"/api/orders/{order.id}/").json()
+        self.assertEqual(body["total"], "15.00")
+        self.assertEqual(body["items"][0], {
+            "product_id": self.produit.id, "product_name": "Figuier",
+            "quantity": 1, "price": "7.50", "total": "7.50",
+        })
+
+    def test_unknown_field_is_rejected(self):
+        resp = self.get("/api/products/", fields="id,secret")
+        self.assertEqual(resp.status_code, 400)
+        self.assertIn("secret", resp.json()["error"])
+
+    def test_benchmark_command_runs_and_rolls_back(self):
+        with self.assertRaises(CommandError):
+            call_command("benchmark_api", products=3, orders=4, sales=5, repeat=1, stdout=StringIO())
+        out = StringIO()
+        call_command("benchmark_api", products=3, orders=4, sales=5, repeat=1, force=True, stdout=out)
+        self.assertIn("orders", out.getvalue())
+        self.assertEqual(Produit.objects.count(), 1)
+
+
+@override_settings(EXTERNAL_API_KEY="secret")
+class ApiSalesTotalsTests(TestCase):
+    def setUp(self):
+        self.figuier = Produit.objects.create(
+            nom="Figuier", quantite=100, prix_achat=Decimal("5.00"), prix_vente=Decimal("10.00")
+        )
+        self.olivier = Produit.objects.create(
+            nom="Olivier", quantite=100, prix_achat=Decimal("5.00"), prix_vente=Decimal("4.00")
+        )
+        for produit, quantite, day in (
+            (self.figuier, 1, date(2025, 1, 6)),
+            (self.figuier, 2, date(2025, 1, 7)),
+            (self.olivier, 3, date(2025, 1, 7)),
+            (self.olivier, 1, date(2025, 2, 3)),
+        ):
+            vente = Vente.objects.create(produit=produit, quantite=quantite)
+            Vente.objects.filter(pk=vente.pk).update(date_vente=day)
+
+    def get(self, **params):
+        resp = self.client.get("/api/sales/", params, HTTP_X_API_KEY="secret")
+        self.assertEqual(resp.status_code, 200)
+        return resp.json()
+
+    def test_totals_cover_every_page(self):
+        body = self.get(limit=1)
+        self.assertEqual(len(body["results"]), 1)
+        self.assertEqual(body["total_revenue"], "46.00")
+        self.assertEqual(body["total_quantity"], 7)
+        self.assertEqual(body["transaction_count"], 4)
+
+        body = self.get(limit=1, date_from="2025-02-01")
+        self.assertEqual(body["total_revenue"], "4.00")
+
+    def test_group_by_periods(self):
+        days = self.get(group_by="day")["groups"]
+        self.assertEqual([g["period"] for g in days], ["2025-01-06", "2025-01-07", "2025-02-03"])
+        self.assertEqual(days[1], {"period": "2025-01-07", "revenue": "32.00", "quantity": 5, "count": 2})
+
+        weeks = self.get(group_by="week")["groups"]
+        self.assertEqual([(g["period"], g["count"]) for g in weeks], [("2025-01-06", 3), ("2025-02-03", 1)])
+
+        months = self.get(group_by="month")["groups"]
+        self.assertEqual([(g["period"], g["revenue"]) for g in months], [("2025-01-01", "42.00"), ("2025-02-01", "4.00")])
+
+    def test_group_by_product(self):
+        groups = self.get(group_by="product", product_id=self.olivier.id)["groups"]
+        self.assertEqual(groups, [{
+            "product_id": self.olivier.id, "product_name": "Olivier",
+            "revenue": "16.00", "quantity": 4, "count": 2,
+        }])
+
+    def test_summary_is_constant_queries(self):
+        # page, totals aggregate, grouped aggregate
+        with self.assertNumQueries(3):
+            self.get(limit=2, count="false", group_by="month")
+
+    def test_unknown_group_by_is_rejected(self):
+        resp = self.client.get("/api/sales/", {"group_by": "year"}, HTTP_X_API_KEY="secret")
+        self.assertEqual(resp.status_code, 400)
+
+
+class DailySalesRollupTests(TestCase):
+    def setUp(self):
+        self.figuier = Produit.objects.create(
+            nom="Figuier", quantite=100, prix_achat=Decimal("5.00"), prix_vente=Decimal("7.50")
+        )
+        self.olivier = Produit.objects.create(
+            nom="Olivier", quantite=100, prix_achat=Decimal("3.00"), prix_vente=Decimal("4.00")
+        )
+
+    def snapshot(self):
+        rows = DailySalesRollup.objects.order_by('day', 'produit_id').values('day', 'produit_id', *ROLLUP_FIELDS, 'profit')
+        # Rows whose sources were all deleted stay behind with zero totals
+        return [row for row in rows if any(row[name] for name in ROLLUP_FIELDS)]
+
+    def assertMatchesRebuild(self):
+        incremental = self.snapshot()
+        rebuild()
+        self.assertEqual(incremental, self.snapshot())
+        return incremental
+
+    def test_sales_and_purchases_roll_up_per_day_and_product(self):
+        Vente.objects.create(produit=self.figuier, quantite=2)
+        Vente.objects.create(produit=self.figuier, quantite=1)
+        Vente.objects.create(produit=self.olivier, quantite=3)
+        Achat.objects.create(produit=self.figuier, quantite=10)
+
+        row = DailySalesRollup.objects.get(produit=self.figuier)
+        self.assertEqual(row.day, date.today())
+        self.assertEqual((row.sales_count, row.quantity), (2, 3))
+        self.assertEqual(row.revenue, Decimal("22.50"))
+        self.assertEqual(row.cost, Decimal("15.00"))
+        self.assertEqual(row.profit, Decimal("7.50"))
+        self.assertEqual((row.purchase_quantity, row.purchase_cost), (10, Decimal("50.00")))
+        self.assertMatchesRebuild()
+
+    def test_cost_is_snapshotted_at_sale_time(self):
+        vente = Vente.objects.create(produit=self.figuier, quantite=2)
+        self.figuier.prix_achat = Decimal("6.00")
+        self.figuier.save()
+        vente.refresh_from_db()
+        self.assertEqual(vente.cout_unitaire, Decimal("5.00"))
+        self.assertEqual(self.assertMatchesRebuild()[0]['cost'], Decimal("10.00"))
+
+    def test_edits_and_deletes_are_reversed(self):
+        vente = Vente.objects.create(produit=self.figuier, quantite=2)
+        achat = Achat.objects.create(produit=self.olivier, quantite=4)
+        vente.quantite = 5
+        vente.produit = self.olivier
+        vente.prix_unitaire = None
+        vente.save()
+        achat.quantite = 1
+        achat.save()
+        rows = self.assertMatchesRebuild()
+        self.assertEqual([(r['produit_id'], r['quantity'], r['purchase_quantity']) for r in rows], [(self.olivier.id, 5, 1)])
+
+        vente.delete()
+        Achat.objects.all().delete()
+        self.assertEqual(self.assertMatchesRebuild(), [])
+
+    def test_order_demand_follows_items_and_status(self):
+        order = Order.objects.create(nom="Client", wilaya="تونس", ville="Tunis", telephone="20123456")
+        item = OrderItem.objects.create(order=order, produit=self.figuier, quantite=2, prix=Decimal("7.50"))
+        OrderItem.objects.create(order=order, produit=self.olivier, quantite=1, prix=Decimal("4.00"))
+        item.quantite = 3
+        item.save()
+        rows = self.assertMatchesRebuild()
+        self.assertEqual([(r['order_quantity'], r['order_revenue']) for r in rows], [(3, Decimal("22.50")), (1, Decimal("4.00"))])
+
+        order.status = 'cancelled'
+        order.save()
+        self.assertEqual(self.assertMatchesRebuild(), [])
+        order.status = 'pending'
+        order.save()
+        self.assertEqual(len(self.assertMatchesRebuild()), 2)
+
+        order.delete()
+        self.assertEqual(self.assertMatchesRebuild(), [])
+
+    def test_order_lines_over_several_days_take_a_fixed_number_of_queries(self):
+        today = date.today()
+        yesterday = today - timedelta(days=1)
+        record_order_days({yesterday: [(self.figuier.id, 1, Decimal("7.50"))]})
+
+        lines_by_day = {
+            today: [(self.figuier.id, 2, Decimal("7.50")), (self.olivier.id, 1, Decimal("4.00"))],
+            yesterday: [(self.figuier.id, 3, Decimal("7.50")), (self.olivier.id, 2, Decimal("4.00"))],
+        }
+        # One INSERT for the missing rows, one UPDATE for all of them
+        with self.assertNumQueries(2):
+            record_order_days(lines_by_day)
+        rows = {
+            (row.day, row.produit_id): (row.order_quantity, row.order_revenue)
+            for row in DailySalesRollup.objects.all()
+        }
+        self.assertEqual(rows, {
+            (today, self.figuier.id): (2, Decimal("15.00")),
+            (today, self.olivier.id): (1, Decimal("4.00")),
+            (yesterday, self.figuier.id): (4, Decimal("30.00")),
+            (yesterday, self.olivier.id): (2, Decimal("8.00")),
+        })
+
+    def test_rebuild_command_restores_range(self):
+        Vente.objects.create(produit=self.figuier, quantite=2)
+        expected = self.snapshot()
+        DailySalesRollup.objects.update(revenue=0)
+        out = StringIO()
+        call_command("rebuild_sales_rollups", "--from", str(date.today()), "--to", str(date.today()), stdout=out)
+        self.assertIn("1 rollup rows", out.getvalue())
+        self.assertEqual(self.snapshot(), expected)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'reporting views only exist on PostgreSQL')
+class ReportingViewPlanTests(TestCase):
+    # How the external system filters each view; others are read whole
+    PROBES = {
+        'v_sales': "SELECT * FROM v_sales WHERE date_vente >= CURRENT_DATE - 30",
+        'v_finance': "SELECT * FROM v_finance WHERE transaction_date >= CURRENT_DATE - 30",
+        'v_orders': "SELECT * FROM v_orders WHERE order_date >= CURRENT_DATE - 30",
+        'v_order_items': "SELECT * FROM v_order_items WHERE order_id = 1",
+        'ventes': "SELECT * FROM ventes WHERE date_vente >= CURRENT_DATE - 30",
+        'transactions_financieres': "SELECT * FROM transactions_financieres WHERE date_transaction >= CURRENT_DATE - 30",
+    }
+    # Tables that grow with activity; the catalog is small enough to scan
+    GROWING_TABLES = ('Siliana_vente', 'Siliana_achat', 'Siliana_order', 'Siliana_orderitem', 'Siliana_dailysalesrollup')
+    # All-time totals read every rollup row by definition; they must still
+    # stay off the base tables
+    WHOLE_ROLLUP_VIEWS = {'vw_sales_summary', 'vw_finance_summary'}
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            # Make the planner use an index whenever one can serve the query
+            cursor.execute("SET LOCAL enable_seqscan = off")
+            cursor.execute(f"EXPLAIN {sql}")
+            return "\n".join(row[0] for row in cursor.fetchall())
+
+    def test_views_do_not_scan_growing_tables(self):
+        for view in REPORTING_VIEWS:
+            plan = self.explain(self.PROBES.get(view, f"SELECT * FROM {view}"))
+            tables = self.GROWING_TABLES
+            if view in self.WHOLE_ROLLUP_VIEWS:
+                tables = [table for table in tables if table != 'Siliana_dailysalesrollup']
+            with self.subTest(view=view):
+                for table in tables:
+                    self.assertNotIn(f'Seq Scan on "{table}"', plan)
+
+    def test_views_leave_ordering_to_readers(self):
+        with connection.cursor() as cursor:
+            for view in REPORTING_VIEWS:
+                cursor.execute("SELECT pg_get_viewdef(%s::regclass)", [view])
+                with self.subTest(view=view):
+                    self.assertNotIn("ORDER BY", cursor.fetchone()[0].upper())
+
+    def test_refresh_command_updates_materialized_views(self):
+        produit = Produit.objects.create(
+            nom="Figuier", quantite=10, prix_achat=Decimal("5.00"), prix_vente=Decimal("7.50")
+        )
+        Vente.objects.create(produit=produit, quantite=2)
+        call_command("refresh_reporting_views", stdout=StringIO())
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT total_sales_amount FROM mv_sales_summary")
+            self.assertEqual(cursor.fetchone()[0], Decimal("15.00"))
+            cursor.execute("SELECT amount FROM mv_finance WHERE transaction_type = 'sale'")
+            self.assertEqual(cursor.fetchone()[0], Decimal("15.00"))
+
+
+@skipUnless(connection.vendor == 'sqlite', 'plans over near-empty tables are only stable on SQLite')
+@override_settings(EXTERNAL_API_KEY="secret")
+class HotPathIndexTests(TestCase):
+    def assertUsesIndex(self, queryset, index):
+        self.assertIn(index, queryset.explain())
+
+    def test_list_filters_use_matching_indexes(self):
+        newest = ('-date_commande', '-id')
+        self.assertUsesIndex(Order.objects.filter(status='pending').order_by(*newest), 'order_status_date_idx')
+        self.assertUsesIndex(Order.objects.filter(wilaya='سليانة').order_by(*newest), 'order_wilaya_date_idx')
+        self.assertUsesIndex(Vente.objects.filter(produit_id=1).order_by('-date_vente', '-id'), 'vente_produit_date_idx')
+        self.assertUsesIndex(Produit.objects.filter(quantite__gt=0).order_by('nom'), 'produit_in_stock_nom_idx')
+        self.assertUsesIndex(Produit.objects.filter(quantite__lte=5), 'produit_low_stock_idx')
+
+    def test_api_order_date_filter_is_a_range(self):
+        order = Order.objects.create(nom="Client", wilaya="تونس", ville="Tunis", telephone="20123456")
+        day = timezone.localdate(order.date_commande)
+        params = {"date_from": str(day), "date_to": str(day)}
+        resp = self.client.get("/api/orders/", params, HTTP_X_API_KEY="secret")
+        self.assertEqual([row["id"] for row in resp.json()["results"]], [order.id])
+        params["date_from"] = str(day + timedelta(days=1))
+        resp = self.client.get("/api/orders/", params, HTTP_X_API_KEY="secret")
+        self.assertEqual(resp.json()["results"], [])
+
+
+class SeedDataTests(TestCase):
+    def test_seed_data_refuses_without_debug(self):
+        with self.assertRaises(CommandError):
+            call_command("seed_data", products=1, orders=0, sales=0, purchases=0, stdout=StringIO())
+        self.assertFalse(Produit.objects.exists())
+        with self.assertRaises(CommandError):
+            call_command("benchmark_indexes", products=1, orders=0, sales=0, stdout=StringIO())
+        self.assertFalse(Produit.objects.exists())
+        users = User.objects.count()
+        with self.assertRaises(CommandError):
+            call_command("benchmark_urls", repeat=1, output=os.devnull, stdout=StringIO())
+        self.assertEqual(User.objects.count(), users)
+
+    def test_seed_data_creates_consistent_rows(self):
+        call_command(
+            "seed_data", products=5, orders=20, sales=30, purchases=10, days=10,
+            force=True, stdout=StringIO(),
+        )
+        self.assertEqual(Produit.objects.count(), 5)
+        self.assertEqual(Order.objects.count(), 20)
+        self.assertEqual(Achat.objects.count(), 10)
+        self.assertEqual(Vente.objects.dates("date_vente", "day").count(), 10)
+        self.assertEqual(
+            DailySalesRollup.objects.aggregate(n=Sum("purchase_quantity"))["n"],
+            Achat.objects.aggregate(n=Sum("quantite"))["n"],
+        )
+        for wilaya, ville in Order.objects.values_list("wilaya", "ville"):
+            self.assertIn(ville, WILAYAS[wilaya])
+
+    def test_benchmark_urls_reports_every_route_and_rolls_back(self):
+        call_command("seed_data", products=3, orders=5, sales=5, purchases=2, force=True, stdout=StringIO())
+        users = User.objects.count()
+        with tempfile.NamedTemporaryFile(suffix=".json") as output:
+            call_command("benchmark_urls", repeat=1, output=output.name, force=True, stdout=StringIO())
+            with open(output.name, encoding="utf-8") as handle:
+                report = json.load(handle)
+
+        rows = {row["name"]: row for row in report["results"]}
+        self.assertIn("orders_list", rows)
+        self.assertIn("api_export:sales", rows)
+        self.assertIn("admin:Siliana.order", rows)
+        self.assertNotIn("logout", rows)
+        self.assertEqual(rows["api_products"]["status"], 200)
+        self.assertEqual(rows["orders_list"]["status"], 200)
+        self.assertEqual(report["scale"]["orders"], 5)
+        for row in rows.values():
+            self.assertLessEqual(row["p50_ms"], row["p95_ms"])
+            self.assertGreater(row["peak_kb"], 0)
+        self.assertEqual(User.objects.count(), users)
+
+
+class SQLInstrumentationTests(TestCase):
+    def setUp(self):
+        for i in range(6):
+            Produit.objects.create(nom=f"P{i}", quantite=i, prix_achat=Decimal("1.00"), prix_vente=Decimal("2.00"))
+
+    def run_view(self, view):
+        request = RequestFactory().get("/report/")
+        return SQLInstrumentationMiddleware(view)(request)
+
+    def test_query_shape_ignores_values(self):
+        self.assertEqual(
+            query_shape("SELECT * FROM t WHERE id IN (%s, %s, %s) AND nom = 'x' LIMIT 21"),
+            query_shape("SELECT *  FROM t WHERE id IN (%s) AND nom = 'y''s' LIMIT 5"),
+        )
+
+    def test_server_timing_header(self):
+        resp = self.run_view(lambda request: HttpResponse(str(Produit.objects.count())))
+        self.assertRegex(resp["Server-Timing"], r'^db;dur=[\d.]+;desc="1 queries", total;dur=[\d.]+$')
+
+    def test_repeated_query_shape_is_flagged(self):
+        def n_plus_one(request):
+            names = [Produit.objects.get(pk=pk).nom for pk in Produit.objects.values_list("pk", flat=True)]
+            return HttpResponse(",".join(names))
+
+        with self.assertLogs("Siliana.sql", "WARNING") as logs:
+            self.run_view(n_plus_one)
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record["queries"], 7)
+        self.assertEqual(record["flagged"], ["repeated_query"])
+        self.assertEqual(record["repeated"][0]["count"], 6)
+        self.assertIn('"Siliana_produit"."id" = ?', record["repeated"][0]["sql"])
+
+    def test_statements_are_merged_into_shapes_at_the_end(self):
+        def in_lists(request):
+            for size in range(1, 6):
+                list(Produit.objects.filter(pk__in=range(size)))
+            return HttpResponse("ok")
+
+        with self.assertLogs("Siliana.sql", "WARNING") as logs:
+            self.run_view(in_lists)
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record["repeated"][0]["count"], 5)
+
+    @override_settings(SQL_QUERY_BUDGET=1)
+    def test_query_budget_is_flagged(self):
+        def two_queries(request):
+            return HttpResponse(f"{Produit.objects.count()} {Vente.objects.count()}")
+
+        with self.assertLogs("Siliana.sql", "WARNING") as logs:
+            self.run_view(two_queries)
+        self.assertEqual(json.loads(logs.records[0].getMessage())["flagged"], ["queries"])
+
+    @override_settings(SQL_TIME_BUDGET_MS=0)
+    def test_time_budget_counts_database_time_only(self):
+        with self.assertLogs("Siliana.sql", "INFO") as logs:
+            self.run_view(lambda request: HttpResponse("no queries"))
+            self.run_view(lambda request: HttpResponse(str(Produit.objects.count())))
+        self.assertNotIn("flagged", json.loads(logs.records[0].getMessage()))
+        self.assertEqual(json.loads(logs.records[1].getMessage())["flagged"], ["db_time"])
+
+    @override_settings(SQL_INSTRUMENTATION=False)
+    def test_disabled_adds_no_header(self):
+        resp = self.run_view(lambda request: HttpResponse(str(Produit.objects.count())))
+        self.assertFalse(resp.has_header("Server-Timing"))
+
+    def test_requests_within_budget_log_at_info(self):
+        with self.assertLogs("Siliana.sql", "INFO") as logs:
+            self.run_view(lambda request: HttpResponse(str(Produit.objects.count())))
+        self.assertEqual(logs.records[0].levelname, "INFO")
+        self.assertNotIn("flagged", json.loads(logs.records[0].getMessage()))
+
+
+# Most queries a request may run, per route of Siliana.urls and per admin
+# changelist. QueryBudgetTests also checks that the count is the same with
+# five times more rows, so a query per listed row fails even under budget.
+# POST cases (placing an order, single and bulk status changes, exports)
+# submit more products or orders at the larger size, so the same goes for
+# a query per submitted row.
+QUERY_BUDGETS = {
+    "home": 6,
+    "login": 2,
+    "product_list": 3,
+    "add_product": 2,
+    "edit_product": 3,
+    "add_stock": 3,
+    "new_sale": 3,
+    "sales_report": 4,
+    "public_order": 1,
+    "public_order:post": 14,
+    "public_order_success": 1,
+    "products_catalog": 1,
+    "product_detail": 2,
+    "cart": 0,
+    "orders_list": 5,
+    "update_order_status": 11,
+    "bulk_update_order_status": 11,
+    "export_orders": 4,
+    "api_products": 2,
+    "api_orders": 3,
+    "api_order_detail": 2,
+    "api_sales": 3,
+    "api_changes": 4,
+    "api_export:products": 1,
+    "api_export:orders": 2,
+    "api_export:sales": 1,
+    "serve_product_image": 2,
+    "serve_product_image:image_hash": 2,
+    "serve_product_image_variant:webp": 2,
+    "serve_product_image_variant:jpg": 2,
+    "admin:auth.group": 5,
+    "admin:auth.user": 6,
+    "admin:Siliana.produit": 6,
+    "admin:Siliana.achat": 5,
+    "admin:Siliana.vente": 4,
+    "admin:Siliana.order": 5,
+    "admin:Siliana.orderitem": 4,
+    "admin:Siliana.emailoutbox": 5,
+}
+
+
+@override_settings(ALLOWED_HOSTS=["testserver"], EXTERNAL_API_KEY="secret")
+class QueryBudgetTests(TestCase):
+    SIZES = (3, 15)
+
+    def setUp(self):
+        use_temp_media(self)
+        self.user = User.objects.create_superuser("budget", password="pass")
+        self.client.force_login(self.user)
+        self.produit = Produit.objects.create(
+            nom="Figuier", quantite=2, prix_achat=Decimal("5.00"), prix_vente=Decimal("7.50"),
+            image=SimpleUploadedFile("fig.png", make_png(200, 150), content_type="image/png"),
+        )
+
+    def grow_to(self, size):
+        """Add rows until there are about `size` of each kind."""
+        missing = size - Order.objects.count()
+        seed(products=missing, orders=missing, sales=missing, purchases=missing, days=3, rng=random.Random(size))
+
+    def count_queries(self, method, path, data):
+        cache.clear()
+        get_image_cache().clear()
+        # POSTs are rolled back, so both sizes place and cancel the same way
+        with rolled_back(method), CaptureQueriesContext(connection) as ctx:
+            response = getattr(self.client, method)(path, data=data, HTTP_X_API_KEY="secret")
+            if response.streaming:
+                b"".join(response.streaming_content)
+        self.assertLess(response.status_code, 400, path)
+        if method == "post":
+            # A rejected form would measure the error path instead
+            errors = [str(m) for m in get_messages(response.wsgi_request) if m.level == ERROR]
+            self.assertEqual(errors, [], path)
+        return len(ctx.captured_queries)
+
+    def measure(self):
+        return {
+            label: self.count_queries(method, path, data)
+            for label, method, path, data in site_cases() + admin_cases()
+        }
+
+    def test_every_view_and_changelist_stays_within_its_budget(self):
+        self.grow_to(self.SIZES[0])
+        small = self.measure()
+        self.grow_to(self.SIZES[1])
+        large = self.measure()
+
+        self.assertEqual(set(large), set(QUERY_BUDGETS), "every route needs a query budget")
+        for label, count in large.items():
+            with self.subTest(label):
+                self.assertLessEqual(count, QUERY_BUDGETS[label])
+                self.assertEqual(count, small[label], "queries grow with the number of rows")
+
+
+@override_settings(ALLOWED_HOSTS=["testserver"])
+class AdminChangelistTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser("admin", password="pass"))
+        self.produit = Produit.objects.create(
+            nom="Figuier", quantite=50, prix_achat=Decimal("5.00"), prix_vente=Decimal("7.50"),
+        )
+        self.order = Order.objects.create(nom="Client", wilaya="تونس", ville="Tunis", telephone="20123456")
+        OrderItem.objects.create(order=self.order, produit=self.produit, quantite=2, prix=Decimal("7.50"))
+        OrderItem.objects.create(order=self.order, produit=self.produit, quantite=1, prix=Decimal("30.00"))
+
+    def test_order_item_totals_come_from_sql_and_sort(self):
+        resp = self.client.get("/admin/Siliana/orderitem/", {"o": "5"})
+        self.assertEqual(
+            [item.line_total for item in resp.context["cl"].result_list],
+            [Decimal("15.00"), Decimal("30.00")],
+        )
+        self.assertContains(resp, "15.00 د.ت")
+        resp = self.client.get("/admin/Siliana/orderitem/", {"o": "-5"})
+        self.assertEqual([item.quantite for item in resp.context["cl"].result_list], [1, 2])
+
+    def test_order_change_page_shows_item_totals(self):
+        resp = self.client.get(f"/admin/Siliana/order/{self.order.id}/change/")
+        self.assertEqual(resp.status_code, 200)
+        self.assertContains(resp, "30.00 د.ت")
+
+    def test_paginator_counts_exactly_without_an_estimate(self):
+        resp = self.client.get("/admin/Siliana/order/")
+        self.assertEqual(resp.context["cl"].result_count, 1)
+        self.assertIsNone(resp.context["cl"].full_result_count)
+
+    def test_paginator_uses_large_estimates(self):
+        Order.objects.create(nom="Client 2", wilaya="تونس", ville="Tunis", telephone="20123457")
+        with mock.patch("Siliana.pagination.EXACT_COUNT_BELOW", 2):
+            with mock.patch("Siliana.pagination.estimated_count", return_value=250000):
+                self.assertEqual(EstimatedCountPaginator(Order.objects.all(), 100).count, 250000)
+            # A stale estimate below the threshold is not trusted
+            with mock.patch("Siliana.pagination.estimated_count", return_value=1):
+                self.assertEqual(EstimatedCountPaginator(Order.objects.all(), 100).count, 2)
+
+    def test_paginator_skips_the_estimate_for_small_results(self):
+        with mock.patch("Siliana.pagination.estimated_count") as estimate:
+            with self.assertNumQueries(1):
+                self.assertEqual(EstimatedCountPaginator(Order.objects.all(), 100).count, 1)
+        estimate.assert_not_called()
+
+
+@override_settings(ALLOWED_HOSTS=["testserver"])
+class BulkOrderStatusTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser("admin", password="pass"))
+        self.produit = Produit.objects.create(
+            nom="Figuier", quantite=100, prix_achat=Decimal("5.00"), prix_vente=Decimal("7.50"),
+        )
+        self.other = Produit.objects.create(
+            nom="Autre", quantite=100, prix_achat=Decimal("1.00"), prix_vente=Decimal("3.00"),
+        )
+
+    def make_orders(self, count, status="pending"):
+        orders = []
+        for _ in range(count):
+            order = Order.objects.create(nom="Client", wilaya="تونس", ville="Tunis", telephone="20123456")
+            OrderItem.objects.create(order=order, produit=self.produit, quantite=2, prix=Decimal("7.50"))
+            OrderItem.objects.create(order=order, produit=self.other, quantite=1, prix=Decimal("3.00"))
+            if status != "pending":
+                # As staff would: cancelling gives the stock back
+                order.status = status
+                order.save()
+            orders.append(order)
+        return orders
+
+    def message(self, resp):
+        self.assertRedirects(resp, "/orders/", fetch_redirect_response=False)
+        [message] = get_messages(resp.wsgi_request)
+        return str(message)
+
+    def stock(self):
+        return list(Produit.objects.order_by("id").values_list("quantite", flat=True))
+
+    def demand(self):
+        return DailySalesRollup.objects.aggregate(n=Sum("order_quantity"))["n"]
+
+    def test_admin_cancel_restores_stock_and_rollups(self):
+        orders = self.make_orders(3)
+        already = self.make_orders(1, status="cancelled")[0]
+        self.assertEqual(self.stock(), [94, 97])
+        self.assertEqual(self.demand(), 9)
+
+        resp = self.client.post("/admin/Siliana/order/", {
+            "action": "mark_cancelled",
+            "_selected_action": [order.id for order in orders] + [already.id],
+        }, follow=True)
+
+        self.assertContains(resp, "تم تحديث 3 طلب إلى: ملغي، وإرجاع 9 قطعة إلى المخزون (1 طلب كان بهذه الحالة مسبقاً)")
+        self.assertEqual(self.stock(), [100, 100])
+        self.assertEqual(self.demand(), 0)
+        self.assertEqual(Order.objects.filter(status="cancelled").count(), 4)
+
+    def test_queries_do_not_grow_with_selection(self):
+        def count_queries(orders, status):
+            with CaptureQueriesContext(connection) as ctx:
+                Order.bulk_set_status(Order.objects.filter(id__in=[order.id for order in orders]), status)
+            return len(ctx.captured_queries)
+
+        self.assertEqual(count_queries(self.make_orders(2), "cancelled"), count_queries(self.make_orders(20), "cancelled"))
+
+    def test_staff_list_uncancel_takes_stock_and_counts_demand_again(self):
+        orders = self.make_orders(2, status="cancelled")
+        self.assertEqual(self.stock(), [100, 100])
+
+        resp = self.client.post("/orders/update/", {
+            "order_ids": [order.id for order in orders], "status": "confirmed",
+        })
+
+        self.assertEqual(self.message(resp), "تم تحديث 2 طلب إلى: مؤكد، وخصم 6 قطعة من المخزون")
+        self.assertEqual(self.demand(), 6)
+        self.assertEqual(self.stock(), [96, 98])
+        self.assertEqual(Order.objects.filter(status="confirmed").count(), 2)
+
+    def test_uncancel_is_refused_when_stock_is_short(self):
+        orders = self.make_orders(2, status="cancelled")
+        Produit.objects.filter(pk=self.other.pk).update(quantite=1)
+
+        resp = self.client.post("/orders/update/", {
+            "order_ids": [order.id for order in orders], "status": "confirmed",
+        })
+
+        self.assertEqual(self.message(resp), "❌ الكمية المطلوبة من Autre غير متوفرة!")
+        self.assertEqual(self.stock(), [100, 1])
+        self.assertEqual(self.demand(), 0)
+        self.assertEqual(Order.objects.filter(status="cancelled").count(), 2)
+
+    def test_admin_change_form_uncancel_is_refused_when_stock_is_short(self):
+        order = self.make_orders(1, status="cancelled")[0]
+        Produit.objects.filter(pk=self.other.pk).update(quantite=0)
+        url = f"/admin/Siliana/order/{order.id}/change/"
+        items = list(order.orderitem_set.order_by("id"))
+        data = {
+            "nom": order.nom, "telephone": order.telephone, "wilaya": order.wilaya, "ville": order.ville,
+            "status": "confirmed", "notes": "",
+            "orderitem_set-TOTAL_FORMS": len(items), "orderitem_set-INITIAL_FORMS": len(items),
+            "orderitem_set-MIN_NUM_FORMS": 0, "orderitem_set-MAX_NUM_FORMS": 1000,
+        }
+        for i, item in enumerate(items):
+            data.update({
+                f"orderitem_set-{i}-id": item.id, f"orderitem_set-{i}-order": order.id,
+                f"orderitem_set-{i}-produit": item.produit_id,
+                f"orderitem_set-{i}-quantite": item.quantite, f"orderitem_set-{i}-prix": item.prix,
+            })
+
+        resp = self.client.post(url, data)
+
+        self.assertRedirects(resp, url, fetch_redirect_response=False)
+        self.assertEqual(
+            [str(message) for message in get_messages(resp.wsgi_request)],
+            ["❌ الكمية المطلوبة من Autre غير متوفرة!"],
+        )
+        order.refresh_from_db()
+        self.assertEqual(order.status, "cancelled")
+        self.assertEqual(self.stock(), [100, 0])
+        self.assertEqual(self.demand(), 0)
+        self.assertFalse(LogEntry.objects.filter(object_id=str(order.id)).exists())
+
+    def test_single_and_bulk_uncancel_agree(self):
+        single, bulk = self.make_orders(2, status="cancelled")
+        resp = self.client.post(f"/orders/update/{single.id}/", {"status": "pending"})
+        self.assertRedirects(resp, "/orders/", fetch_redirect_response=False)
+        after_single = self.stock()
+        Order.bulk_set_status(Order.objects.filter(pk=bulk.pk), "pending")
+        self.assertEqual(after_single, [98, 99])
+        self.assertEqual(self.stock(), [96, 98])
+        self.assertEqual(self.demand(), 6)
+
+        single.status = "cancelled"
+        single.save()
+        Produit.objects.filter(pk=self.produit.pk).update(quantite=0)
+        resp = self.client.post(f"/orders/update/{single.id}/", {"status": "pending"}, follow=True)
+        self.assertContains(resp, "❌ الكمية المطلوبة من Figuier غير متوفرة!")
+        single.refresh_from_db()
+        self.assertEqual(single.status, "cancelled")
+
+    def test_staff_list_rejects_empty_selection_and_bad_status(self):
+        order = self.make_orders(1)[0]
+        resp = self.client.post("/orders/update/", {"status": "completed"})
+        self.assertEqual(self.message(resp), "الرجاء اختيار طلب واحد على الأقل")
+        self.assertContains(self.client.get("/orders/"), "alert alert-error")
+        resp = self.client.post("/orders/update/", {"order_ids": [order.id], "status": "lost"})
+        self.assertEqual(self.message(resp), "حالة غير صحيحة")
+        order.refresh_from_db()
+        self.assertEqual(order.status, "pending")
+
+    def test_staff_list_rejects_malformed_ids_and_get(self):
+        order = self.make_orders(1)[0]
+        resp = self.client.post("/orders/update/", {"order_ids": [order.id, "abc"], "status": "completed"})
+        self.assertEqual(self.message(resp), "طلبات غير صحيحة")
+        order.refresh_from_db()
+        self.assertEqual(order.status, "pending")
+        self.assertEqual(self.client.get("/orders/update/").status_code, 405)
@@ -18,12 +18,17 @@ urlpatterns = [
     path('cart/', views.cart, name='cart'),
     path('orders/', views.orders_list, name='orders_list'),
     path('orders/update/<int:order_id>/', views.update_order_status, name='update_order_status'),
+    path('orders/update/', views.bulk_update_order_status, name='bulk_update_order_status'),
     path('orders/export/', views.export_orders, name='export_orders'),
     path('api/products/', views.api_products, name='api_products'),
     path('api/orders/', views.api_orders, name='api_orders'),
     path('api/orders/<int:order_id>/', views.api_order_detail, name='api_order_detail'),
     path('api/sales/', views.api_sales, name='api_sales'),
+    path('api/changes/', views.api_changes, name='api_changes'),
+    path('api/export/<str:kind>.ndjson', views.api_export, name='api_export'),
     
     # Serve product images from PostgreSQL
     path('product-image/<int:product_id>/', views.serve_product_image, name='serve_product_image'),
+    path('product-image/<int:product_id>/<str:image_hash>/', views.serve_product_image, name='serve_product_image'),
+    path('product-image/<int:product_id>/<str:image_hash>/<int:width>.<str:fmt>', views.serve_product_image_variant, name='serve_product_image_variant'),
 ]
@@ -2,19 +2,40 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from .models import Produit, Vente, Achat, Order, OrderItem
-from datetime import date
+from .models import Produit, ProduitImage, ProduitImageVariant, Vente, Achat, Order, OrderItem, Tombstone
+from .images import VARIANT_FORMATS, VARIANT_WIDTHS, variant_content_type
+from .image_cache import cache_key, get_image_cache
+from . import changes
+from datetime import date, datetime, timedelta
+from decimal import Decimal, InvalidOperation
 from django.db import transaction
-from django.http import HttpResponse, JsonResponse
-from django.views.decorators.http import require_GET
-from django.utils.dateparse import parse_date
+from django.db.models import Count, F, Prefetch, Q, Sum
+from django.db.models.functions import TruncMonth, TruncWeek
+from django.http import FileResponse, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET, require_POST, require_safe
+from django.utils.cache import get_conditional_response
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.http import http_date, quote_etag
 from functools import wraps
 from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
-from django.core.mail import send_mail
+from openpyxl.utils import get_column_letter
 from django.conf import settings
+from django.core.cache import cache
+import csv
+import hashlib
+import itertools
 import os
+import tempfile
+import zlib
 from .firebase_admin import verify_firebase_id_token
+from .pagination import decode_cursor, encode_cursor, keyset_paginate
+from .serializers import ORDERS, PRODUCTS, SALES, TOMBSTONES, dumps, json_response
+from .outbox import queue_mail
+from .rollups import order_day, record_order_lines
+from .stock import InsufficientStock, decrement_stock_many
 
 
 def _api_error(message, status=400):
@@ -55,55 +76,158 @@ def _parse_pagination(request, default_limit=100, max_limit=500):
     return limit, offset, None
 
 
-def _serialize_product(product, request=None):
-    image_url = product.image.url if product.image else None
-    if image_url and request is not None:
-        image_url = request.build_absolute_uri(image_url)
-    return {
-        "id": product.id,
-        "name": product.nom,
-        "description": product.description,
-        "stock_quantity": product.quantite,
-        "purchase_price": str(product.prix_achat),
-        "selling_price": str(product.prix_vente),
-        "image_url": image_url,
-    }
+API_COUNT_CACHE_SECONDS = 60
+# Query parameters that select a page rather than the result set
+_PAGE_PARAMS = ("limit", "offset", "after", "before", "count", "api_key")
 
 
-def _serialize_order(order):
-    items = []
-    for item in order.orderitem_set.all():
-        items.append({
-            "product_id": item.produit_id,
-            "product_name": item.produit.nom,
-            "quantity": item.quantite,
-            "price": str(item.prix),
-            "total": str(item.total()),
-        })
-    return {
-        "id": order.id,
-        "customer_name": order.nom,
-        "email": order.email,
-        "wilaya": order.wilaya,
-        "ville": order.ville,
-        "telephone": order.telephone,
-        "status": order.status,
-        "date_commande": order.date_commande.isoformat(),
-        "total": str(order.total()),
-        "items": items,
-    }
+def _page_link(request, **params):
+    query = request.GET.copy()
+    for name in ("offset", "after", "before", "since", "updated_since"):
+        query.pop(name, None)
+    for name, value in params.items():
+        query[name] = value
+    return request.build_absolute_uri(f"{request.path}?{query.urlencode()}")
 
 
-def _serialize_sale(vente):
-    return {
-        "id": vente.id,
-        "product_id": vente.produit_id,
-        "product_name": vente.produit.nom,
-        "quantity": vente.quantite,
-        "unit_price": str(vente.produit.prix_vente),
-        "total": str(vente.total()),
-        "date": vente.date_vente.isoformat(),
-    }
+def _api_count(request, queryset):
+    """Total rows for the filtered set, cached briefly; None with count=false."""
+    if (request.GET.get("count") or "").strip().lower() in ("0", "false", "no"):
+        return None
+    filters = sorted((k, v) for k, v in request.GET.lists() if k not in _PAGE_PARAMS)
+    key = "api_count:" + hashlib.sha256(repr((request.path, filters)).encode()).hexdigest()
+    total = cache.get(key)
+    if total is None:
+        total = queryset.count()
+        cache.set(key, total, API_COUNT_CACHE_SECONDS)
+    return total
+
+
+def _api_fields(request, resource):
+    """Output fields picked by `fields=`; returns (names, error_response)."""
+    try:
+        return resource.parse_fields((request.GET.get("fields") or "").strip()), None
+    except ValueError as exc:
+        return None, _api_error(str(exc), status=400)
+
+
+def _api_page(request, queryset, ordering):
+    """Paginate an API queryset; returns (rows, body, error_response).
+
+    Clients that send `offset` keep the legacy limit/offset behaviour.
+    Everyone else gets keyset pages: `next`/`previous` links carry opaque
+    `after`/`before` cursors, so every page costs the same however deep
+    it is. The caller serializes `rows` into body["results"].
+    """
+    limit, offset, error = _parse_pagination(request)
+    if error:
+        return None, None, error
+
+    if "offset" in request.GET:
+        rows = list(queryset.order_by(*ordering)[offset:offset + limit + 1])
+        has_next = len(rows) > limit
+        rows = rows[:limit]
+        body = {
+            "count": _api_count(request, queryset),
+            "limit": limit,
+            "offset": offset,
+            "next": _page_link(request, offset=offset + limit) if has_next else None,
+            "previous": _page_link(request, offset=max(offset - limit, 0)) if offset else None,
+        }
+    else:
+        try:
+            page = keyset_paginate(
+                queryset, ordering, limit,
+                after=request.GET.get("after"), before=request.GET.get("before"),
+            )
+        except ValueError:
+            return None, None, _api_error("invalid cursor", status=400)
+        rows = page.items
+        body = {
+            "count": _api_count(request, queryset),
+            "limit": limit,
+            "next": _page_link(request, after=page.next_cursor) if page.has_next else None,
+            "previous": _page_link(request, before=page.previous_cursor) if page.has_previous else None,
+        }
+    return rows, body, None
+
+
+def _filter_products(request, products):
+    """Apply the API's product filters; returns (queryset, error_response)."""
+    in_stock = (request.GET.get("in_stock") or "").strip().lower()
+    if in_stock in ("1", "true", "yes"):
+        products = products.filter(quantite__gt=0)
+    return products, None
+
+
+def _day_start(day):
+    """Midnight of `day` in the current time zone.
+
+    Filtering date_commande on datetime bounds (rather than __date) keeps
+    the order date indexes usable.
+    """
+    return timezone.make_aware(datetime.combine(day, datetime.min.time()))
+
+
+def _filter_orders(request, orders):
+    """Apply the API's order filters; returns (queryset, error_response)."""
+    status = (request.GET.get("status") or "").strip()
+    if status:
+        orders = orders.filter(status=status)
+
+    date_from = (request.GET.get("date_from") or "").strip()
+    if date_from:
+        parsed = parse_date(date_from)
+        if not parsed:
+            return None, _api_error("date_from must be YYYY-MM-DD", status=400)
+        orders = orders.filter(date_commande__gte=_day_start(parsed))
+
+    date_to = (request.GET.get("date_to") or "").strip()
+    if date_to:
+        parsed = parse_date(date_to)
+        if not parsed:
+            return None, _api_error("date_to must be YYYY-MM-DD", status=400)
+        orders = orders.filter(date_commande__lt=_day_start(parsed + timedelta(days=1)))
+
+    for param, lookup in (("min_total", "montant_total__gte"), ("max_total", "montant_total__lte")):
+        value = (request.GET.get(param) or "").strip()
+        if value:
+            try:
+                amount = Decimal(value)
+            except InvalidOperation:
+                amount = None
+            # Decimal() also accepts NaN and Infinity, which no query can compare
+            if amount is None or not amount.is_finite():
+                return None, _api_error(f"{param} must be a number", status=400)
+            orders = orders.filter(**{lookup: amount})
+    return orders, None
+
+
+def _filter_sales(request, sales):
+    """Apply the API's sale filters; returns (queryset, error_response)."""
+    # Filter by date range
+    date_from = (request.GET.get("date_from") or "").strip()
+    if date_from:
+        parsed = parse_date(date_from)
+        if not parsed:
+            return None, _api_error("date_from must be YYYY-MM-DD", status=400)
+        sales = sales.filter(date_vente__gte=parsed)
+
+    date_to = (request.GET.get("date_to") or "").strip()
+    if date_to:
+        parsed = parse_date(date_to)
+        if not parsed:
+            return None, _api_error("date_to must be YYYY-MM-DD", status=400)
+        sales = sales.filter(date_vente__lte=parsed)
+
+    # Filter by product
+    product_id = (request.GET.get("product_id") or "").strip()
+    if product_id:
+        try:
+            sales = sales.filter(produit_id=int(product_id))
+        except ValueError:
+            return None, _api_error("product_id must be an integer", status=400)
+    return sales, None
 
 
 def user_login(request):
@@ -133,130 +257,303 @@ def user_logout(request):
 @require_GET
 @api_key_required
 def api_products(request):
-    products = Produit.objects.all().order_by('id')
-    in_stock = (request.GET.get("in_stock") or "").strip().lower()
-    if in_stock in ("1", "true", "yes"):
-        products = products.filter(quantite__gt=0)
-
-    limit, offset, error = _parse_pagination(request)
+    names, error = _api_fields(request, PRODUCTS)
+    if error:
+        return error
+    products, error = _filter_products(request, Produit.objects.all())
     if error:
         return error
 
-    total = products.count()
-    page = products[offset:offset + limit]
-    data = [_serialize_product(product, request=request) for product in page]
-    return JsonResponse({
-        "count": total,
-        "limit": limit,
-        "offset": offset,
-        "results": data,
-    })
+    rows, body, error = _api_page(request, PRODUCTS.values(products, names, ['id']), ['id'])
+    if error:
+        return error
+    body["results"] = PRODUCTS.serialize(rows, names, request)
+    return json_response(body)
 
 
 @require_GET
 @api_key_required
 def api_orders(request):
-    orders = Order.objects.all().order_by('-date_commande').prefetch_related('orderitem_set__produit')
-    status = (request.GET.get("status") or "").strip()
-    if status:
-        orders = orders.filter(status=status)
+    names, error = _api_fields(request, ORDERS)
+    if error:
+        return error
+    orders, error = _filter_orders(request, Order.objects.all())
+    if error:
+        return error
 
-    date_from = (request.GET.get("date_from") or "").strip()
-    if date_from:
-        parsed = parse_date(date_from)
-        if not parsed:
-            return _api_error("date_from must be YYYY-MM-DD", status=400)
-        orders = orders.filter(date_commande__date__gte=parsed)
+    ordering = ['-date_commande', '-id']
+    rows, body, error = _api_page(request, ORDERS.values(orders, names, ['date_commande']), ordering)
+    if error:
+        return error
+    body["results"] = ORDERS.serialize(rows, names, request)
+    return json_response(body)
+
+
+def _changes_since(queryset, field, key, until, limit):
+    """Up to `limit` values() rows changed after `key` (a [timestamp, id]
+    pair) in (field, id) order, plus the key of the last row and a has-more flag."""
+    queryset = queryset.filter(**{f'{field}__lte': until})
+    if key[0] is not None:
+        timestamp, last_id = key
+        queryset = queryset.filter(Q(**{f'{field}__gt': timestamp}) | Q(**{field: timestamp, 'id__gt': last_id}))
+    rows = list(queryset.order_by(field, 'id')[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if rows:
+        key = [rows[-1][field], rows[-1]['id']]
+    return rows, key, has_more
+
+
+def _decode_watermark(token, streams):
+    """[timestamp, id] per stream from a watermark; raises ValueError.
+
+    A stream nothing was read from yet carries [None, None].
+    """
+    values = decode_cursor(token, 2 * streams)
+    keys = []
+    for raw_timestamp, raw_id in zip(values[::2], values[1::2]):
+        if raw_timestamp is None and raw_id is None:
+            keys.append([None, None])
+            continue
+        try:
+            timestamp = parse_datetime(raw_timestamp)
+            last_id = int(raw_id)
+        except (TypeError, ValueError) as exc:
+            raise ValueError("invalid watermark") from exc
+        if timestamp is None:
+            raise ValueError("invalid watermark")
+        if timezone.is_naive(timestamp):
+            timestamp = timezone.make_aware(timestamp)
+        keys.append([timestamp, last_id])
+    return keys
 
-    date_to = (request.GET.get("date_to") or "").strip()
-    if date_to:
-        parsed = parse_date(date_to)
-        if not parsed:
-            return _api_error("date_to must be YYYY-MM-DD", status=400)
-        orders = orders.filter(date_commande__date__lte=parsed)
 
-    limit, offset, error = _parse_pagination(request)
+@require_GET
+@api_key_required
+def api_changes(request):
+    """Products, orders and sales changed since a watermark, plus deletions.
+
+    Start with `updated_since=<ISO datetime>` (or nothing, for a full sync),
+    then keep passing back the returned `watermark` as `since`. While
+    `has_more` is true the client should poll `next` straight away.
+    """
+    streams = [
+        ('products', PRODUCTS, Produit.objects.all(), 'updated_at'),
+        ('orders', ORDERS, Order.objects.all(), 'updated_at'),
+        ('sales', SALES, Vente.objects.all(), 'updated_at'),
+        ('deleted', TOMBSTONES, Tombstone.objects.all(), 'deleted_at'),
+    ]
+
+    limit, _offset, error = _parse_pagination(request)
     if error:
         return error
 
-    total = orders.count()
-    page = orders[offset:offset + limit]
-    data = [_serialize_order(order) for order in page]
-    return JsonResponse({
-        "count": total,
-        "limit": limit,
-        "offset": offset,
-        "results": data,
+    since = (request.GET.get("since") or "").strip()
+    updated_since = (request.GET.get("updated_since") or "").strip()
+    if since:
+        try:
+            keys = _decode_watermark(since, len(streams))
+        except ValueError:
+            return _api_error("invalid since watermark", status=400)
+    elif updated_since:
+        parsed = parse_datetime(updated_since)
+        if not parsed:
+            return _api_error("updated_since must be an ISO 8601 datetime", status=400)
+        if timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed)
+        # id 0 also takes rows stamped exactly at updated_since
+        keys = [[parsed, 0] for _stream in streams]
+    else:
+        keys = [[None, None] for _stream in streams]
+
+    # Rows stamped within the settle window may belong to transactions that
+    # have not committed yet; see Siliana.changes for the bound this relies on
+    until = timezone.now() - changes.settle_window()
+    body = {}
+    has_more = False
+    new_keys = []
+    for (name, resource, queryset, field), key in zip(streams, keys):
+        names = tuple(resource.fields)
+        rows, key, more = _changes_since(resource.values(queryset, names, ['id', field]), field, key, until, limit)
+        body[name] = resource.serialize(rows, names, request)
+        new_keys.extend(key)
+        has_more = has_more or more
+
+    watermark = encode_cursor(new_keys)
+    body.update({
+        "watermark": watermark,
+        "has_more": has_more,
+        "next": _page_link(request, since=watermark),
     })
+    return json_response(body)
 
 
 @require_GET
 @api_key_required
 def api_order_detail(request, order_id):
-    try:
-        order = Order.objects.prefetch_related('orderitem_set__produit').get(id=order_id)
-    except Order.DoesNotExist:
+    names, error = _api_fields(request, ORDERS)
+    if error:
+        return error
+    rows = list(ORDERS.values(Order.objects.filter(id=order_id), names))
+    if not rows:
         return _api_error("Order not found", status=404)
 
-    return JsonResponse(_serialize_order(order))
+    return json_response(ORDERS.serialize(rows, names, request)[0])
+
+
+# group_by value -> expression each bucket is keyed on
+SALES_GROUPS = {
+    "day": F('date_vente'),
+    "week": TruncWeek('date_vente'),
+    "month": TruncMonth('date_vente'),
+    "product": F('produit_id'),
+}
+
+
+def _money(value):
+    # SQL SUM() over decimals may come back unscaled (e.g. 46 on SQLite)
+    return str((value or Decimal("0")).quantize(Decimal("0.01")))
+
+
+def _sales_groups(sales, group_by):
+    """Revenue, quantity and count per bucket, in one GROUP BY query."""
+    columns = ['bucket', 'produit__nom'] if group_by == 'product' else ['bucket']
+    buckets = (
+        sales.order_by().annotate(bucket=SALES_GROUPS[group_by])
+        .values(*columns)
+        .annotate(revenue=Sum('montant'), quantity=Sum('quantite'), count=Count('id'))
+    )
+    if group_by == 'product':
+        buckets = buckets.order_by('-revenue', 'bucket')
+        return [
+            {
+                "product_id": row['bucket'],
+                "product_name": row['produit__nom'],
+                "revenue": _money(row['revenue']),
+                "quantity": row['quantity'],
+                "count": row['count'],
+            }
+            for row in buckets
+        ]
+    return [
+        {
+            "period": row['bucket'].isoformat(),
+            "revenue": _money(row['revenue']),
+            "quantity": row['quantity'],
+            "count": row['count'],
+        }
+        for row in buckets.order_by('bucket')
+    ]
 
 
 @require_GET
 @api_key_required
 def api_sales(request):
     """API endpoint for sales (Vente)"""
-    sales = Vente.objects.all().order_by('-date_vente').select_related('produit')
-    
-    # Filter by date range
-    date_from = (request.GET.get("date_from") or "").strip()
-    if date_from:
-        parsed = parse_date(date_from)
-        if not parsed:
-            return _api_error("date_from must be YYYY-MM-DD", status=400)
-        sales = sales.filter(date_vente__gte=parsed)
+    names, error = _api_fields(request, SALES)
+    if error:
+        return error
+    sales, error = _filter_sales(request, Vente.objects.all())
+    if error:
+        return error
 
-    date_to = (request.GET.get("date_to") or "").strip()
-    if date_to:
-        parsed = parse_date(date_to)
-        if not parsed:
-            return _api_error("date_to must be YYYY-MM-DD", status=400)
-        sales = sales.filter(date_vente__lte=parsed)
+    group_by = (request.GET.get("group_by") or "").strip()
+    if group_by and group_by not in SALES_GROUPS:
+        return _api_error(f"group_by must be one of: {', '.join(SALES_GROUPS)}", status=400)
 
-    # Filter by product
-    product_id = (request.GET.get("product_id") or "").strip()
-    if product_id:
-        try:
-            sales = sales.filter(produit_id=int(product_id))
-        except ValueError:
-            return _api_error("product_id must be an integer", status=400)
+    ordering = ['-date_vente', '-id']
+    rows, body, error = _api_page(request, SALES.values(sales, names, ['date_vente', 'id']), ordering)
+    if error:
+        return error
+    body["results"] = SALES.serialize(rows, names, request)
+
+    # Totals cover the whole filtered set, not just this page
+    summary = sales.aggregate(revenue=Sum('montant'), quantity=Sum('quantite'), count=Count('id'))
+    body["total_revenue"] = _money(summary["revenue"])
+    body["total_quantity"] = summary["quantity"] or 0
+    body["transaction_count"] = summary["count"]
+    if group_by:
+        body["group_by"] = group_by
+        body["groups"] = _sales_groups(sales, group_by)
+    return json_response(body)
+
+
+NDJSON_CHUNK_SIZE = 2000
+# Lines are joined into blocks of about this many bytes before being sent
+NDJSON_BUFFER_BYTES = 64 * 1024
+
+
+def _ndjson_lines(objects):
+    buffer = []
+    size = 0
+    for obj in objects:
+        line = dumps(obj) + b"\n"
+        buffer.append(line)
+        size += len(line)
+        if size >= NDJSON_BUFFER_BYTES:
+            yield b"".join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield b"".join(buffer)
+
+
+def _gzip_stream(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31: gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
 
-    limit, offset, error = _parse_pagination(request)
+
+@require_GET
+@api_key_required
+def api_export(request, kind):
+    """Stream every matching product, order or sale as newline-delimited JSON.
+
+    Takes the same filters and `fields` as the paginated endpoints but no page size.
+    Rows are read with .iterator() (a server-side cursor on PostgreSQL) and
+    written out as they are serialized, so memory stays flat however large
+    the table is. Clients sending Accept-Encoding: gzip get a gzip body.
+    """
+    resources = {
+        "products": (PRODUCTS, Produit.objects.all(), _filter_products),
+        "orders": (ORDERS, Order.objects.all(), _filter_orders),
+        "sales": (SALES, Vente.objects.all(), _filter_sales),
+    }
+    if kind not in resources:
+        return _api_error("Unknown export", status=404)
+    resource, queryset, apply_filters = resources[kind]
+    names, error = _api_fields(request, resource)
+    if error:
+        return error
+    queryset, error = apply_filters(request, queryset)
     if error:
         return error
 
-    total = sales.count()
-    page = sales[offset:offset + limit]
-    data = [_serialize_sale(sale) for sale in page]
-    
-    # Calculate totals
-    total_revenue = sum(sale.total() for sale in page)
-    
-    return JsonResponse({
-        "count": total,
-        "limit": limit,
-        "offset": offset,
-        "total_revenue": str(total_revenue),
-        "results": data,
-    })
+    rows = resource.values(queryset, names).order_by('id').iterator(chunk_size=NDJSON_CHUNK_SIZE)
+    stream = _ndjson_lines(resource.stream(rows, names, request, batch_size=NDJSON_CHUNK_SIZE))
+    use_gzip = "gzip" in request.headers.get("Accept-Encoding", "")
+    response = StreamingHttpResponse(
+        _gzip_stream(stream) if use_gzip else stream,
+        content_type="application/x-ndjson; charset=utf-8",
+    )
+    if use_gzip:
+        response["Content-Encoding"] = "gzip"
+    response["Vary"] = "Accept-Encoding"
+    response["Content-Disposition"] = f'attachment; filename="{kind}_{date.today()}.ndjson"'
+    return response
 
 
 @login_required
 def home(request):
     total_products = Produit.objects.count()
-    sales_today = Vente.objects.filter(date_vente=date.today()).count()
-    
-    ventes_today = Vente.objects.filter(date_vente=date.today())
-    revenue_today = sum(vente.total() for vente in ventes_today)
+    today = Vente.objects.filter(date_vente=date.today()).aggregate(
+        sales=Count('id'),
+        revenue=Sum('montant'),
+    )
+    sales_today = today['sales']
+    revenue_today = today['revenue'] or 0
     
     low_stock_products = Produit.objects.filter(quantite__lte=5)
     low_stock = low_stock_products.count()
@@ -370,23 +667,68 @@ def new_sale(request):
     return render(request, 'new_sale.html', {'products': products})
 
 
+SALES_REPORT_PAGE_SIZE = 50
+SALES_REPORT_GROUPS = ('', 'day', 'product')
+
+
 @login_required
 def sales_report(request):
     date_debut = request.GET.get('date_debut')
     date_fin = request.GET.get('date_fin')
+    group = request.GET.get('group', '')
+    if group not in SALES_REPORT_GROUPS:
+        group = ''
+    
+    ventes = Vente.objects.all()
     
-    ventes = Vente.objects.all().order_by('-date_vente')
+    if date_debut and parse_date(date_debut):
+        ventes = ventes.filter(date_vente__gte=date_debut)
+    if date_fin and parse_date(date_fin):
+        ventes = ventes.filter(date_vente__lte=date_fin)
     
-    if date_debut and date_fin:
-        ventes = ventes.filter(date_vente__range=[date_debut, date_fin])
+    # Grand total over the whole range in one aggregate query
+    summary = ventes.aggregate(total=Sum('montant'), count=Count('id'), quantite=Sum('quantite'))
     
-    total = sum(vente.total() for vente in ventes)
+    page = None
+    product_totals = None
+    if group == 'product':
+        # One row per product; bounded by the catalog size, so no paging
+        product_totals = (
+            ventes.values('produit_id', 'produit__nom')
+            .annotate(quantite=Sum('quantite'), total=Sum('montant'), count=Count('id'))
+            .order_by('-total', 'produit_id')
+        )
+    else:
+        if group == 'day':
+            rows = ventes.values('date_vente').annotate(
+                quantite=Sum('quantite'), total=Sum('montant'), count=Count('id')
+            )
+            ordering = ['-date_vente']
+        else:
+            rows = ventes.select_related('produit')
+            ordering = ['-date_vente', '-id']
+        try:
+            page = keyset_paginate(
+                rows,
+                ordering,
+                SALES_REPORT_PAGE_SIZE,
+                after=request.GET.get('after'),
+                before=request.GET.get('before'),
+            )
+        except ValueError:
+            page = keyset_paginate(rows, ordering, SALES_REPORT_PAGE_SIZE)
     
     return render(request, 'sales_report.html', {
-        'ventes': ventes,
+        'ventes': page.items if page and not group else [],
+        'days': page.items if page and group == 'day' else [],
+        'product_totals': product_totals,
+        'page': page,
+        'group': group,
         'date_debut': date_debut,
         'date_fin': date_fin,
-        'total': total
+        'total': summary['total'] or 0,
+        'count': summary['count'],
+        'quantite': summary['quantite'] or 0,
     })
 
 
@@ -436,58 +778,85 @@ def public_order(request):
             messages.error(request, 'الرجاء ملء جميع الحقول المطلوبة')
             return render(request, 'public_order.html', context)
         
+        # Only the submitted product_<id> fields, not the whole catalog
+        requested = {}
+        for key, value in request.POST.items():
+            if not key.startswith('product_'):
+                continue
+            try:
+                produit_id = int(key[len('product_'):])
+                quantite = int(value)
+            except ValueError:
+                continue
+            if quantite > 0:
+                requested[produit_id] = quantite
+
+        if not requested:
+            messages.error(request, 'الرجاء اختيار منتج واحد على الأقل')
+            return render(request, 'public_order.html', context)
+
         # Create order with transaction
         try:
             with transaction.atomic():
+                # One locking read for every requested product, in id order
+                # so concurrent orders never deadlock on each other
+                ordered = {
+                    produit.id: produit
+                    for produit in Produit.objects.select_for_update()
+                    .filter(id__in=requested).order_by('id')
+                    .only('id', 'nom', 'quantite', 'prix_vente')
+                }
+                if not ordered:
+                    messages.error(request, 'الرجاء اختيار منتج واحد على الأقل')
+                    return render(request, 'public_order.html', context)
+
+                for produit in sorted(ordered.values(), key=lambda p: p.nom):
+                    if requested[produit.id] > produit.quantite:
+                        messages.error(request, f'الكمية المطلوبة من {produit.nom} غير متوفرة')
+                        return render(request, 'public_order.html', context)
+
+                order_items_list = [
+                    OrderItem(produit=produit, quantite=requested[produit.id], prix=produit.prix_vente)
+                    for produit in sorted(ordered.values(), key=lambda p: p.nom)
+                ]
                 order = Order.objects.create(
                     nom=nom,
                     email=email if email else None,
                     wilaya=wilaya,
                     ville=ville,
-                    telephone=telephone
+                    telephone=telephone,
+                    montant_total=sum((item.total() for item in order_items_list), Decimal('0')),
+                    nombre_articles=sum(item.quantite for item in order_items_list),
                 )
-                
-                has_items = False
-                order_items_list = []
-                for produit in produits:
-                    quantity_key = f'product_{produit.id}'
-                    quantite = request.POST.get(quantity_key, '0')
-                    
-                    try:
-                        quantite = int(quantite)
-                    except ValueError:
-                        quantite = 0
-                    
-                    if quantite > 0:
-                        if quantite <= produit.quantite:
-                            order_item = OrderItem.objects.create(
-                                order=order,
-                                produit=produit,
-                                quantite=quantite,
-                                prix=produit.prix_vente
-                            )
-                            order_items_list.append(order_item)
-                            has_items = True
-                        else:
-                            messages.error(request, f'الكمية المطلوبة من {produit.nom} غير متوفرة')
-                            return render(request, 'public_order.html', context)
-                
-                if not has_items:
-                    order.delete()
-                    messages.error(request, 'الرجاء اختيار منتج واحد على الأقل')
+                for item in order_items_list:
+                    item.order = order
+                # bulk_create skips OrderItem.save(); stock, totals and rollups are
+                # handled here for the whole order at once
+                OrderItem.objects.bulk_create(order_items_list)
+                try:
+                    decrement_stock_many({pid: requested[pid] for pid in ordered})
+                except InsufficientStock as exc:
+                    produit = ordered.get(exc.produit_id)
+                    if produit is None:
+                        raise
+                    transaction.set_rollback(True)
+                    messages.error(request, f'الكمية المطلوبة من {produit.nom} غير متوفرة')
                     return render(request, 'public_order.html', context)
-                
-                # Send confirmation email if email was provided
+                record_order_lines(
+                    order_day(order),
+                    [(item.produit_id, item.quantite, item.prix) for item in order_items_list],
+                )
+
+                # Queue the confirmation email with the order; send_outbox delivers it
                 if email:
-                    try:
-                        # Build order details for email
-                        items_text = "\n".join([
-                            f"• {item.produit.nom} - الكمية: {item.quantite} - السعر: {item.total()} د.ت"
-                            for item in order_items_list
-                        ])
-                        
-                        subject = f'تأكيد طلبك رقم #{order.id} - مزرعة نوادر التين'
-                        message = f'''
+                    # Build order details for email
+                    items_text = "\n".join([
+                        f"• {item.produit.nom} - الكمية: {item.quantite} - السعر: {item.total()} د.ت"
+                        for item in order_items_list
+                    ])
+                    
+                    subject = f'تأكيد طلبك رقم #{order.id} - مزرعة نوادر التين'
+                    message = f'''
 مرحباً {nom}،
 
 شكراً لك على طلبك من مزرعة نوادر التين! 🌿
@@ -519,18 +888,9 @@ def public_order(request):
 
 شكراً لثقتك بنا! 🙏
 مزرعة نوادر التين
-                        '''
-                        
-                        send_mail(
-                            subject=subject,
-                            message=message,
-                            from_email=settings.DEFAULT_FROM_EMAIL,
-                            recipient_list=[email],
-                            fail_silently=True,
-                        )
-                    except Exception as email_error:
-                        # Log error but don't fail the order
-                        print(f"Email sending failed: {email_error}")
+                    '''
+                    
+                    queue_mail(subject, message, [email])
                 
                 messages.success(request, ' تم إرسال طلبك بنجاح! سنتصل بك قريبا' + (' وتم إرسال نسخة إلى بريدك الإلكتروني.' if email else ''))
                 request.session['last_order_id'] = order.id
@@ -563,13 +923,18 @@ def public_order_success(request):
     )
 
 
+ORDERS_PAGE_SIZE = 50
+
+
 @login_required
 def orders_list(request):
     """Orders list page for logged users only"""
     status_filter = request.GET.get('status', '')
     wilaya_filter = request.GET.get('wilaya', '')
     
-    orders = Order.objects.all().order_by('-date_commande')
+    orders = Order.objects.prefetch_related(
+        Prefetch('orderitem_set', queryset=OrderItem.objects.select_related('produit').order_by('id'))
+    )
     
     if status_filter:
         orders = orders.filter(status=status_filter)
@@ -577,11 +942,21 @@ def orders_list(request):
     if wilaya_filter:
         orders = orders.filter(wilaya=wilaya_filter)
     
+    ordering = ['-date_commande', '-id']
+    try:
+        page = keyset_paginate(
+            orders, ordering, ORDERS_PAGE_SIZE,
+            after=request.GET.get('after'), before=request.GET.get('before'),
+        )
+    except ValueError:
+        page = keyset_paginate(orders, ordering, ORDERS_PAGE_SIZE)
+    
     # Get distinct wilayas from orders
     wilayas = Order.objects.values_list('wilaya', flat=True).distinct().order_by('wilaya')
     
     return render(request, 'orders_list.html', {
-        'orders': orders,
+        'orders': page.items,
+        'page': page,
         'wilayas': wilayas
     })
 
@@ -595,7 +970,12 @@ def update_order_status(request, order_id):
         
         if new_status in ['pending', 'confirmed', 'cancelled', 'completed']:
             order.status = new_status
-            order.save()
+            try:
+                order.save()
+            except InsufficientStock as exc:
+                # Un-cancelling takes the stock out again, which may fall short
+                messages.error(request, str(exc))
+                return redirect('orders_list')
             
             status_names = {
                 'pending': 'قيد الانتظار',
@@ -610,6 +990,33 @@ def update_order_status(request, order_id):
     return redirect('orders_list')
 
 
+@require_POST
+@login_required
+def bulk_update_order_status(request):
+    """Move the selected orders to one status in a single transaction"""
+    new_status = request.POST.get('status')
+    try:
+        order_ids = [int(order_id) for order_id in request.POST.getlist('order_ids')]
+    except ValueError:
+        order_ids = None
+
+    if order_ids is None:
+        messages.error(request, 'طلبات غير صحيحة')
+    elif not order_ids:
+        messages.error(request, 'الرجاء اختيار طلب واحد على الأقل')
+    elif new_status not in dict(Order.STATUS_CHOICES):
+        messages.error(request, 'حالة غير صحيحة')
+    else:
+        try:
+            summary = Order.bulk_set_status(Order.objects.filter(id__in=order_ids), new_status)
+        except InsufficientStock as exc:
+            messages.error(request, str(exc))
+        else:
+            messages.success(request, Order.bulk_status_message(summary, new_status))
+
+    return redirect('orders_list')
+
+
 def product_detail(request, product_id):
     """Public product detail page showing product information and description"""
     produit = get_object_or_404(Produit, id=product_id)
@@ -628,9 +1035,106 @@ def cart(request):
     """Public cart page (client-side localStorage)"""
     return render(request, 'cart.html')
 
+ORDER_STATUS_LABELS = dict(Order.STATUS_CHOICES)
+EXPORT_HEADERS = ['#', 'الاسم', 'رقم الهاتف', 'الولاية', 'المدينة', 'الحالة', 'المنتجات', 'المجموع']
+EXPORT_COLUMN_WIDTHS = [10, 25, 15, 20, 20, 15, 40, 15]
+
+
+def _export_rows(orders, items_separator):
+    """Yield one row of cell values per order, streaming from the database."""
+    orders = orders.prefetch_related(
+        Prefetch('orderitem_set', queryset=OrderItem.objects.select_related('produit').order_by('id'))
+    )
+    for order in orders.iterator(chunk_size=2000):
+        items_text = items_separator.join(
+            f"{item.produit.nom} × {item.quantite}" for item in order.orderitem_set.all()
+        )
+        yield [
+            order.id,
+            order.nom,
+            order.telephone,
+            order.wilaya,
+            order.ville,
+            ORDER_STATUS_LABELS.get(order.status, order.status),
+            items_text,
+            f"{order.montant_total} د.ت",
+        ]
+
+
+class _Echo:
+    """File-like object whose write() returns the value, for streaming csv."""
+
+    def write(self, value):
+        return value
+
+
+def _export_orders_csv(orders):
+    writer = csv.writer(_Echo())
+    rows = itertools.chain([EXPORT_HEADERS], _export_rows(orders, items_separator=' | '))
+    response = StreamingHttpResponse(
+        (writer.writerow(row) for row in rows),
+        content_type='text/csv; charset=utf-8',
+    )
+    response['Content-Disposition'] = f'attachment; filename="orders_export_{date.today()}.csv"'
+    return response
+
+
+def _export_orders_xlsx(orders):
+    # Write-only mode spools rows to disk instead of keeping every cell in memory
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("قائمة الطلبات")
+    
+    # Define styles
+    header_fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
+    header_font = Font(bold=True, color="FFFFFF", size=12)
+    header_alignment = Alignment(horizontal='center', vertical='center')
+    items_alignment = Alignment(wrap_text=True, vertical='top')
+    border = Border(
+        left=Side(style='thin'),
+        right=Side(style='thin'),
+        top=Side(style='thin'),
+        bottom=Side(style='thin')
+    )
+    
+    # Set column widths
+    for index, width in enumerate(EXPORT_COLUMN_WIDTHS, 1):
+        ws.column_dimensions[get_column_letter(index)].width = width
+    
+    def styled(value, **styles):
+        cell = WriteOnlyCell(ws, value=value)
+        cell.border = border
+        for name, style in styles.items():
+            setattr(cell, name, style)
+        return cell
+    
+    # Headers
+    ws.append([
+        styled(header, fill=header_fill, font=header_font, alignment=header_alignment)
+        for header in EXPORT_HEADERS
+    ])
+    
+    # Data rows
+    for row in _export_rows(orders, items_separator="\n"):
+        cells = [styled(value) for value in row]
+        cells[6].alignment = items_alignment
+        ws.append(cells)
+    
+    # The xlsx zip can only be finalised once complete, so build it in a
+    # temporary file and stream that back rather than holding it in memory
+    output = tempfile.TemporaryFile()
+    wb.save(output)
+    output.seek(0)
+    return FileResponse(
+        output,
+        as_attachment=True,
+        filename=f"orders_export_{date.today()}.xlsx",
+        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    )
+
+
 @login_required
 def export_orders(request):
-    """Export selected orders to Excel for transporter"""
+    """Export selected orders to Excel (or CSV) for transporter"""
     if request.method == 'POST':
         order_ids = request.POST.getlist('order_ids')
         
@@ -639,101 +1143,132 @@ def export_orders(request):
             return redirect('orders_list')
         
         # Get selected orders
-        orders = Order.objects.filter(id__in=order_ids).order_by('wilaya', 'ville')
-        
-        # Create workbook
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "قائمة الطلبات"
-        
-        # Define styles
-        header_fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
-        header_font = Font(bold=True, color="FFFFFF", size=12)
-        border = Border(
-            left=Side(style='thin'),
-            right=Side(style='thin'),
-            top=Side(style='thin'),
-            bottom=Side(style='thin')
-        )
-        
-        # Set column widths
-        ws.column_dimensions['A'].width = 10
-        ws.column_dimensions['B'].width = 25
-        ws.column_dimensions['C'].width = 15
-        ws.column_dimensions['D'].width = 20
-        ws.column_dimensions['E'].width = 20
-        ws.column_dimensions['F'].width = 15
-        ws.column_dimensions['G'].width = 40
-        ws.column_dimensions['H'].width = 15
-        
-        # Headers
-        headers = ['#', 'الاسم', 'رقم الهاتف', 'الولاية', 'المدينة', 'الحالة', 'المنتجات', 'المجموع']
-        for col, header in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col, value=header)
-            cell.fill = header_fill
-            cell.font = header_font
-            cell.alignment = Alignment(horizontal='center', vertical='center')
-            cell.border = border
+        orders = Order.objects.filter(id__in=order_ids).order_by('wilaya', 'ville', 'id')
         
-        # Data rows
-        row = 2
-        for order in orders:
-            # Get order items as text
-            items_text = "\n".join([
-                f"{item.produit.nom} × {item.quantite}" 
-                for item in order.orderitem_set.all()
-            ])
-            
-            # Status translation
-            status_dict = {
-                'pending': 'قيد الانتظار',
-                'confirmed': 'مؤكد',
-                'cancelled': 'ملغي',
-                'completed': 'مكتمل'
-            }
-            
-            ws.cell(row=row, column=1, value=order.id).border = border
-            ws.cell(row=row, column=2, value=order.nom).border = border
-            ws.cell(row=row, column=3, value=order.telephone).border = border
-            ws.cell(row=row, column=4, value=order.wilaya).border = border
-            ws.cell(row=row, column=5, value=order.ville).border = border
-            ws.cell(row=row, column=6, value=status_dict.get(order.status, order.status)).border = border
-            
-            items_cell = ws.cell(row=row, column=7, value=items_text)
-            items_cell.border = border
-            items_cell.alignment = Alignment(wrap_text=True, vertical='top')
-            
-            ws.cell(row=row, column=8, value=f"{order.total()} د.ت").border = border
-            
-            row += 1
-        
-        # Create response
-        response = HttpResponse(
-            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        )
-        response['Content-Disposition'] = f'attachment; filename="orders_export_{date.today()}.xlsx"'
-        wb.save(response)
-        
-        return response
+        if request.POST.get('format') == 'csv':
+            return _export_orders_csv(orders)
+        return _export_orders_xlsx(orders)
     
     return redirect('orders_list')
 
 
-@require_GET
-def serve_product_image(request, product_id):
-    """Serve product image from PostgreSQL database"""
-    try:
-        produit = Produit.objects.get(id=product_id)
-        
-        if not produit.image_data:
-            # Return a 404 or default image
-            return HttpResponse(status=404)
-        
-        # Return image from database
-        response = HttpResponse(produit.image_data, content_type=produit.image_type or 'image/jpeg')
-        response['Content-Disposition'] = f'inline; filename="{produit.image_name or "product.jpg"}"'
-        response['Cache-Control'] = 'public, max-age=31536000'  # Cache for 1 year
-        return response
-        
-    except Produit.DoesNotExist:
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+def _product_image_meta(product_id):
+    """Scalar image metadata for a product; never loads the image bytes."""
+    return (
+        Produit.objects.filter(id=product_id)
+        .values('image_type', 'image_name', 'image_hash', 'image_updated_at')
+        .first()
+    )
+
+
+def _image_response(request, meta, etag, content_type, load_data, cache_control, key, on_missing=None):
+    """Build an image response, answering 304 and HEAD from `meta` alone.
+
+    Bytes come from the shared disk cache when possible (streamed with
+    FileResponse so the server can use sendfile); `load_data` is only called
+    on a cache miss, and `on_missing` builds the response when it returns
+    nothing (default 404).
+    """
+    last_modified = meta['image_updated_at']
+    last_modified = int(last_modified.timestamp()) if last_modified else None
+
+    etag = quote_etag(etag)
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        if request.method == 'HEAD':
+            response = HttpResponse(content_type=content_type)
+        else:
+            filename = meta['image_name'] or 'product.jpg'
+            image_cache = get_image_cache()
+            cached = image_cache.open(key) if image_cache else None
+            if cached is not None:
+                response = FileResponse(cached, content_type=content_type, filename=filename)
+                response['X-Image-Cache'] = 'HIT'
+            else:
+                data = load_data()
+                if not data:
+                    return on_missing() if on_missing else HttpResponse(status=404)
+                data = bytes(data)
+                if image_cache:
+                    image_cache.put(key, data)
+                response = HttpResponse(data, content_type=content_type)
+                response['Content-Disposition'] = f'inline; filename="{filename}"'
+                response['X-Image-Cache'] = 'MISS'
+
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = cache_control
+    return response
+
+
+@require_safe
+def serve_product_image(request, product_id, image_hash=None):
+    """Serve product image from PostgreSQL database.
+
+    The hashed URL is immutable; the bare URL is kept for old links and is
+    revalidated with ETag/Last-Modified on every use.
+    """
+    meta = _product_image_meta(product_id)
+    if meta is None or not meta['image_hash']:
+        return HttpResponse(status=404)
+
+    if image_hash is not None and image_hash != meta['image_hash']:
+        # Image was replaced since the URL was rendered
+        return redirect('serve_product_image', product_id=product_id, image_hash=meta['image_hash'])
+
+    def load_data():
+        return ProduitImage.objects.filter(produit_id=product_id).values_list('data', flat=True).first()
+
+    return _image_response(
+        request,
+        meta,
+        etag=meta['image_hash'],
+        content_type=meta['image_type'] or 'image/jpeg',
+        load_data=load_data,
+        cache_control=IMMUTABLE_CACHE_CONTROL if image_hash else 'public, no-cache',
+        key=cache_key(product_id, meta['image_hash']),
+    )
+
+
+@require_safe
+def serve_product_image_variant(request, product_id, image_hash, width, fmt):
+    """Serve a resized derivative of a product image"""
+    if fmt not in VARIANT_FORMATS or width not in VARIANT_WIDTHS:
+        return HttpResponse(status=404)
+
+    meta = _product_image_meta(product_id)
+    if meta is None or not meta['image_hash']:
         return HttpResponse(status=404)
+
+    if image_hash != meta['image_hash']:
+        return redirect(
+            'serve_product_image_variant',
+            product_id=product_id, image_hash=meta['image_hash'], width=width, fmt=fmt,
+        )
+
+    def load_data():
+        return (
+            ProduitImageVariant.objects.filter(produit_id=product_id, width=width, format=fmt)
+            .values_list('data', flat=True)
+            .first()
+        )
+
+    def use_original():
+        # Derivatives not generated yet (run generate_image_variants)
+        return redirect('serve_product_image', product_id=product_id, image_hash=image_hash)
+
+    meta = dict(meta, image_name=f"{product_id}-{width}.{fmt}")
+    return _image_response(
+        request,
+        meta,
+        etag=f"{image_hash}-{width}{fmt}",
+        content_type=variant_content_type(fmt),
+        load_data=load_data,
+        cache_control=IMMUTABLE_CACHE_CONTROL,
+        key=cache_key(product_id, image_hash, f'{width}.{fmt}'),
+        on_missing=use_original,
+    )
@@ -1,193 +1,22 @@
-﻿-- External System Database Views Setup
--- Creates secure views and read-only user for external reporting system
+﻿-- External System Database Setup
+-- Creates the read-only user for the external reporting system
 -- Compatible with Django + Railway + PostgreSQL
 
 -- =========================================
--- STEP 1: DISCOVER DJANGO TABLE NAMES
+-- STEP 1: CREATE THE REPORTING VIEWS
 -- =========================================
 
--- Run this query first to see actual table names:
--- SELECT table_name
--- FROM information_schema.tables
--- WHERE table_schema='public'
---   AND table_name LIKE 'siliana_%'
--- ORDER BY table_name;
-
--- Expected Django table names (verify with above query):
--- siliana_produit
--- siliana_achat
--- siliana_vente
--- siliana_order
--- siliana_orderitem
-
--- =========================================
--- STEP 2: CREATE SECURE VIEWS FOR EXTERNAL SYSTEM
--- =========================================
-
--- Sales View (Ventes)
-CREATE OR REPLACE VIEW v_sales AS
-SELECT
-    id,
-    produit_id,
-    quantite,
-    date_vente,
-    quantite * (SELECT prix_vente FROM "Siliana_produit" WHERE id = "Siliana_vente".produit_id) as total_amount
-FROM "Siliana_vente"
-ORDER BY date_vente DESC;
-
--- Stock/Products View
-CREATE OR REPLACE VIEW v_stock AS
-SELECT
-    id,
-    nom as product_name,
-    nom as name,
-    quantite as current_stock,
-    prix_achat as purchase_price,
-    prix_vente as selling_price,
-    description,
-    CASE WHEN quantite > 0 THEN 'available' ELSE 'out_of_stock' END as status,
-    (prix_vente - prix_achat) as profit_margin
-FROM "Siliana_produit"
-ORDER BY nom;
--- Product Catalog View (stable for integrations)
--- Exposes both `product_name` and `name` for compatibility
-CREATE OR REPLACE VIEW vw_product_catalog AS
-SELECT
-    p.id AS product_id,
-    p.nom AS product_name,
-    p.nom AS name,
-    COALESCE(p.description, '') AS description,
-    COALESCE(p.quantite, 0) AS stock_quantity,
-    CAST(COALESCE(p.prix_vente, 0) AS NUMERIC(15,2)) AS selling_price,
-    CAST(COALESCE(p.prix_achat, 0) AS NUMERIC(15,2)) AS purchase_price,
-    p.image AS image_path,
-    CASE WHEN COALESCE(p.quantite, 0) > 0 THEN 'available' ELSE 'out_of_stock' END AS status
-FROM "Siliana_produit" p
-ORDER BY p.nom;
-
--- Finance Summary View (combines sales and purchases)
-CREATE OR REPLACE VIEW v_finance AS
-SELECT
-    'sale' as transaction_type,
-    date_vente as transaction_date,
-    quantite * (SELECT prix_vente FROM "Siliana_produit" WHERE id = "Siliana_vente".produit_id) as amount,
-    quantite * (SELECT prix_vente - prix_achat FROM "Siliana_produit" WHERE id = "Siliana_vente".produit_id) as profit
-FROM "Siliana_vente"
-UNION ALL
-SELECT
-    'purchase' as transaction_type,
-    date_achat as transaction_date,
-    quantite * (SELECT prix_achat FROM "Siliana_produit" WHERE id = "Siliana_achat".produit_id) as amount,
-    0 as profit
-FROM "Siliana_achat"
-ORDER BY transaction_date DESC;
-
--- Orders View
-CREATE OR REPLACE VIEW v_orders AS
-SELECT
-    id,
-    nom as customer_name,
-    telephone as phone,
-    wilaya as state,
-    ville as city,
-    email,
-    status,
-    date_commande as order_date,
-    notes
-FROM "Siliana_order"
-ORDER BY date_commande DESC;
-
--- Order Items View
-CREATE OR REPLACE VIEW v_order_items AS
-SELECT
-    oi.id,
-    oi.order_id,
-    oi.produit_id,
-    p.nom as product_name,
-    oi.quantite as quantity,
-    oi.prix as unit_price,
-    (oi.quantite * oi.prix) as total_amount
-FROM "Siliana_orderitem" oi
-JOIN "Siliana_produit" p ON oi.produit_id = p.id
-ORDER BY oi.order_id, oi.id;
-
--- Dashboard View (Today)
-CREATE OR REPLACE VIEW v_dashboard_today AS
-SELECT
-  (SELECT COUNT(*) FROM "Siliana_produit") AS total_products,
-  (SELECT COUNT(*) FROM "Siliana_vente" WHERE date_vente = CURRENT_DATE) AS sales_today,
-  (
-    SELECT COALESCE(SUM(v.quantite * p.prix_vente), 0)
-    FROM "Siliana_vente" v
-    JOIN "Siliana_produit" p ON p.id = v.produit_id
-    WHERE v.date_vente = CURRENT_DATE
-  ) AS revenue_today,
-  (SELECT COUNT(*) FROM "Siliana_produit" WHERE quantite <= 5) AS low_stock_count;
-
--- Sales Summary View - Always returns at least one row with guaranteed non-NULL values
-CREATE OR REPLACE VIEW vw_sales_summary AS
-SELECT
-  CAST(COALESCE(SUM(v.quantite), 0) AS INTEGER) AS total_items_sold,
-  CAST(COALESCE(SUM(v.quantite * p.prix_vente), 0) AS NUMERIC(15,2)) AS total_sales_amount,
-  CAST(COALESCE(COUNT(*), 0) AS INTEGER) AS total_transactions,
-  CAST(COALESCE(AVG(v.quantite * p.prix_vente), 0) AS NUMERIC(15,2)) AS average_transaction_value
-FROM "Siliana_vente" v
-LEFT JOIN "Siliana_produit" p ON p.id = v.produit_id
-UNION ALL
-SELECT 0, 0.00, 0, 0.00
-WHERE NOT EXISTS (SELECT 1 FROM "Siliana_vente");
-
--- Stock Summary View - Always returns at least one row with guaranteed non-NULL values
-CREATE OR REPLACE VIEW vw_stock_summary AS
-SELECT
-  CAST(COALESCE(COUNT(*), 0) AS INTEGER) AS total_products,
-  CAST(COALESCE(SUM(quantite), 0) AS INTEGER) AS total_quantity_in_stock,
-  CAST(COALESCE(SUM(CASE WHEN quantite = 0 THEN 1 ELSE 0 END), 0) AS INTEGER) AS out_of_stock_products,
-  CAST(COALESCE(SUM(CASE WHEN quantite <= 5 AND quantite > 0 THEN 1 ELSE 0 END), 0) AS INTEGER) AS low_stock_products,
-  CAST(COALESCE(AVG(prix_vente), 0) AS NUMERIC(15,2)) AS average_selling_price
-FROM "Siliana_produit"
-UNION ALL
-SELECT 0, 0, 0, 0, 0.00
-WHERE NOT EXISTS (SELECT 1 FROM "Siliana_produit");
-
--- Finance Summary View - Always returns at least one row with guaranteed non-NULL values
-CREATE OR REPLACE VIEW vw_finance_summary AS
-SELECT
-  CAST(COALESCE(SUM(CASE WHEN t.transaction_type = 'sale' THEN t.amount ELSE 0 END), 0) AS NUMERIC(15,2)) AS revenue,
-  CAST(COALESCE(SUM(CASE WHEN t.transaction_type = 'purchase' THEN t.amount ELSE 0 END), 0) AS NUMERIC(15,2)) AS expenses,
-  CAST(COALESCE(SUM(CASE WHEN t.transaction_type = 'sale' THEN t.profit ELSE 0 END), 0) AS NUMERIC(15,2)) AS gross_profit,
-  CAST(CASE 
-    WHEN COALESCE(SUM(CASE WHEN t.transaction_type = 'purchase' THEN t.amount ELSE 0 END), 0) > 0 
-    THEN CAST(COALESCE(SUM(CASE WHEN t.transaction_type = 'sale' THEN t.amount ELSE 0 END), 0) AS NUMERIC(15,2)) / CAST(SUM(CASE WHEN t.transaction_type = 'purchase' THEN t.amount ELSE 0 END) AS NUMERIC(15,2)) * 100
-    ELSE 0 
-  END AS NUMERIC(5,2)) AS profit_margin_percentage
-FROM (
-  SELECT 
-    'sale' as transaction_type,
-    COALESCE(v.quantite * p.prix_vente, 0) as amount,
-    COALESCE(v.quantite * (p.prix_vente - p.prix_achat), 0) as profit
-  FROM "Siliana_vente" v
-  LEFT JOIN "Siliana_produit" p ON p.id = v.produit_id
-  
-  UNION ALL
-  
-  SELECT 
-    'purchase' as transaction_type,
-    COALESCE(a.quantite * p.prix_achat, 0) as amount,
-    0 as profit
-  FROM "Siliana_achat" a
-  LEFT JOIN "Siliana_produit" p ON p.id = a.produit_id
-) t
-UNION ALL
-SELECT 0.00, 0.00, 0.00, 0.00
-WHERE NOT EXISTS (
-  SELECT 1 FROM "Siliana_vente" 
-  UNION ALL 
-  SELECT 1 FROM "Siliana_achat"
-);
+-- The views are managed by Django migrations (Siliana/migrations/0016_reporting_views.py);
+-- run this instead of creating them by hand:
+--   python manage.py migrate
+-- Materialized variants (mv_finance, mv_sales_summary, mv_stock_summary,
+-- mv_finance_summary) are refreshed with:
+--   python manage.py refresh_reporting_views
+-- The migration grants SELECT to external_client when the role exists, so
+-- run it again (or the GRANTs below) after creating the user.
 
 -- =========================================
--- STEP 3: CREATE READ-ONLY USER WITH LIMITED ACCESS
+-- STEP 2: CREATE READ-ONLY USER WITH LIMITED ACCESS
 -- =========================================
 
 -- Create the user
@@ -204,27 +33,19 @@ REVOKE USAGE ON SCHEMA public FROM external_client;
 -- Grant USAGE back only for the views we created
 GRANT USAGE ON SCHEMA public TO external_client;
 
--- Grant SELECT ONLY on our custom views
-GRANT SELECT ON v_sales TO external_client;
-GRANT SELECT ON v_stock TO external_client;
-GRANT SELECT ON vw_product_catalog TO external_client;
-GRANT SELECT ON v_finance TO external_client;
-GRANT SELECT ON v_orders TO external_client;
-GRANT SELECT ON v_order_items TO external_client;
-GRANT SELECT ON v_dashboard_today TO external_client;
-GRANT SELECT ON v_sales_summary TO external_client;
-GRANT SELECT ON v_stock_summary TO external_client;
-GRANT SELECT ON v_finance_summary TO external_client;
-GRANT SELECT ON vw_sales_summary TO external_client;
-GRANT SELECT ON vw_stock_summary TO external_client;
-GRANT SELECT ON vw_finance_summary TO external_client;
+-- Grant SELECT ONLY on the reporting views
+GRANT SELECT ON v_sales, v_stock, vw_product_catalog, v_finance, v_orders, v_order_items,
+    v_dashboard_today, vw_sales_summary, vw_stock_summary, vw_finance_summary,
+    ventes, stock, catalogue_produits, transactions_financieres,
+    mv_finance, mv_sales_summary, mv_stock_summary, mv_finance_summary
+    TO external_client;
 
 -- DO NOT grant access to any Django tables
 -- DO NOT grant access to auth tables
 -- This user can ONLY see the views above
 
 -- =========================================
--- STEP 4: VERIFICATION QUERIES
+-- STEP 3: VERIFICATION QUERIES
 -- =========================================
 
 -- Check user was created:
@@ -243,7 +64,7 @@ GRANT SELECT ON vw_finance_summary TO external_client;
 -- SELECT COUNT(*) FROM siliana_produit; -- Should be permission denied
 
 -- =========================================
--- STEP 5: EXTERNAL SYSTEM CONNECTION STRING
+-- STEP 4: EXTERNAL SYSTEM CONNECTION STRING
 -- =========================================
 
 -- Railway Public Connection Details:
@@ -261,7 +82,7 @@ GRANT SELECT ON vw_finance_summary TO external_client;
 -- =========================================
 
 -- To drop everything (CAUTION - only if needed):
--- DROP VIEW IF EXISTS v_sales, v_stock, v_finance, v_orders, v_order_items, v_dashboard_today, v_sales_summary, v_stock_summary, v_finance_summary, vw_sales_summary, vw_stock_summary, vw_finance_summary;
+-- Views: python manage.py migrate Siliana 0015
 -- DROP USER IF EXISTS external_client;
 
 -- =========================================